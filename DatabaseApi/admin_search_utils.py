@@ -1,32 +1,136 @@
 import re
+from datetime import date
 
 from apiutils import mask_user_id
 import logger_utils as log_fun
 
-from mask_constants import READY
+from mask_constants import READY, SEARCH_MAX_ROWS, SEARCH_MAX_LIMIT
 
-from slitmask_queries import get_query
+from slitmask_queries import get_query, admin_search_predicates
+
+
+class SearchError(ValueError):
+    """
+    A search option which can not be compiled,  the message is for the user.
+    """
+
+
+def like_pattern(value):
+    """
+    The ILIKE pattern matching the value anywhere,  the wildcards in the
+    value are matched literally.
+
+    :param value: <str> the search value.
+
+    :return: <str> the pattern.
+    """
+    escaped = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    return f'%{escaped}%'
+
+
+def is_empty(value):
+    return value is None or value == "" or value == [] or value == [""]
+
+
+def to_date(value):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        raise SearchError(f'{value} is not a date (YYYY-MM-DD).')
+
+
+def id_comparison(key, values, cast):
+    """
+    The comparison of a column to the search values:
+
+        value or [value]          = %s
+        [first, last]             BETWEEN %s AND %s
+        [v1, v2, v3...]           = ANY(%s)
+        {"in": [v1, v2...]}       = ANY(%s)
+        {"min": v1, "max": v2}    BETWEEN %s AND %s,  or >= / <= with one
+
+    :param key: <str> the search option,  for the error messages.
+    :param values: <obj> the option value.
+    :param cast: <function> the type of the values,  ie: int.
+
+    :return: <str, list> the comparison SQL and its arguments.
+    """
+    if isinstance(values, dict):
+        low, high = values.get('min'), values.get('max')
+        if 'in' in values:
+            cmp, values = '= ANY(%s)', values['in']
+        elif not is_empty(low) and not is_empty(high):
+            cmp, values = 'BETWEEN %s AND %s', [low, high]
+        elif not is_empty(low):
+            cmp, values = '>= %s', [low]
+        elif not is_empty(high):
+            cmp, values = '<= %s', [high]
+        else:
+            raise SearchError(f'{key} needs "in",  "min" or "max".')
+    else:
+        if not isinstance(values, list):
+            values = [values]
+
+        if len(values) == 1:
+            cmp = '= %s'
+        elif len(values) == 2:
+            cmp = 'BETWEEN %s AND %s'
+        else:
+            cmp = '= ANY(%s)'
+
+    try:
+        values = [cast(val) for val in values]
+    except (TypeError, ValueError):
+        raise SearchError(f'Invalid {key} value: {values}')
+
+    if cmp == '= ANY(%s)':
+        return cmp, [values]
+
+    if cmp.startswith('BETWEEN'):
+        values = sorted(values)
+
+    return cmp, values
+
+
+def range_predicate(key, values, cast):
+    """
+    :return: <str, list> the predicate of the option and its arguments.
+    """
+    template = admin_search_predicates[key]
+    cmp, cmp_args = id_comparison(key, values, cast)
+
+    # the millseq predicate compares in two places
+    return template.format(cmp=cmp), cmp_args * template.count('{cmp}')
 
 
 def admin_search(options, db, obs_info):
     """
-    A list of known keys which may be found in dict.
+    Compile the admin search options into one parameterized query,  all the
+    options given are combined (AND).
 
-    The original cgiTcl web page code displayed these options to the user in order.
-    The original cgiTcl web page code looked at this list in order.
-    Only the first match was used to construct the SQL query.
+    known keys which may be found in options:
 
-    firstcomelist = [
-        'email', value may match e-mail of MaskDesign.DesPId or MaskBlu.BluPid
+        'email',    value may match e-mail of MaskDesign.DesPId or MaskBlu.BluPid
         'guiname',  value may be like MaskBlu.GUIname
-        'name',  value may be like MaskBlu.BluName or MaskDesign.DesName
-        'bluid',  value(s) may match MaskBlu.BluId (range)
-        'desid',  value(s) may match MaskDesign.DesId (range)
-        'millseq',  value(s) may match MaskBlu.MillSeq (range)
+        'name',     value may be like MaskBlu.BluName or MaskDesign.DesName
+        'fuzzy',    true to match guiname and name by a similar word
+                    (pg_trgm) instead of the substring
+        'bluid',    value(s) may match MaskBlu.BluId (range)
+        'desid',    value(s) may match MaskDesign.DesId (range)
+        'millseq',  value(s) may match MaskBlu.MillSeq or Mask.MillSeq (range)
         'barcode',  value(s) may match Mask.MaskId (range) the barcode(s) on mask(s)
-        'milled',  value may be one of (all, no, yes) default is all
-        'caldays'  calendar days until MaskBlu.Date_Use
-    ]
+        'milled',   value may be one of (all, no, yes) default is all
+        'caldays',  calendar days until MaskBlu.Date_Use
+        'inst',     DEIMOS, LRIS,  anything else is both
+        'desdate', 'submitted', 'date_use', 'milldate'
+                    dates (YYYY-MM-DD) of MaskDesign.DesDate,  MaskDesign.stamp,
+                    MaskBlu.Date_Use or Mask.MillDate (range)
+        'limit', 'offset'
+                    the page of the results,  newest submitted first
+
+    The ranges are given as one value (equal),  two values (between),  more
+    than two values (any of),  or as {"min": x, "max": y} or {"in": [...]}.
 
     for email
     the slitmask FITS tables structure allows for
@@ -38,13 +142,6 @@ def admin_search(options, db, obs_info):
     The web ingestion software converts the input FITS table e-mail value
     into the primary key ObId in the database of registered observers.
 
-    for guiname
-    Note that mask ingestion software MUST ensure that values
-    of GUIname are unique among all masks which are currently
-    submitted and not yet destroyed.
-    We must write new ingestion code which enforces this uniqueness
-    requirement.
-
     for name
     Note that BluName and DesName are whatever was supplied by the
     mask designers and there is no expectation of uniqueness.
@@ -52,36 +149,11 @@ def admin_search(options, db, obs_info):
     guiname from bluname and desname when the original cgiTcl
     web pages did not.
 
-    if desid is a single value then the SQL is
-    MaskDesign.DesId=desid
-    if desid is two values then the SQL is
-    MaskDesign.DesId>=desid1 and MaskDesign.DesId<=desid2
-    This roughly works as expected because the mask ingestion
-    process assigns the primary key DesId in increasing sequence.
-    if desid is more than two values then the SQL is
-    MaskDesign.DesId in (desid1,desid2,desid3...)
-
-    for bluid
-    the SQL is just like the above for desid
-    with comparison to MaskBlu.BluId
-
-    for millseq
-    the SQL is just like the above for desid
-    except that millseq are alphanumeric rather than integer
-    with comparison to MaskBlu.MillSeq
-    Note that the mask ingestion software SHOULD ensure that values
-    of millseq are sequential so that there is very little chance
-    of a duplicate millseq during the interval between submission
-    and milling.
-    Because millseq is two uppercase alpha characters that by
-    itself gives 26*26 values.
-    So if each new millseq value is sequential after the the
-    previous millseq value then the chance of duplication
-    is very small.
-
-    for barcode
-    the SQL is just like the above for desid
-    with comparison to Mask.MaskId
+    for bluid,  desid,  millseq and barcode
+    The two value range roughly works as expected because the mask
+    ingestion process assigns the primary keys in increasing sequence.
+    A bluid,  millseq or barcode matches all the blueprints of the design.
+
     Note that barcode and MaskId means the number on the barcode
     sticky label that is applied after the mask is milled.
     Note that barcode is supposed to be unique, but that is only true
@@ -93,8 +165,6 @@ def admin_search(options, db, obs_info):
     So NOTE WELL, whoever is ordering more barcode labels for slitmasks
     should always note the high value of the previous order and ask the
     printer to make the next batch starting with greater values.
-    The barcodes have six decimal digits so there can be a million
-    masks during the lifetime of the DEIMOS and LRIS database.
 
     for milled
       milled = all (default)
@@ -106,259 +176,133 @@ def admin_search(options, db, obs_info):
           only masks that have milled blueprints
               MaskBlu.status = READY
 
-    The above options are mutually exclusive. First one wins.
-
-    These next two options are not exclusive:
-
-    for limit
-    limit the ordered query to the last this many masks
+    :param options: <dict> the search options.
+    :param db: <WsPgConn> the database object,  for the email lookup.
+    :param obs_info: <dict> the observer service urls.
 
-    for inst
-    Query only for instrument: DEIMOS, LRIS, both
-    MaskDesign.INSTRUME ilike %BLANK%
-    we use ilike in this query to handle LRIS and LRIS-ADC
-    Note that a query by barcode=MaskId ignores this instrument limitation
-
-
-    :param options: set of options to query on
-    :type options: dict
-    :return:
-    :rtype:
+    :return: <dict> query - the SQL,  query_args - the arguments,
+                    limit - the page size or None,  msg - a message for the
+                    user instead of a query.
     """
     log = log_fun.get_log()
 
-    # we will construct a SQL query
-    # query_args will become the arguments for that SQL query
-    query_args = []
-
-    # first we evaluate whether to limit by instrument
-    if 'inst' in options:
-        inst_query = ""
-        # if "DEIMOS" == options['inst']:
-        # re.search(r'^(LRIS|DEIMOS).*', 'lris', re.IGNORECASE)
-        if re.search(r'^(DEIMOS).*', options['inst'], re.IGNORECASE):
-            inst_query = "d.INSTRUME = %s"
-            query_args.append("DEIMOS")
-        elif re.search(r'^(LRIS).*', options['inst'], re.IGNORECASE):
-            inst_query = "d.INSTRUME ilike %s"
-            query_args.append("LRIS%")
-        else:
-            # we take anything else as matching any MaskDesign.INSTRUME
-            # and we do not complain about unrecognized values
-            pass
-
-        search_q = get_query('search_inst')
-        if inst_query:
-            search_q += f"WHERE {inst_query} "
-
-    # step through the exclusive keys in order
-    elif 'email' in options:
-        # Before trying to query for matching masks
-        # we want to ascertain whether email matches a known user
-        # so that we can report a separate error about the
-        # unrecognized value of email.
-
-        search_obid = mask_user_id(db, options['email'], obs_info)
-
-        if search_obid == None:
-            msg = f"{options['email']} - user is not in database of known mask users."
-            log.warning(msg)
-            return {'query': None, 'query_args': None, 'msg': msg}
+    try:
+        predicates, query_args, limit, offset = compile_predicates(options, db, obs_info)
+    except SearchError as err:
+        log.warning(f'admin search {options}: {err}')
+        return {'query': None, 'query_args': None, 'limit': None, 'msg': str(err)}
 
-        search_q = get_query('search_email')
+    search_q = get_query('search_base')
+    if predicates:
+        search_q += "WHERE " + " AND ".join(predicates) + " "
 
-        query_args.append(search_obid)  # does DesPId match ObId
-        query_args.append(search_obid)  # does BluPId match ObId
+    search_q += get_query('search_order')
 
-    elif 'guiname' in options and options['guiname'] != "":
-        # match GUIname - which is unique by definition
-        search_q = get_query('search_guiname')
+    if limit:
+        search_q += "LIMIT %s OFFSET %s"
+        query_args += [limit, offset]
 
-        # '%guiname%' for GUIname ilike match
-        query_args.append("%" + options['guiname'] + "%")
+    return {'query': search_q, 'query_args': tuple(query_args), 'limit': limit, 'msg': None}
 
-    elif 'name' in options and options['name'] != "":
-        # match either MaskDesign.DesName or MaskBlu.BluName
-        search_q = get_query('search_blue_name')
-
-        query_args.append("%" + options['name'] + "%")
-        query_args.append("%" + options['name'] + "%")
-
-    elif 'bluid' in options and options['bluid'] != "" and options['bluid'] != [""]:
-        # options['bluid'] should be a list of MaskBlu.BluId values
-        numBlu = len(options['bluid'])
-
-        if numBlu == 2:
-            # query the range between the MaskBlu.BluId values
-            # bilist = sorted(options['bluid'])
-            bilist = options['bluid']
-            minbi = bilist[0]
-            maxbi = bilist[-1]
-
-            search_q = get_query('search_blue_id_eq2')
-
-            # arguments for BluId between
-            query_args.append(minbi)
-            query_args.append(maxbi)
-
-        elif numBlu > 2:
-            # query the list of given MaskBlu.BluId values
-            search_q = get_query('search_blue_id_gt2')
-            search_q += f" AND b2.BluId IN (" + ",".join("%s" for i in options['bluid']) + ")) "
-
-            # arguments for BluId in ()
-            for bluid in options['bluid']:
-                query_args.append(bluid)  # end for bluid
-
-        else:
-            # numBlu == 1
-            search_q = get_query('search_blue_id_eq1')
-
-            # argument for BluId = match
-            query_args.append(options['bluid'][0])  # end if numBlu
-
-    elif 'desid' in options and options['desid'] != "" and options['desid'] != [""]:
-        # options['desid'] should be a list of MaskDesign.DesId values
-        numDes = len(options['desid'])
-
-        # query for desid is easier than for bluid
-        if numDes == 2:
-            # query between the given MaskDesign.DesId values
-            # dilist = sorted(options['desid'])
-            dilist = options['desid']
-            mindi = dilist[0]
-            maxdi = dilist[-1]
-
-            search_q = get_query('search_design_id_eq2')
-
-            # arguments for DesId between
-            query_args.append(mindi)
-            query_args.append(maxdi)
-
-        elif numDes > 2:
-            # query the list of given MaskDesign.DesId values
-            search_q = get_query('search_design_id_gt2')
-            search_q += f" WHERE d.DesId in (" + ",".join("%s" for i in options['desid']) + ") "
-
-            # arguments for DesId in ()
-            for desid in options['desid']:
-                query_args.append(desid)  # end for desid
-        else:
-            search_q = get_query('search_design_id_eq1')
-
-            # argument for DesId = match
-            query_args.append(options['desid'][0])
-
-    elif 'millseq' in options and options['millseq'] != "":
-        # options['desid'] should be a list of MaskDesign.DesId values
-        numSeq = len(options['millseq'])
-
-        if numSeq == 2:
-            # query between the given MaskBlu.MillSeq/Mask.MillSeq values
-            mslist = options['millseq']
-            minms = mslist[0]
-            maxms = mslist[-1]
-
-            search_q = get_query('search_millseq_eq2')
-
-            # arguments for MaskBlu.MillSeq between
-            query_args.append(minms)
-            query_args.append(maxms)
-
-            # arguments for Mask.MillSeq between
-            query_args.append(minms)
-            query_args.append(maxms)
-
-        elif numSeq > 2:
-            # query the list of given MaskBlu.MillSeq values
-            search_q = get_query('search_millseq_gt2')
-            search_q += (
-                    f"AND MillSeq IN (" + ",".join("%s" for i in options['millseq']) + ")) "
-                    f"OR EXISTS (SELECT * FROM MaskBlu WHERE DesId = d.DesId "
-                    f"AND BluId IN (SELECT BluId FROM Mask WHERE MillSeq IN "
-                    f"(" + ",".join("%s" for i in options['millseq']) + ")))) "
-            )
-
-            # arguments for MaskBlu.MillSeq in ()
-            for millseq in options['millseq']:
-                query_args.append(millseq)
-
-            # end for millseq
-            # arguments for Mask.MillSeq in ()
-            for millseq in options['millseq']:
-                query_args.append(millseq)  # end for millseq
 
-        else:
-            # numSeq == 1
-            search_q = get_query('search_millseq_eq1')
-
-            # arguments for MaskBlu.MillSeq =
-            query_args.append(options['millseq'][0])
-
-            # arguments for Mask.MillSeq =
-            query_args.append(options['millseq'][0])
-
-    elif 'barcode' in options and options['barcode'] != "" and options['barcode'] != [""]:
-        # options['barcode'] should be a list of barcode=maskId values
-        numMasks = len(options['barcode'])
-
-        # these SQL statements ignore the instrument because
-        # the instrument is inherent for each milled mask
-        if numMasks == 2:
-            # query between the given MaskId=barcode values
-            bclist = options['barcode']
+def compile_predicates(options, db, obs_info):
+    """
+    :return: <list, list, int, int> the predicates,  their arguments,  and
+             the limit and offset.
+    """
+    if not isinstance(options, dict):
+        raise SearchError('The search options must be a JSON object.')
 
-            minbc = bclist[0]
-            maxbc = bclist[-1]
+    predicates = []
+    query_args = []
 
-            search_q = get_query('search_barcode_eq2')
+    def add(predicate, args):
+        predicates.append(predicate)
+        query_args.extend(args)
 
-            # arguments for Mask.MaskId between
-            query_args.append(minbc)
-            query_args.append(maxbc)
+    if not is_empty(options.get('email')):
+        # report an unknown email separately from no matching masks
+        search_obid = mask_user_id(db, options['email'], obs_info)
+        if search_obid is None:
+            raise SearchError(f"{options['email']} - user is not in database "
+                              f"of known mask users.")
 
-        elif numMasks > 2:
-            # query the list of given MaskId=barcode values
-            search_q = get_query('search_barcode_gt2')
-            search_q += ",".join("%s" for i in options['barcode']) + "))) "
+        # does DesPId or BluPId match ObId
+        add(admin_search_predicates['email'], [search_obid, search_obid])
 
-            # arguments for Mask.MaskId in ()
-            for barcode in options['barcode']:
-                query_args.append(barcode)
+    # a fuzzy name matches by a similar word instead of the substring
+    fuzzy = options.get('fuzzy') in (True, 'true', 'yes', '1', 1)
 
+    if not is_empty(options.get('guiname')):
+        if fuzzy:
+            add(admin_search_predicates['guiname_fuzzy'], [str(options['guiname'])])
         else:
-            # numMasks == 1
-            search_q = get_query('search_barcode_eq1')
-
-            # arguments for Mask.MaskId =
-            query_args.append(options['barcode'][0])
-
-    elif ('milled' in options) and (options['milled'] != "all") and options['milled'] != "":
-        if options['milled'] == "no":
-            search_q = get_query('search_milled_no')
+            add(admin_search_predicates['guiname'], [like_pattern(options['guiname'])])
 
+    if not is_empty(options.get('name')):
+        if fuzzy:
+            value = str(options['name'])
+            add(admin_search_predicates['name_fuzzy'], [value, value])
         else:
-            # assume options['milled'] = "yes"
-            search_q = get_query('search_milled_yes')
-
-        query_args.append(READY)
-
-    elif 'caldays' in options and options['caldays'] != "":
-        search_q = get_query('search_cal_days')
-
-        # argument for Date_Use diff between 0 and caldays
-        query_args.append(options['caldays'])
+            pattern = like_pattern(options['name'])
+            add(admin_search_predicates['name'], [pattern, pattern])
+
+    for key, cast in (('bluid', int), ('desid', int), ('millseq', str), ('barcode', int),
+                      ('desdate', to_date), ('submitted', to_date),
+                      ('date_use', to_date), ('milldate', to_date)):
+        if not is_empty(options.get(key)):
+            add(*range_predicate(key, options[key], cast))
+
+    milled = options.get('milled')
+    if not is_empty(milled) and milled != 'all':
+        add(admin_search_predicates['milled_no' if milled == 'no' else 'milled_yes'], [READY])
+
+    if not is_empty(options.get('caldays')):
+        try:
+            caldays = int(options['caldays'])
+        except (TypeError, ValueError):
+            raise SearchError(f"caldays must be a number of days: {options['caldays']}")
+        add(admin_search_predicates['caldays'], [caldays])
+
+    inst = str(options.get('inst') or '')
+    if re.search(r'^(DEIMOS).*', inst, re.IGNORECASE):
+        add(admin_search_predicates['inst_deimos'], ['DEIMOS'])
+    elif re.search(r'^(LRIS).*', inst, re.IGNORECASE):
+        # ilike to handle LRIS and LRIS-ADC
+        add(admin_search_predicates['inst_lris'], ['LRIS%'])
+
+    try:
+        limit = int(options['limit']) if not is_empty(options.get('limit')) else None
+        offset = int(options.get('offset') or 0)
+    except (TypeError, ValueError):
+        raise SearchError('limit and offset must be integers.')
+
+    if limit is not None:
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+        offset = max(offset, 0)
+
+    return predicates, query_args, limit, offset
+
+
+def search_estimate(explain_result):
+    """
+    :param explain_result: <list> the rows of EXPLAIN (FORMAT JSON).
 
-    else:
-        # this is the default admin query when nothing in dict
-        search_q = get_query('search_other')
+    :return: <dict> the planner cost and estimated rows.
+    """
+    plan = explain_result[0]['QUERY PLAN'][0]['Plan']
 
-    if search_q:
-        search_q += f"ORDER BY d.stamp DESC;"
+    return {'cost': plan['Total Cost'], 'rows': plan['Plan Rows']}
 
-    # convert the argument list into a tuple
-    queryargtup = tuple(i for i in query_args)
 
-    return {'query': search_q, 'query_args': queryargtup, 'msg': None}
+def unbounded_msg(query_dict, estimate):
+    """
+    A search estimated to return more than SEARCH_MAX_ROWS needs a limit.
 
+    :return: <str> the message for the user,  None if the search may run.
+    """
+    if query_dict['limit'] or estimate['rows'] <= SEARCH_MAX_ROWS:
+        return None
 
+    return f"The search matches about {estimate['rows']} masks,  add search " \
+           f"options or a limit (at most {SEARCH_MAX_LIMIT})."
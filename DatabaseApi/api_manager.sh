@@ -1,43 +1,57 @@
 #!/bin/bash
+#
+# api_manager.sh start|stop|reload|restart|status
+#
+#   reload  - HUP,  new workers with the re-read config,  no dropped requests
+#   restart - USR2,  a new master with the new code,  then QUIT the old one
 
 cmd="$1"
 
-python_cmd="/usr/local/anaconda3/bin/python "
-echo $python_cmd
-script_cmd="slitmask_api.py slitmask_cfg.live.ini"
-echo $script_cmd
-start_cmd=$python_cmd$script_cmd
-echo $start_cmd
+cd "$(dirname "$0")" || exit 1
 
-pid=$(ps -eaf | grep "$script_cmd" | grep -v "grep" | grep -v "ps -eaf" | awk '{print $2}')
+export SLITMASK_CONFIG="slitmask_cfg.live.ini"
+gunicorn_cmd="/usr/local/anaconda3/bin/gunicorn -c gunicorn.conf.py --daemon"
+pid_file="gunicorn.pid"
+
+pid=""
+if [ -f "$pid_file" ] && kill -0 "$(cat $pid_file)" 2> /dev/null; then
+  pid=$(cat $pid_file)
+fi
 
 
 if [ -n "$pid" ]; then
   if [ "$cmd" == "stop" ]; then
     echo "stopping $pid"
-    kill $pid
+    kill -TERM $pid
+  elif [ "$cmd" == "reload" ]; then
+    echo "reloading $pid"
+    kill -HUP $pid
   elif [ "$cmd" == "restart" ]; then
-    echo "stopping $pid"
-    kill $pid
-    wait
-    echo "starting $start_cmd"
-    $start_cmd &
-  elif [ "$cmd" == "start" ]; then
-    echo "already running $start_cmd: $pid"
+    echo "upgrading $pid"
+    kill -USR2 $pid
+    # the new master renames the old pid file to gunicorn.pid.oldbin
+    for i in $(seq 1 30); do
+      sleep 1
+      if [ -f "$pid_file" ] && [ "$(cat $pid_file)" != "$pid" ]; then
+        echo "new master $(cat $pid_file),  stopping $pid"
+        kill -QUIT $pid
+        exit 0
+      fi
+    done
+    echo "new master did not start,  $pid still running"
+    exit 1
+  elif [ "$cmd" == "start" ] || [ "$cmd" == "status" ]; then
+    echo "running: $pid"
   else
     echo "command $cmd not found"
   fi
 else
   if [ "$cmd" == "restart" ] || [ "$cmd" == "start" ]; then
-    echo "starting $start_cmd"
-    $start_cmd &
-  elif [ "$cmd" == "stop" ]; then
-    echo "no processes to stop"
+    echo "starting $gunicorn_cmd"
+    $gunicorn_cmd
+  elif [ "$cmd" == "stop" ] || [ "$cmd" == "reload" ] || [ "$cmd" == "status" ]; then
+    echo "not running"
   else
     echo "command $cmd not found"
   fi
 fi
-
-
-
-
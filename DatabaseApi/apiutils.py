@@ -1,15 +1,22 @@
-import smtplib
 import subprocess
 
-from email.utils import formatdate
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-
 from general_utils import commitOrRollback
 import logger_utils as log_fun
+import mail_utils
+from mail_utils import SmtpSession, render_message
+from metrics_utils import timer, TOOL_SECONDS
+from cache_utils import TTLCache
+
+from general_utils import do_query, get_dict_result, get_keck_obs_info, \
+    get_observer_dict
+from mask_constants import MASK_ADMIN, ARCHIVED, EVENT_ARCHIVED, EVENT_STATUS, \
+    EVENT_USE_DATE, EMAIL_CACHE_TTL, EMAIL_NEGATIVE_TTL
 
-from general_utils import do_query, get_dict_result, get_keck_obs_info
-from mask_constants import MASK_ADMIN
+# the observer IDs of the emails,  not invalidated by the database changes
+EMAIL_CACHE = TTLCache('observer_emails', EMAIL_CACHE_TTL, None)
+
+# a cached email not found is stored as None
+_MISSING = object()
 
 
 def generate_mask_descript(blue_id, exec_dir, out_dir, KROOT):
@@ -54,8 +61,9 @@ def generate_mask_descript(blue_id, exec_dir, out_dir, KROOT):
 
     # we are going to use subprocess.call even if we are python3
     try:
-        status = subprocess.call([dbMaskOut, f"{blue_id}"], stdout=stdout_file,
-                                 stderr=stderr_file)
+        with timer(TOOL_SECONDS, 'tool', tool='dbMaskOut'):
+            status = subprocess.call([dbMaskOut, f"{blue_id}"], stdout=stdout_file,
+                                     stderr=stderr_file)
     except Exception as err:
         log.error(f"Error running dbMaskOut: {err}")
         return None, None
@@ -82,34 +90,57 @@ def maskStatus(db, blue_id, newstatus):
     :param blue_id: <str> the integer of the blueprint id
     :param newstatus: <int> the integer representing mask status,  forgotten, etc.
 
+    :return: <bool> True if the status was updated.
+    """
+    return blueprints_status(db, [blue_id], newstatus)
+
+
+def blueprints_status(db, blue_ids, newstatus, clear_millseq=True,
+                      use_date=None, commit=True):
+    """
+    Update the status of a list of blueprints with set-based updates,  in one
+    transaction.
+
+    :param db: database connection object
+    :param blue_ids: <list> the integers of the blueprint ids
+    :param newstatus: <int> the integer representing mask status,  forgotten, etc.
+    :param clear_millseq: <bool> change the millseq to null,  like a new mask.
+    :param use_date: <str> optional,  the new use date of the blueprints.
+    :param commit: <bool> commit the transaction,  False to leave the commit
+                   to the caller.
+
     :return: <bool> True if the status was updated.
     """
     log = log_fun.get_log()
 
-    maskStatusUpdate = "update MaskBlu set status = %s where bluid = %s"
+    blue_ids = [int(blue_id) for blue_id in blue_ids]
 
-    try:
-        db.cursor.execute(maskStatusUpdate, (newstatus, blue_id))
-    except Exception as e:
-        log.error(f"maskStatuUpdate failed: {db.cursor.query}: "
-                  f"exception class {e.__class__.__name__}: {e}")
+    query_name = 'batch_status_millseq' if clear_millseq else 'batch_status'
+    if not do_query(query_name, db.cursor, (newstatus, blue_ids)):
         return False
 
-    log.info(f"updated blue_id {blue_id} new status {newstatus}")
+    log.info(f"updated blue_ids {blue_ids} new status {newstatus}, "
+             f"cleared millseq: {clear_millseq}")
 
-    # change the millseq to null,  like a new masks
-    newmillseq = None
+    if use_date:
+        if not do_query('batch_use_date', db.cursor, (use_date, blue_ids)):
+            return False
 
-    maskMillseqUpdate = "update MaskBlu set millseq = %s where bluid = %s"
+        log.info(f"blue_ids {blue_ids} new use date {use_date}")
 
-    try:
-        db.cursor.execute(maskMillseqUpdate, (newmillseq, blue_id))
-    except Exception as e:
-        log.error(f"maskMillseqUpdate failed blue_id {blue_id}: {db.cursor.query}: "
-                  f"exception class {e.__class__.__name__}: {e}")
+        if not record_mask_event(db.cursor, EVENT_USE_DATE, blue_ids=blue_ids,
+                                 detail=f'use date {use_date}'):
+            log.error(f"mask event not recorded for blue_ids {blue_ids}")
+            return False
+
+    # a failed event aborts the transaction,  the updates are not committed
+    event_type = EVENT_ARCHIVED if newstatus == ARCHIVED else EVENT_STATUS
+    if not record_mask_event(db.cursor, event_type, blue_ids=blue_ids):
+        log.error(f"mask event not recorded for blue_ids {blue_ids}")
         return False
 
-    log.info(f"blue_id {blue_id} new millseq {newmillseq}")
+    if not commit:
+        return True
 
     status, message = commitOrRollback(db)
 
@@ -126,6 +157,82 @@ def maskStatus(db, blue_id, newstatus):
 ################################################
 
 
+def archive_sweep(db, months, dry_run=False):
+    """
+    Archive every mask matching the purge criteria (use date older than
+    months and not perpetual) with one set-based UPDATE in one transaction.
+
+    :param db: database connection object
+    :param months: <int> archive the masks with a use date older than months.
+    :param dry_run: <bool> only select the masks which would be archived.
+
+    :return: <bool, list> True on success,  the masks archived (or to be
+             archived) with columns: bluid, desid, guiname, status, date_use.
+    """
+    log = log_fun.get_log()
+    curse = db.get_dict_curse()
+
+    query_name = 'archive_sweep_select' if dry_run else 'archive_sweep'
+    if not do_query(query_name, curse, (months, )):
+        return False, []
+
+    masks = get_dict_result(curse)
+    if dry_run or not masks:
+        return True, masks
+
+    blue_ids = [mask['bluid'] for mask in masks]
+    if not record_mask_event(curse, EVENT_ARCHIVED, blue_ids=blue_ids,
+                             detail=f'archive sweep, use date > {months} months'):
+        log.error(f"mask events not recorded for the archive sweep")
+        return False, []
+
+    status, message = commitOrRollback(db)
+    if status != 1:
+        log.warning(f"archive sweep commitOrRollback failed: {message}")
+        return False, []
+
+    log.info(f"archive sweep archived {len(blue_ids)} masks: {blue_ids}")
+
+    return True, masks
+
+
+################################################
+
+
+def record_mask_event(curse, event_type, blue_ids=None, design_id=None,
+                      mask_id=None, detail=None):
+    """
+    Append an event to the mask event log (MaskEvents) read by the
+    /slitmask/changes feed.  The event is part of the caller's transaction
+    and holds the event lock until the commit,  so it should be the last
+    statement before the commit.
+
+    :param curse: <obj> the database cursor.
+    :param event_type: <str> one of the mask_constants.EVENT_* types.
+    :param blue_ids: <list> the blueprint ids the event applies to.
+    :param design_id: <int> the design id,  used for all of its blueprints.
+    :param mask_id: <int> the mask id (barcode).
+    :param detail: <str> optional,  text describing the change.
+
+    :return: <bool> True if the event was recorded.
+    """
+    if not do_query('event_lock', curse, None):
+        return False
+
+    if blue_ids:
+        params = (event_type, mask_id, detail, [int(bluid) for bluid in blue_ids])
+        return do_query('event_insert_blue', curse, params)
+
+    if design_id:
+        params = (event_type, mask_id, detail, design_id)
+        return do_query('event_insert_design', curse, params)
+
+    params = (event_type, None, None, mask_id, None, detail)
+    return do_query('event_insert', curse, params)
+
+################################################
+
+
 def desid_to_bluid(design_id, curse):
     """
     Get the blue_id from the design_id.
@@ -315,6 +422,70 @@ def my_blueprint_or_design(user_info, db_obj, blue_id):
 ################################################
 
 
+def batch_blueprints(curse, user_info, blue_ids, design_ids):
+    """
+    Get the blueprints of the blue ids and of the design ids,  and check the
+    ownership of all of them with one query.
+
+    :param curse: <obj> the database dict cursor.
+    :param user_info: <obj> The object containing the logged in user information
+    :param blue_ids: <list> the integers of the blueprint ids
+    :param design_ids: <list> the integers of the design ids
+
+    :return: <bool, list> True on success,  the blueprints with columns:
+             bluid, desid, guiname, status, blupid, despid, owned
+    """
+    params = (user_info.ob_id, user_info.ob_id, blue_ids, design_ids)
+    if not do_query('batch_blue_person', curse, params):
+        return False, []
+
+    blueprints = get_dict_result(curse)
+
+    if user_info.user_type == MASK_ADMIN:
+        for blueprint in blueprints:
+            blueprint['owned'] = True
+
+    return True, blueprints
+
+################################################
+
+
+def blueprint_owner_emails(curse, blueprints, obs_info):
+    """
+    Group the blueprints by the e-mail of the Design and Blueprint owners,  so
+    each owner can be sent one message.  The observer table is read once for
+    all the blueprints.
+
+    :param curse: <obj> the database dict cursor.
+    :param blueprints: <list> the blueprints with the blupid and despid.
+    :param obs_info: <dict> the schedule API url to get user info
+
+    :return: <dict> e-mail address to the list of its blueprints.
+    """
+    log = log_fun.get_log()
+
+    observers = get_observer_dict(curse, obs_info) or []
+
+    # owner ids can be a legacy obid (< 1000) or a keck id
+    obs_emails = {}
+    for observer in observers:
+        obs_emails[observer.get('Id')] = observer.get('Email')
+        obs_emails[observer.get('obid')] = observer.get('Email')
+
+    owner_blueprints = {}
+    for blueprint in blueprints:
+        for pi_id in {blueprint['blupid'], blueprint['despid']}:
+            email = obs_emails.get(pi_id)
+            if not email:
+                log.warning(f'email unknown for observer id: {pi_id}')
+                continue
+            owner_blueprints.setdefault(email, []).append(blueprint)
+
+    return owner_blueprints
+
+################################################
+
+
 def mask_user_id(db_obj, user_email, obs_info_url):
     """
     Find the user OBID (mask user ID) from the email.  This is used in the
@@ -329,40 +500,96 @@ def mask_user_id(db_obj, user_email, obs_info_url):
              None - an error occurred and ID could be determined.
 
     """
-    log = log_fun.get_log()
+    resolved = resolve_emails(db_obj, [user_email], obs_info_url)
 
-    userQuery = "select ObId from Observers where email ilike %s"
+    return resolved.get(normalize_email(user_email))
 
-    try:
-        db_obj.cursor.execute(userQuery, (user_email,))
-    except Exception as e:
-        log.error(f"{userQuery} failed: {db_obj.cursor.query}: "
-                  f"exception class {e.__class__.__name__}: {e}")
+
+def normalize_email(user_email):
+    """
+    :return: <str> the email as the cache and lookup key,  None if empty.
+    """
+    if not user_email:
         return None
 
-    results = db_obj.cursor.fetchall()
-    lenres = len(results)
+    return str(user_email).strip().lower() or None
+
+
+def resolve_emails(db_obj, emails, obs_info_url):
+    """
+    Find the mask user IDs of several emails.  The cached emails are not
+    looked up,  the others are found with one query of the Observers table
+    and the emails not there with the Keck Observer API.  The IDs found are
+    cached for EMAIL_CACHE_TTL seconds and the emails not found for
+    EMAIL_NEGATIVE_TTL.
+
+    :param db_obj: <obj> the database object.
+    :param emails: <list> the email addresses.
+    :param obs_info_url: <str> the schedule API url to get user info
+
+    :return: <dict> the normalized (lower case) email to the observer ID,
+             None for the emails not found or on error.
+    """
+    log = log_fun.get_log()
+
+    resolved = {}
+    missing = []
+    for email in map(normalize_email, emails):
+        if not email or email in resolved:
+            continue
+
+        obid = EMAIL_CACHE.get(email, _MISSING)
+        if obid is _MISSING:
+            missing.append(email)
+            obid = None
+        resolved[email] = obid
+
+    if not missing:
+        return resolved
+
+    if not do_query('observers_by_email', db_obj.cursor, (missing, )):
+        return resolved
+
+    found = {}
+    duplicated = set()
+    for row in db_obj.cursor.fetchall():
+        # should not be possible - email in observers database should be unique.
+        if row['email'] in found:
+            log.error(f"db error: > 1 mask users with email {row['email']}")
+            duplicated.add(row['email'])
+        found[row['email']] = row['obid']
 
     # user_email is not in the Legacy Mask (UCO pre-2023) observer table
-    if lenres < 1:
-        # check the Keck Observer table,  and re-check UCO table with keck_id
-        mask_id = chk_keck_observers(db_obj, user_email, obs_info_url, log)
-        if not mask_id:
-            log.warning(f"{user_email} is not a registered mask user")
-            return None
-    # should not be possible - email in observers database should be unique.
-    elif lenres > 1:
-        log.error(f"db error: > 1 mask users with email {user_email}")
-        return None
-    else:
-        mask_id = results[0]['obid']
+    # check the Keck Observer table,  and re-check UCO table with keck_id
+    not_found = [email for email in missing if email not in found]
+    keck_found = {}
+    if not_found:
+        keck_found = chk_keck_observers(db_obj, not_found, obs_info_url, log)
+        if keck_found:
+            found.update(keck_found)
+
+    for email in missing:
+        if email in duplicated:
+            continue
 
-    return mask_id
+        obid = found.get(email)
+        if obid is not None:
+            EMAIL_CACHE.set(email, obid)
+        elif keck_found is None:
+            # the lookup failed,  not cached so the next request retries
+            log.warning(f"{email} could not be checked with the Keck observers")
+        else:
+            log.warning(f"{email} is not a registered mask user")
+            EMAIL_CACHE.set(email, None, EMAIL_NEGATIVE_TTL)
 
+        resolved[email] = obid
 
-def chk_keck_observers(psql_db_obj, user_email, obs_info_url, log):
+    return resolved
+
+
+def chk_keck_observers(psql_db_obj, emails, obs_info_url, log):
     """
-    Find the Mask ID,  get the observer Keck ID (keck observers table),  if
+    Find the Mask IDs,  get the observer Keck ID (keck observers table),  if
     the email is associated with a Keck Observer,  use that ID to check the
     legacy Mask IDs.
 
@@ -373,38 +600,37 @@ def chk_keck_observers(psql_db_obj, user_email, obs_info_url, log):
     Keck ID > 1000
 
     :param psql_db_obj: <obj> the database connection object.
-    :param user_email: <str> the email of the user
+    :param emails: <list> the emails of the users
     :param obs_info_url: <str> the schedule API url to get user info
     :param log  <obj> the log object.
 
-    :return: <str / None> Mask ID
+    :return: <dict> email to the Mask ID,  of the emails found,  None if the
+             observer API or the database failed.
     """
-    # query = "select * from observers where email = %s"
-    url_params = f"email={user_email}"
-
-    results = get_keck_obs_info(obs_info_url, url_params)
-    if not results or 'Id' not in results[0]:
+    keck_ids = {}
+    failed = False
+    for email in emails:
+        results = get_keck_obs_info(obs_info_url, f"email={email}")
+        if results is None:
+            failed = True
+        elif results and 'Id' in results[0]:
+            keck_ids[email] = results[0]['Id']
+
+    # the emails not checked can not be told apart from the unknown ones
+    if failed:
         return None
 
-    mask_id = results[0]['Id']
+    if not keck_ids:
+        return {}
 
-    userQuery = "select ObId from Observers where keckid = %s"
-
-    # check the mask database using the keck-id to look for a legacy mask ID.
-    try:
-        psql_db_obj.cursor.execute(userQuery, (mask_id,))
-    except Exception as e:
-        log.error(f"{userQuery} failed: {psql_db_obj.cursor.query}: "
-                  f"exception class {e.__class__.__name__}: {e}")
+    # check the mask database using the keck-ids to look for legacy mask IDs.
+    if not do_query('observers_by_keckid', psql_db_obj.cursor,
+                    (list(keck_ids.values()), )):
         return None
 
-    results = psql_db_obj.cursor.fetchall()
-    lenres = len(results)
-
-    if lenres > 0:
-        mask_id = results[0]['obid']
+    legacy_ids = {row['keckid']: row['obid'] for row in psql_db_obj.cursor.fetchall()}
 
-    return mask_id
+    return {email: legacy_ids.get(keck_id, keck_id) for email, keck_id in keck_ids.items()}
 
 
 def send_email(email_msg, email_info, subject):
@@ -417,9 +643,6 @@ def send_email(email_msg, email_info, subject):
 
     :return: None
     """
-    """
-    Send email with message to email.
-    """
     log = log_fun.get_log()
 
     html_msg = f"""
@@ -431,20 +654,20 @@ def send_email(email_msg, email_info, subject):
         </html>
     """
 
-    for email_address in email_info['to_list']:
-        msg = MIMEMultipart()
-        msg['To'] = email_address
-        msg['From'] = email_info['from']
-        msg['Date'] = formatdate(localtime=True)
-        msg['Subject'] = subject
-
-        msg.attach(MIMEText(html_msg, 'html'))
+    # queued for the background sender when the outbox is configured
+    if mail_utils.outbox:
+        mail_utils.outbox.enqueue(email_info['from'], email_info['to_list'],
+                                  subject, html_msg)
+        return
 
-        server = smtplib.SMTP(email_info['server'])
-        server.sendmail(email_info['from'], email_address, msg.as_string())
-        server.quit()
+    rendered_msg = render_message(email_info['from'], subject, html_msg)
+    # within the request,  not retried with a backoff
+    with SmtpSession(email_info['server'], retries=1) as session:
+        failed, refused = session.send(email_info['from'], email_info['to_list'],
+                                       rendered_msg)
 
-        log.info(f"Email sent to: {email_address}")
+    if failed or refused:
+        log.error(f"Email not sent to: {failed + refused}, subject: {subject}")
 
 
 def get_design_owner_emails(db_obj, blue_id, design_id, obs_info_url):
@@ -555,10 +778,11 @@ def gcode_runner(blue_id, mask_fits_filename, KROOT, NCMILL_DIR, TOOL_DIAMETER):
 
     # call external function fits2ncc
     try:
-        status = subprocess.call(
-            [fits2ncc, f"{TOOL_DIAMETER}", f"{mask_fits_filename}"],
-            stdout=STDOUT, stderr=STDERR
-        )
+        with timer(TOOL_SECONDS, 'tool', tool='fits2ncc'):
+            status = subprocess.call(
+                [fits2ncc, f"{TOOL_DIAMETER}", f"{mask_fits_filename}"],
+                stdout=STDOUT, stderr=STDERR
+            )
     except Exception as err:
         log.error(f"Error running FITS2NCC: {err}")
         return None
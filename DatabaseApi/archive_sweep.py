@@ -0,0 +1,45 @@
+"""
+Archive all the masks matching the HIT LIST purge criteria,  use date older
+than N months and not perpetual,  in one transaction.
+
+    python archive_sweep.py slitmask_cfg.live.ini --months 6 --dry-run
+"""
+import argparse
+from os import path
+
+import apiutils as utils
+import general_utils as gen_utils
+from mask_constants import MASK_ADMIN, ARCHIVE_AFTER_MONTHS
+
+APP_PATH = path.abspath(path.dirname(__file__))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive the purged masks.')
+    parser.add_argument('config_file', help='Configuration File')
+    parser.add_argument('--months', type=int, default=ARCHIVE_AFTER_MONTHS,
+                        help='archive masks with a use date older than months')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only list the masks which would be archived')
+    args = parser.parse_args()
+
+    config, log = gen_utils.start_up(APP_PATH, config_name=args.config_file)
+
+    from wspgconn import WsPgConn
+
+    db_obj = WsPgConn(MASK_ADMIN)
+    if not db_obj.db_connect():
+        raise SystemExit('could not connect to the database')
+
+    success, masks = utils.archive_sweep(db_obj, args.months, dry_run=args.dry_run)
+    db_obj.disconnect()
+
+    if not success:
+        raise SystemExit('archive sweep failed,  see the log')
+
+    action = 'to archive' if args.dry_run else 'archived'
+    for mask in masks:
+        print(f"{mask['bluid']:>8} {mask['desid']:>8} {mask['guiname']:<10} "
+              f"{mask['date_use']}")
+
+    print(f"{len(masks)} masks {action}")
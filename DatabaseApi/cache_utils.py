@@ -0,0 +1,267 @@
+import json
+import time
+import select
+import threading
+
+from collections import defaultdict
+
+import psycopg2.extensions
+
+import logger_utils as log_fun
+from mask_constants import MASK_ADMIN
+
+# the postgres channel the triggers in migrations/001 publish to
+CHANGE_CHANNEL = 'slitmask_changes'
+
+
+class TTLCache:
+    """
+    A thread safe key-value cache,  entries expire after ttl seconds.  The
+    cache is only used while the registry is active (ie the change listener
+    is connected),  otherwise every get is a miss.  A cache without a
+    registry is always used,  its entries are only expired by the ttl.
+
+    Each invalidation advances the generation.  A caller reads it before its
+    query and passes it to set,  so a result read before a change (and
+    invalidated while the query ran) is not stored.
+    """
+    def __init__(self, name, ttl, registry):
+        self.name = name
+        self.ttl = ttl
+        self.registry = registry
+        self.entries = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.registry is None or self.registry.active
+
+    def get(self, key, default=None):
+        """
+        Get a cached value.
+
+        :param key: <hashable> the cache key.
+        :param default: <obj> returned when the key is missing or expired.
+
+        :return: <obj> the cached value or the default.
+        """
+        if not self.active:
+            return default
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return default
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return default
+
+        return value
+
+    def set(self, key, value, ttl=None, generation=None):
+        """
+        Store a value in the cache.  Callers must treat cached values as
+        read-only,  the same object is shared between requests.
+
+        :param key: <hashable> the cache key.
+        :param value: <obj> the value to store.
+        :param ttl: <int> optional,  seconds to keep the value.
+        :param generation: <int> optional,  the generation read before the
+                           value was queried,  the value is not stored if
+                           the cache was invalidated since.
+        """
+        if not self.active:
+            return
+
+        ttl = ttl if ttl is not None else self.ttl
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+
+class CacheRegistry:
+    """
+    The caches used by the API process,  and the rules mapping a changed
+    database table to the caches (and keys) which must be invalidated.
+    """
+    def __init__(self, default_ttl=60):
+        self.default_ttl = default_ttl
+        self.caches = {}
+        self.rules = defaultdict(list)
+        self.active = False
+        self.lock = threading.Lock()
+
+    def register(self, name, tables, ttl=None):
+        """
+        Create (or return the existing) named cache.
+
+        :param name: <str> the cache name.
+        :param tables: <dict> table name to the change payload field used as
+                       the cache key,  None as the field clears the cache.
+                       ie: {'maskblu': 'desid', 'mask': None}
+        :param ttl: <int> optional,  seconds entries are kept.
+
+        :return: <TTLCache> the cache.
+        """
+        with self.lock:
+            if name in self.caches:
+                return self.caches[name]
+
+            cache = TTLCache(name, ttl or self.default_ttl, self)
+            self.caches[name] = cache
+
+            for table, key_field in tables.items():
+                self.rules[table.lower()].append((cache, key_field))
+
+        return cache
+
+    def get(self, name):
+        return self.caches.get(name)
+
+    def set_default_ttl(self, ttl):
+        """
+        Set the ttl of the registered caches which did not define their own.
+        """
+        with self.lock:
+            for cache in self.caches.values():
+                if cache.ttl == self.default_ttl:
+                    cache.ttl = ttl
+            self.default_ttl = ttl
+
+    def invalidate_change(self, change):
+        """
+        Apply the invalidation rules for one change notification.
+
+        :param change: <dict> the notification payload,  must have 'table'.
+        """
+        table = str(change.get('table', '')).lower()
+        for cache, key_field in self.rules.get(table, []):
+            if key_field is None:
+                cache.clear()
+            else:
+                cache.invalidate(change.get(key_field))
+
+    def clear_all(self):
+        for cache in self.caches.values():
+            cache.clear()
+
+    def set_active(self, active):
+        """
+        Caching is only safe while the invalidations are being received,
+        everything cached is dropped when the state changes.
+        """
+        self.clear_all()
+        self.active = active
+
+
+# the registry shared by the API process
+registry = CacheRegistry()
+
+
+class ChangeListener(threading.Thread):
+    """
+    Background thread that LISTENs on the slitmask change channel and turns
+    the notifications into cache invalidations.  On any connection problem
+    the caches are disabled until the listener has reconnected.
+    """
+    def __init__(self, cache_registry, poll_timeout=5, retry_wait=10):
+        super().__init__(name='slitmask-change-listener', daemon=True)
+        self.registry = cache_registry
+        self.poll_timeout = poll_timeout
+        self.retry_wait = retry_wait
+        self.stop_event = threading.Event()
+        self.log = log_fun.get_log()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            db_obj = None
+            try:
+                db_obj = self.listen()
+                self.registry.set_active(True)
+                self.log.info(f'listening for database changes on {CHANGE_CHANNEL}')
+                self.poll(db_obj.get_conn())
+            except Exception as err:
+                self.log.warning(f'database change listener error: {err}')
+            finally:
+                self.registry.set_active(False)
+                if db_obj:
+                    db_obj.disconnect()
+
+            self.stop_event.wait(self.retry_wait)
+
+    def listen(self):
+        """
+        Open a dedicated autocommit connection and LISTEN on the channel.
+
+        :return: <obj> the database object.
+        """
+        # imported here,  the cfg module is only required once listening
+        from wspgconn import WsPgConn
+
+        db_obj = WsPgConn(MASK_ADMIN)
+        db_obj.db_connect()
+        conn = db_obj.get_conn()
+        if not conn:
+            raise ConnectionError('could not connect to the database')
+
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        curse = conn.cursor()
+        curse.execute(f'LISTEN {CHANGE_CHANNEL};')
+
+        return db_obj
+
+    def poll(self, conn):
+        """
+        Wait for notifications and apply them until stopped or disconnected.
+
+        :param conn: <obj> the psycopg2 connection in LISTEN mode.
+        """
+        while not self.stop_event.is_set():
+            if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                continue
+
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    change = json.loads(notify.payload)
+                except ValueError:
+                    self.log.warning(f'unreadable change payload: {notify.payload}')
+                    self.registry.clear_all()
+                    continue
+
+                self.registry.invalidate_change(change)
+
+
+def start_listener(cache_registry, ttl):
+    """
+    Start the change listener thread for the registry.
+
+    :param cache_registry: <CacheRegistry> the caches to invalidate.
+    :param ttl: <int> the ttl for the caches,  while the listener runs.
+
+    :return: <ChangeListener> the running thread.
+    """
+    cache_registry.set_default_ttl(ttl)
+
+    listener = ChangeListener(cache_registry)
+    listener.start()
+
+    return listener
@@ -0,0 +1,301 @@
+"""
+Stream the list queries as files:  the rows are fetched from a server-side
+cursor in chunks of EXPORT_CHUNK_ROWS,  formatted and written to the
+response chunk by chunk,  so the memory used does not grow with the rows
+and no temporary file is written.
+
+    fixed    fixed width text columns
+    csv      comma separated values
+    tsv      tab separated values
+    parquet  Apache Parquet,  one row group per chunk   (needs pyarrow)
+    arrow    the Arrow IPC stream,  one batch per chunk (needs pyarrow)
+
+The JSON responses of the large lists are streamed the same way,  see
+json_array,  and the tool output files as a zip archive,  see zip_stream.
+"""
+import io
+import csv
+import json
+import zipfile
+from os import path
+import importlib.util
+from decimal import Decimal
+
+import logger_utils as log_fun
+from mask_constants import EXPORT_CHUNK_ROWS, EXPORT_COLUMN_WIDTH
+from mask_constants import ZIP_READ_BYTES, ZIP_STORED_SUFFIXES
+
+# the formats,  their content type and file extension
+EXPORT_FORMATS = {
+    'fixed': ('text/plain', 'txt'),
+    'csv': ('text/csv', 'csv'),
+    'tsv': ('text/tab-separated-values', 'tsv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+# the formats written with pyarrow
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+# the columns of the active masks file and their fixed widths
+ACTIVE_MASKS_WIDTHS = {"Barcode": 8, "GUI-Name": 20, "Seq": 4, "Date-Use": 12,
+                       "First-Name": 12, "Last-Name": 12, "Inst": 8}
+
+
+def format_available(fmt):
+    """
+    :param fmt: <str> the export format.
+
+    :return: <bool> True if the format is known and can be written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        return False
+
+    if fmt in COLUMNAR_FORMATS:
+        return importlib.util.find_spec('pyarrow') is not None
+
+    return True
+
+
+def iter_chunks(curse, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    :param curse: <obj> the cursor,  after the query is executed.
+
+    :return: <generator> the lists of (at most chunk_rows) rows.
+    """
+    while True:
+        rows = curse.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield rows
+
+
+def json_array(rows, default=None, counter=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    A JSON array of the rows,  encoded and sent chunk_rows at a time.
+
+    :param rows: <iterable> the rows.
+    :param default: <function> the encoding of the values json can not.
+    :param counter: <dict> optional,  counter['rows'] is the rows written.
+    :param chunk_rows: <int> the rows in each chunk.
+
+    :return: <generator> the bytes of the array.
+    """
+    encode = json.JSONEncoder(default=default).encode
+    counter = counter if counter is not None else {}
+    counter['rows'] = 0
+
+    chunk = []
+    separator = '['
+    for row in rows:
+        chunk.append(encode(row))
+        if len(chunk) >= chunk_rows:
+            yield (separator + ",\n".join(chunk)).encode()
+            counter['rows'] += len(chunk)
+            separator, chunk = ",\n", []
+
+    counter['rows'] += len(chunk)
+    if chunk:
+        yield (separator + ",\n".join(chunk) + "]").encode()
+    else:
+        yield b"[]" if separator == '[' else b"]"
+
+
+def stream_export(chunks, formatter, fmt, columns=None, widths=None, prepare=None):
+    """
+    The export file,  chunk by chunk.
+
+    :param chunks: <iterable> the lists of result rows (dicts).
+    :param formatter: <RowFormatter> names,  orders and converts the columns.
+    :param fmt: <str> the export format,  see EXPORT_FORMATS.
+    :param columns: <list> optional,  the columns (new keys),  default all.
+    :param widths: <dict> optional,  the fixed format widths by column.
+    :param prepare: <function> optional,  filters or adds to the rows of a
+                    chunk before they are formatted,  returns the rows.
+
+    :return: <generator> the bytes of the file.
+    """
+    columns = list(columns or formatter.header)
+    if prepare:
+        chunks = (prepare(rows) for rows in chunks)
+
+    row_chunks = (formatter.tuples(rows, columns)[1] for rows in chunks if rows)
+
+    if fmt == 'fixed':
+        writer = write_fixed(columns, row_chunks, widths or {})
+    elif fmt in ('csv', 'tsv'):
+        writer = write_delimited(columns, row_chunks, ',' if fmt == 'csv' else '\t')
+    else:
+        writer = write_columnar(columns, row_chunks, fmt)
+
+    return log_errors(writer, fmt)
+
+
+def log_errors(writer, fmt):
+    """
+    The headers are sent with the first chunk,  an error after that can only
+    end the file early.
+    """
+    try:
+        yield from writer
+    except Exception as err:
+        log_fun.get_log().error(f'{fmt} export failed: {err}')
+        raise
+
+
+def write_fixed(columns, row_chunks, widths):
+    widths = [widths.get(col, EXPORT_COLUMN_WIDTH) for col in columns]
+
+    yield ("".join(col.ljust(width) for col, width in zip(columns, widths))
+           + "\n").encode()
+
+    for rows in row_chunks:
+        lines = ["".join(str(val).ljust(width) for val, width in zip(row, widths))
+                 for row in rows]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def write_delimited(columns, row_chunks, delimiter):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator='\n')
+
+    writer.writerow(columns)
+    for rows in row_chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    A write-only file which keeps the bytes written until drained,  the
+    pyarrow writers write to it and each chunk is sent as soon as written.
+    """
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_type(pa, values):
+    """
+    :return: <DataType, function> the Arrow type of a column from its first
+             values,  and the conversion of the values to it.
+    """
+    for val in values:
+        if val is None:
+            continue
+        if isinstance(val, bool):
+            return pa.bool_(), bool
+        if isinstance(val, int):
+            return pa.int64(), int
+        if isinstance(val, (float, Decimal)):
+            return pa.float64(), float
+        break
+
+    return pa.string(), str
+
+
+def write_columnar(columns, row_chunks, fmt):
+    import pyarrow as pa
+
+    sink = ChunkSink()
+    writer = None
+    types = None
+
+    for rows in row_chunks:
+        values = list(zip(*rows))
+
+        if writer is None:
+            # the types are decided from the first chunk
+            types = [arrow_type(pa, col_values) for col_values in values]
+            schema = pa.schema([(col, col_type) for col, (col_type, _) in zip(columns, types)])
+            if fmt == 'parquet':
+                import pyarrow.parquet as pq
+                writer = pq.ParquetWriter(sink, schema)
+            else:
+                writer = pa.ipc.new_stream(sink, schema)
+
+        arrays = [pa.array([None if val is None else conv(val) for val in col_values],
+                           type=col_type)
+                  for col_values, (col_type, conv) in zip(values, types)]
+        writer.write_table(pa.Table.from_arrays(arrays, names=columns))
+
+        data = sink.drain()
+        if data:
+            yield data
+
+    if writer is None:
+        # no rows,  the columns as strings
+        schema = pa.schema([(col, pa.string()) for col in columns])
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(sink, schema)
+        else:
+            writer = pa.ipc.new_stream(sink, schema)
+
+    writer.close()
+    yield sink.drain()
+
+
+def zip_stream(file_paths, compression=zipfile.ZIP_DEFLATED):
+    """
+    A zip archive of the files,  written as the files are read:  each member
+    is the local header then the compressed blocks then the data descriptor,
+    and the central directory is written last.  Only one block of a file is
+    held at a time.
+
+    The files already compressed (ZIP_STORED_SUFFIXES) are stored.
+
+    :param file_paths: <list> the files,  archived by their base name.
+    :param compression: <int> the zipfile compression of the other files,
+                        ZIP_DEFLATED or ZIP_STORED.
+
+    :return: <generator> the bytes of the archive.
+    """
+    sink = ChunkSink()
+
+    # the sink can not seek,  so zipfile writes the sizes after the data
+    with zipfile.ZipFile(sink, 'w') as zip_file:
+        for file_path in file_paths:
+            info = zipfile.ZipInfo.from_file(file_path, arcname=path.basename(file_path))
+            if file_path.lower().endswith(ZIP_STORED_SUFFIXES):
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = compression
+
+            with open(file_path, 'rb') as in_file, zip_file.open(info, 'w') as member:
+                while True:
+                    block = in_file.read(ZIP_READ_BYTES)
+                    if not block:
+                        break
+                    member.write(block)
+
+                    data = sink.drain()
+                    if data:
+                        yield data
+
+            yield sink.drain()
+
+    yield sink.drain()
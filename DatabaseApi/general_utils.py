@@ -12,10 +12,12 @@ from collections import defaultdict
 from datetime import date, timedelta, datetime
 import datetime
 from slitmask_queries import get_query
+from pgconn import execute_query
 from flask import request
-from gnuplot5 import *
 
 import mask_constants as consts
+from metrics_utils import timer, QUERY_SECONDS, QUERY_ROWS, QUERY_ERRORS, \
+    HTTP_SECONDS, TOOL_SECONDS
 
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
@@ -44,7 +46,12 @@ def start_up(app_path, config_name='catalog_config.ini'):
     except KeyError:
         log_dir = f'{app_path}/log'
 
-    log = log_fun.configure_logger(log_dir)
+    log = log_fun.configure_logger(
+        log_dir,
+        retention_days=config.getint('logging', 'retention_days',
+                                     fallback=log_fun.LOG_RETENTION_DAYS),
+        json_format=config.getboolean('logging', 'json', fallback=False)
+    )
 
     log.info("Starting SlitMask Database Flask Server.")
     log.info(config_msg)
@@ -57,7 +64,8 @@ def get_userinfo(obs_info):
 
     # Suppress the InsecureRequestWarning from urllib3 (www3build has old certificate)
     requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-    response = requests.get(obs_info['cookie_url'], cookies=cooked, verify=False)
+    with timer(HTTP_SECONDS, 'http', call='get_userinfo'):
+        response = requests.get(obs_info['cookie_url'], cookies=cooked, verify=False)
     userinfo = json.loads(response.content.decode('utf-8'))
 
     if 'Id' not in userinfo or 'Email' not in userinfo:
@@ -174,6 +182,33 @@ def get_observer_dict(curse, obs_info):
     return observer_table
 
 
+def attach_observers(curse, results, obs_info, id_key='despid'):
+    """
+    Add the observer information to each result as result['obs'],  the same
+    form as get_obs_by_maskid,  from one read of the observer table.
+
+    :param curse: <obj> the database cursor object.
+    :param results: <list> the query results with the observer ids.
+    :param obs_info: <dict> the schedule API url to query the keck observer table.
+    :param id_key: <str> the result key of the observer id (obid or keck id).
+
+    :return: <list> the results.
+    """
+    observer_table = get_observer_dict(curse, obs_info) or []
+
+    # the legacy obid and the keck id both find the observer
+    observers = {}
+    for observer in observer_table:
+        observers[observer.get('Id')] = observer
+        observers[observer.get('obid')] = observer
+
+    for result in results:
+        observer = observers.get(result.get(id_key))
+        result['obs'] = [observer] if observer else None
+
+    return results
+
+
 def get_obid_column(curse, obs_info):
     """
     Get a list the represents the OBID column from the combine mysql observer
@@ -214,17 +249,29 @@ def is_admin(user_info, log):
 
 def do_query(query_name, curse, query_params, query=None):
     log = log_fun.get_log()
+
+    # only the queries of slitmask_queries may run prepared
+    prepared_name = None
     if not query:
         query = get_query(query_name)
         if not query:
             return False
+        prepared_name = query_name
+
+    # queries built by the caller are timed together
+    label = query_name or 'adhoc'
 
     try:
-        curse.execute(query, query_params)
+        with timer(QUERY_SECONDS, 'db', query=label):
+            execute_query(curse, prepared_name, query, query_params)
     except Exception as err:
+        QUERY_ERRORS.inc(query=label)
         log.error(f"{query_name} failed, err: {err}")
         return False
 
+    if curse.rowcount > 0:
+        QUERY_ROWS.inc(curse.rowcount, query=label)
+
     return True
 
 
@@ -236,10 +283,31 @@ def get_dict_result(curse):
 
     :return: <dict> the database query results
     """
-    if not curse.description:
-        return []
+    return list(iter_dict_result(curse))
+
+
+def iter_dict_result(curse):
+    """
+    The results from the database cursor as python dicts,  one at a time.
+    From a server-side cursor (PgConn.get_stream_curse) the rows are fetched
+    itersize at a time,  so the results are never all in memory.
+
+    :param curse: <obj> the database cursor.
+
+    :return: <generator> the database query results
+    """
+    # a server-side cursor has no description until the first rows are fetched
+    if curse.name is None and not curse.description:
+        return
+
+    # the real dict cursors already return dicts
+    if isinstance(curse, psycopg2.extras.RealDictCursor):
+        yield from curse
+        return
+
     column_names = [desc[0] for desc in curse.description]
-    return [dict(zip(column_names, row)) for row in curse.fetchall()]
+    for row in curse:
+        yield dict(zip(column_names, row))
 
 
 def get_cfg(config, section, param_name):
@@ -360,7 +428,9 @@ def get_recent_day(request):
 
 def generate_svg_plot(user_info, info_results, slit_results, bluid):
 
-    # get the gnuplot functions
+    # get the gnuplot functions,  imported only by the plot routes
+    from gnuplot5 import Gnuplot5
+
     gnusvg = Gnuplot5()
 
     def draw_slit(color):
@@ -413,7 +483,8 @@ def generate_svg_plot(user_info, info_results, slit_results, bluid):
     # suppose that gnuplot is 5.4 and in the default path
     # use the gnuplot 5.4 input to create the SVG output
     # we are using subprocess.call even if we are python3
-    subprocess.call(['gnuplot', svgfn])
+    with timer(TOOL_SECONDS, 'tool', tool='gnuplot'):
+        subprocess.call(['gnuplot', svgfn])
 
     # the name of the output SVG plot file
     # the default pixel size of the SVG plot for use in HTML
@@ -424,6 +495,9 @@ def generate_svg_plot(user_info, info_results, slit_results, bluid):
 def get_keck_obs_info(obs_info, url_params=None):
     """
     Performs a an API query
+
+    :return: <list> the observers,  empty (not None) when none are found and
+             None on error.
     """
     log = log_fun.get_log()
 
@@ -431,16 +505,17 @@ def get_keck_obs_info(obs_info, url_params=None):
     if url_params:
         url += f"?{url_params}"
 
-    # Make a GET request to the API endpoint
-    response = requests.get(url, verify=False)
-
     try:
+        # Make a GET request to the API endpoint
+        with timer(HTTP_SECONDS, 'http', call='get_keck_obs_info'):
+            response = requests.get(url, verify=False)
+
         observer_dict = response.json()
         if not observer_dict:
             log.warning(f'no observer found for {url_params} {observer_dict}')
-            return None
+            return observer_dict
     except Exception as err:
-        log.warning(f'error accessing url: {url}')
+        log.warning(f'error accessing url: {url}, {err}')
         return None
 
     return observer_dict
@@ -451,130 +526,268 @@ def get_keck_obs_info(obs_info, url_params=None):
 ################################################################################
 
 
+class RowFormatter:
+    """
+    A new_keys_map compiled into a plan:  the (original key, new key,
+    converter) of each column,  with the converters decided once from the
+    column name and the type of the first row value,  not per value.
+
+        status   the STATUS_STR name
+        millseq  'UNK' when not set
+        dates    datetime values as YYYY-MM-DD
+
+    The plan is built from the first row,  a row missing one of its keys is
+    formatted on its own (the missing keys are skipped).
+    """
+    def __init__(self, new_keys_map):
+        # a repeated key is only output once
+        self.keys_map = list(OrderedDict.fromkeys(new_keys_map))
+        self.header = list(OrderedDict.fromkeys(new_key for _, new_key in self.keys_map))
+
+    def plan(self, row):
+        """
+        :param row: <dict> a result row.
+
+        :return: <tuple> the (original key, new key, converter or None) of
+                 the columns in the row.
+        """
+        plan = []
+        for orig_key, new_key in self.keys_map:
+            # skip key if not found to avoid causing an error
+            if orig_key not in row:
+                continue
+            plan.append((orig_key, new_key, column_converter(orig_key, row[orig_key])))
+
+        return tuple(plan)
+
+    def __call__(self, results):
+        """
+        :param results: <list> the result rows.
+
+        :return: <list> the rows as dicts of the new keys,  in the map order.
+        """
+        if not results:
+            return []
+
+        format_row = row_function(self.plan(results[0]))
+        new_results = []
+        for row in results:
+            try:
+                new_results.append(format_row(row))
+            except KeyError:
+                new_results.append(row_function(self.plan(row))(row))
+
+        return new_results
+
+    def tuples(self, results, columns=None):
+        """
+        The rows as tuples,  for the writers of fixed columns (files,  CSV).
+
+        :param results: <list> the result rows.
+        :param columns: <list> optional,  the new keys output,  default all.
+
+        :return: <list, list> the new keys and the row tuples,  a value
+                 missing from a row is None.
+        """
+        columns = columns or self.header
+        wanted = set(columns)
+
+        # the first original key of each new key
+        plan = {}
+        sample = results[0] if results else {}
+        for orig_key, new_key in self.keys_map:
+            if new_key in wanted and new_key not in plan:
+                plan[new_key] = (orig_key, column_converter(orig_key, sample.get(orig_key)))
+
+        plan = [plan.get(new_key, (None, None)) for new_key in columns]
+        rows = []
+        for row in results:
+            values = []
+            for orig_key, conv in plan:
+                val = row.get(orig_key)
+                values.append(conv(val) if conv else val)
+            rows.append(tuple(values))
+
+        return columns, rows
+
+
+def row_function(plan):
+    """
+    The plan as one function building the new row in a single dict
+    comprehension,  in the plan order.
+
+    :param plan: <tuple> the (original key, new key, converter) of the columns.
+
+    :return: <function> the row formatter.
+    """
+    def format_row(row):
+        return {new_key: conv(row[orig_key]) if conv else row[orig_key]
+                for orig_key, new_key, conv in plan}
+
+    return format_row
+
+
+def column_converter(orig_key, sample):
+    """
+    :param orig_key: <str> the original column key.
+    :param sample: <obj> a value of the column,  used for its type.
+
+    :return: <function> the converter of the column values,  None to keep them.
+    """
+    if 'status' in orig_key:
+        # UNKNOWN should not exist in the new database (post 2024)
+        return consts.STATUS_STR.__getitem__
+    if 'millseq' in orig_key:
+        return _millseq_str
+    if isinstance(sample, datetime.datetime):
+        return _date_str
+    if sample is None:
+        # the type is not known from a NULL,  check each value
+        return _maybe_date_str
+
+    return None
+
+
+def _millseq_str(val):
+    return val or 'UNK'
+
+
+def _date_str(val):
+    # the same YYYY-MM-DD as format_date,  without parsing the format
+    return val.date().isoformat() if val is not None else None
+
+
+def _maybe_date_str(val):
+    return val.date().isoformat() if isinstance(val, datetime.datetime) else val
+
+
+# the columns of the user interface tables,  named and ordered
+MASK_DESIGN_FORMAT = RowFormatter([
+    ('instrume', 'Instrument'), ('desname', 'Design-Name'),
+    ('projname', 'Project-Name'), ('ra_pnt', 'RA'), ('dec_pnt', 'DEC'),
+    ('equinpnt', 'Equinox'), ('lst_pnt', 'LST-Observation'),
+    ('pa_pnt', 'Postion-Angle'), ('radepnt', 'Coord-Representation'),
+    ('date_pnt', 'Date-Observation'), ('desdate', 'Design-Date'),
+    ('date_pnt', 'Date-Observation'), ('desnslit', 'Design-Number-Slits'),
+    ('desnobj', 'Design-Object-Number'), ('descreat', 'Design-Creation'),
+    ('desid', 'Design-ID'), ('masktype', 'Mask-Type'), ('despid', 'User-Id-Design'),
+])
+
+MILL_QUEUE_FORMAT = RowFormatter([
+    ('desid', 'Design-ID'), ('bluid', 'Blue-ID'),
+    ('guiname', 'Mask-Name'), ('desname', 'Design-Name'),
+    ('desnslit', 'Number-Slits'), ('instrume', 'Instrument'),
+    ('status', 'Status'), ('millseq', 'Mill-Sequence'),
+    ('date_use', 'Use-Date'), ('stamp', 'Submitted')
+])
+
+INVENTORY_FORMAT = RowFormatter([
+    ('status', 'Status'), ('desdate', 'Design-Date'),
+    ('date_use', 'Date-Use'), ('stamp', 'Submitted'),
+    ('projname', 'Project-Name'), ('guiname', 'Mask-Name'),
+    ('desname', 'Design-Name'),
+    ('desnslit', 'Number-Slits'), ('instrume', 'Instrument'),
+    ('ra_pnt', 'RA'), ('dec_pnt', 'DEC'), ('radepnt', 'Coordinates'),
+    ('equinpnt', 'Equinox'), ('pa_pnt', 'Position Angle'),
+    ('date_pnt', 'Observation Date'), ('masktype', 'Mask-Type'),
+    ('descreat', 'Design-Software'), ('desid', 'Design-ID'),
+    ('despid', 'Design-PI-ID')
+])
+
+CAL_INVENTORY_FORMAT = RowFormatter([
+    ('maskid', 'Mask-ID'), ('guiname', 'Name'), ('bluname', 'Blueprint-Name'),
+    ('bluid', 'Blue-ID'), ('date_use', 'Date-Use'),
+    ('milldate', 'Scanned'), ('instrume', 'Instrument'),
+    ('instrume', 'Instrument'), ('desid', 'Design-ID')
+])
+
+SEARCH_RESULTS_FORMAT = RowFormatter([
+    ('status', 'Status'), ('desdate', 'Design-Date'), ('desid', 'Design-ID'),
+    ('desname', 'Design-Name'), ('guiname', 'GUI-Name'),
+    ('projname', 'Project-Name'), ('ra_pnt', 'RA'), ('instrume', 'Instrument'),
+    ('dec_pnt', 'Declination'),
+    ('radepnt', 'System'), ('keckid', 'Keck-ID'), ('firstnm', 'First-Name'),
+    ('lastnm', 'Last-Name'), ('email', 'Email'), ('institution', 'Institution'),
+    ('stamp', 'Submitted'), ('millseq', 'Seq'),
+])
+
+TIMELINE_FORMAT = RowFormatter([
+    ('status', 'Status'), ('date_use', 'Obs Date'), ('ndays', 'Days-Notice'),
+    ('desname', 'DesName'), ('guiname', 'GUIName'), ('desid', 'Design-ID'),
+    ('bluid', 'Blue-ID'), ('desnslit', 'Nslits'), ('desnslit', 'Nslits'),
+    ('instrume', 'Inst'), ('stamp', 'Submitted'), ('millseq', 'Seq'),
+    ('milldate', 'Scanned')
+])
+
+SCANNED_BARCODES_FORMAT = RowFormatter([
+    ('status', 'Status'), ('maskid', 'Barcode'), ('milldate', 'Scanned'),
+    ('guiname', 'GUIName'), ('millseq', 'Seq'),  ('desname', 'Design-Name'),
+    ('desid', 'Design-ID'), ('bluid', 'Blue-ID'), ('desnslit', 'Nslits'),
+    ('instrume', 'Inst'), ('date_use', 'Use_Date')
+])
+
+ACTIVE_MASKS_FORMAT = RowFormatter([
+    ('maskid', 'Barcode'), ('guiname', 'GUI-Name'), ('millseq', 'Seq'),
+    ('date_use', 'Date-Use'),  ('status', 'Status'), ('instrume', 'Inst'),
+    ('FirstName', 'First-Name'), ('LastName', 'Last-Name'), ('Email', 'Email')
+])
+
+
 def order_mask_design(results):
     """
     Order and rename result columns to format for the user interface.
     """
-    new_keys_map = [
-        ('instrume', 'Instrument'), ('desname', 'Design-Name'),
-        ('projname', 'Project-Name'), ('ra_pnt', 'RA'), ('dec_pnt', 'DEC'),
-        ('equinpnt', 'Equinox'), ('lst_pnt', 'LST-Observation'),
-        ('pa_pnt', 'Postion-Angle'), ('radepnt', 'Coord-Representation'),
-        ('date_pnt', 'Date-Observation'), ('desdate', 'Design-Date'),
-        ('date_pnt', 'Date-Observation'), ('desnslit', 'Design-Number-Slits'),
-        ('desnobj', 'Design-Object-Number'), ('descreat', 'Design-Creation'),
-        ('desid', 'Design-ID'), ('masktype', 'Mask-Type'), ('despid', 'User-Id-Design'),
-    ]
-
-    return OrderedDict((new_key, results[orig_key]) for orig_key, new_key in new_keys_map)
+    return OrderedDict((new_key, results[orig_key])
+                       for orig_key, new_key in MASK_DESIGN_FORMAT.keys_map)
 
 
 def order_mill_queue(results):
     """
     Order and rename result columns to format for the user interface.
     """
-    new_keys_map = [
-        ('desid', 'Design-ID'), ('bluid', 'Blue-ID'),
-        ('guiname', 'Mask-Name'), ('desname', 'Design-Name'),
-        ('desnslit', 'Number-Slits'), ('instrume', 'Instrument'),
-        ('status', 'Status'), ('millseq', 'Mill-Sequence'),
-        ('date_use', 'Use-Date'), ('stamp', 'Submitted')
-    ]
-
-    return rename_keys(results, new_keys_map)
+    return MILL_QUEUE_FORMAT(results)
 
 
 def order_inventory(results):
     """
     Order and rename result columns to format for the user interface.
     """
-    new_keys_map = [
-        ('status', 'Status'), ('desdate', 'Design-Date'),
-        ('date_use', 'Date-Use'), ('stamp', 'Submitted'),
-        ('projname', 'Project-Name'), ('guiname', 'Mask-Name'),
-        ('desname', 'Design-Name'),
-        ('desnslit', 'Number-Slits'), ('instrume', 'Instrument'),
-        ('ra_pnt', 'RA'), ('dec_pnt', 'DEC'), ('radepnt', 'Coordinates'),
-        ('equinpnt', 'Equinox'), ('pa_pnt', 'Position Angle'),
-        ('date_pnt', 'Observation Date'), ('masktype', 'Mask-Type'),
-        ('descreat', 'Design-Software'), ('desid', 'Design-ID'),
-        ('despid', 'Design-PI-ID')
-    ]
-
-    return rename_keys(results, new_keys_map)
+    return INVENTORY_FORMAT(results)
 
 
 def order_cal_inventory(results):
     """
     Order and rename result columns to format for the user interface.
     """
-    new_keys_map = [
-        ('maskid', 'Mask-ID'), ('guiname', 'Name'), ('bluname', 'Blueprint-Name'),
-        ('bluid', 'Blue-ID'), ('date_use', 'Date-Use'),
-        ('milldate', 'Scanned'), ('instrume', 'Instrument'),
-        ('instrume', 'Instrument'), ('desid', 'Design-ID')
-    ]
-
-    return rename_keys(results, new_keys_map)
+    return CAL_INVENTORY_FORMAT(results)
 
 
 def order_search_results(results):
     """
     Order and rename result columns to format for the user interface.
     """
-    new_keys_map = [
-        ('status', 'Status'), ('desdate', 'Design-Date'), ('desid', 'Design-ID'),
-        ('desname', 'Design-Name'), ('guiname', 'GUI-Name'),
-        ('projname', 'Project-Name'), ('ra_pnt', 'RA'), ('instrume', 'Instrument'),
-        ('dec_pnt', 'Declination'),
-        ('radepnt', 'System'), ('keckid', 'Keck-ID'), ('firstnm', 'First-Name'),
-        ('lastnm', 'Last-Name'), ('email', 'Email'), ('institution', 'Institution'),
-        ('stamp', 'Submitted'), ('millseq', 'Seq'),
-    ]
-
-    return rename_keys(results, new_keys_map)
+    return SEARCH_RESULTS_FORMAT(results)
 
 
 def order_timeline_results(results):
     """
     Order and rename result columns to format for the user interface.
     """
-    new_keys_map = [
-        ('status', 'Status'), ('date_use', 'Obs Date'), ('ndays', 'Days-Notice'),
-        ('desname', 'DesName'), ('guiname', 'GUIName'), ('desid', 'Design-ID'),
-        ('bluid', 'Blue-ID'), ('desnslit', 'Nslits'), ('desnslit', 'Nslits'),
-        ('instrume', 'Inst'), ('stamp', 'Submitted'), ('millseq', 'Seq'),
-        ('milldate', 'Scanned')
-    ]
-
-    return rename_keys(results, new_keys_map)
+    return TIMELINE_FORMAT(results)
 
 
 def order_scanned_barcodes(results):
     """
     Order and rename result columns to format for the user interface.
     """
-    new_keys_map = [
-        ('status', 'Status'), ('maskid', 'Barcode'), ('milldate', 'Scanned'),
-        ('guiname', 'GUIName'), ('millseq', 'Seq'),  ('desname', 'Design-Name'),
-        ('desid', 'Design-ID'), ('bluid', 'Blue-ID'), ('desnslit', 'Nslits'),
-        ('instrume', 'Inst'), ('date_use', 'Use_Date')
-    ]
-
-    return rename_keys(results, new_keys_map)
+    return SCANNED_BARCODES_FORMAT(results)
 
 
 def order_active_masks(results):
     """
     Order and rename result columns to format for the user interface.
     """
-    new_keys_map = [
-        ('maskid', 'Barcode'), ('guiname', 'GUI-Name'), ('millseq', 'Seq'),
-        ('date_use', 'Date-Use'),  ('status', 'Status'), ('instrume', 'Inst'),
-        ('FirstName', 'First-Name'), ('LastName', 'Last-Name'), ('Email', 'Email')
-    ]
-
-    return rename_keys(results, new_keys_map)
+    return ACTIVE_MASKS_FORMAT(results)
 
 
 def rename_keys(results, new_keys_map):
@@ -582,27 +795,40 @@ def rename_keys(results, new_keys_map):
     Rename the keys for the display on the html/js side.  Dates will be changed
     to more readable (and sortable) form:  YYYY-MM-DD.
     """
-    new_results = []
-    for result in results:
-        new_result = OrderedDict()
-        for orig_key, new_key in new_keys_map:
-            # skip key if not found to avoid causing an error
-            if orig_key not in result:
-                continue
-            val = result[orig_key]
-            if isinstance(val, datetime.datetime):
-                val = format_date(val)
-            if 'status' in orig_key:
-                # UNKNOWN should not exist in the new database (post 2024)
-                val = consts.STATUS_STR[val]
-            if 'millseq' in orig_key and not val:
-                val = 'UNK'
+    return RowFormatter(new_keys_map)(results)
+
+
+def sexagesimal(value, precision=3, hours=False):
+    """
+    Format an angle as [+-]DD:MM:SS.sss,  or as HH:MM:SS.sss with hours.
+
+    :param value: <float> the angle in degrees.
+    :param precision: <int> the decimals of the seconds.
+    :param hours: <bool> True to format in hours (RA).
+
+    :return: <str> the sexagesimal string.
+    """
+    if hours:
+        value = (value % 360.0) / 15.0
+
+    sign = '-' if value < 0 else '+'
+
+    # round once in the last decimal so the seconds never read 60
+    scale = 10 ** precision
+    total = round(abs(value) * 3600 * scale)
+    whole, frac = divmod(total, 3600 * scale)
+    minutes, seconds = divmod(frac, 60 * scale)
+    if hours:
+        whole %= 24
 
-            new_result[new_key] = val
+    sec_str = f'{seconds // scale:02d}'
+    if precision > 0:
+        sec_str += f'.{seconds % scale:0{precision}d}'
 
-        new_results.append(new_result)
+    if hours:
+        return f'{whole:02d}:{minutes:02d}:{sec_str}'
 
-    return new_results
+    return f'{sign}{whole:02d}:{minutes:02d}:{sec_str}'
 
 
 def format_date(val):
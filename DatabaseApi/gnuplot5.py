@@ -2,6 +2,7 @@ import re
 import os
 import datetime
 import tempfile
+import threading
 
 # this file is only partly translated
 # it began as procedural Tcl
@@ -68,7 +69,8 @@ class Gnuplot5():
 
         self.froot = froot
 
-        self.fname = f"{froot}{isodt}p{pid}"
+        # the thread as well,  the worker threads plot the same mask at once
+        self.fname = f"{froot}{isodt}p{pid}t{threading.get_ident()}"
 
         # assume POSIX, not bothering with os.path.join
         self.gpfn = f"{self.TmpPlotCmdDir}/{self.fname}.gnup"
@@ -0,0 +1,81 @@
+"""
+The gunicorn settings of the API,  start with api_manager.sh or:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app and its config are loaded once in the master (preload_app) and the
+workers are forked from it.  The master handles the signals:
+
+    HUP   - start new workers with the re-read config file and stop the old
+            ones once their requests finish,  no connection is dropped.
+    USR2  - start a new master with the new code,  then QUIT the old master.
+    TERM  - graceful shutdown within graceful_timeout.
+
+The workers are recycled after max_requests (with jitter) to bound memory.
+The sizing can be overridden in the [server] section of the config file.
+"""
+import os
+import configparser
+
+API_PATH = os.path.abspath(os.path.dirname(__file__))
+CONFIG_FILE = os.environ.get('SLITMASK_CONFIG', 'slitmask_cfg.live.ini')
+
+_config = configparser.ConfigParser()
+_config.read(os.path.join(API_PATH, CONFIG_FILE))
+
+chdir = API_PATH
+wsgi_app = 'wsgi:app'
+preload_app = True
+
+bind = f"0.0.0.0:{_config.get('api_parameters', 'port', fallback='5000') or '5000'}"
+pidfile = _config.get('server', 'pidfile', fallback=os.path.join(API_PATH, 'gunicorn.pid'))
+
+# the requests wait on the database and the Tcl/C tools,  threads per worker
+worker_class = 'gthread'
+workers = _config.getint('server', 'workers', fallback=4)
+threads = _config.getint('server', 'threads', fallback=4)
+
+max_requests = _config.getint('server', 'max_requests', fallback=1000)
+max_requests_jitter = max(max_requests // 10, 1)
+
+# the ingest and the mill file generation can run for minutes
+timeout = _config.getint('server', 'timeout', fallback=300)
+graceful_timeout = _config.getint('server', 'graceful_timeout', fallback=60)
+keepalive = 5
+
+# the directory the workers share their metrics in,  see metrics_utils
+METRICS_DIR = _config.get('metrics', 'multiproc_dir', fallback='')
+
+
+def on_starting(server):
+    """
+    Remove the metrics of the previous server.
+    """
+    if METRICS_DIR:
+        import metrics_utils
+        metrics_utils.clear_worker_metrics(METRICS_DIR)
+
+
+def post_fork(server, worker):
+    """
+    Restart the log writer and start the background threads in the worker,
+    threads do not survive the fork.  The config file is read again into
+    the preloaded app so a HUP picks up the changes.
+    """
+    import logger_utils
+    import slitmask_api
+
+    logger_utils.after_fork()
+
+    app = server.app.wsgi()
+    slitmask_api.configure_app(app, CONFIG_FILE)
+    slitmask_api.start_background(app)
+
+
+def child_exit(server, worker):
+    """
+    Keep the metrics of the exited worker in the sums.
+    """
+    if METRICS_DIR:
+        import metrics_utils
+        metrics_utils.archive_worker(METRICS_DIR, worker.pid)
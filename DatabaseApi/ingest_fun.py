@@ -10,8 +10,11 @@ import logger_utils as log_fun
 import validate_utils as valid_utils
 from mask_validation import MaskValidation
 from general_utils import commitOrRollback
+from apiutils import record_mask_event
+from mask_constants import EVENT_INGESTED
+from metrics_utils import timer, TOOL_SECONDS
 
-from mdf_content import mdfcontent
+from mdf_content import mdfschema, ERROR
 from slitmask_queries import get_query
 from mask_insert import MaskInsert
 
@@ -36,19 +39,23 @@ class mdf2dbmaps:
     each map is stored as a dictionary
     """
 
-    # this map is to the ObId in ucolick Sybase
-    # Keck will want to create a map to their KeckId
-    obid = {}
-    desid = {}
-    bluid = {}
-    dslitid = {}
-    bslitid = {}
-    objectid = {}
-
     # Keck 1 is 2, Keck 2 is 1 because DEIMOS defined the MDF scheme
     # and LRIS was added later into the MDF scheme
     teleid = {'Keck I': 2, 'Keck II': 1}
 
+    def __init__(self):
+        # the maps belong to one ingest,  a class attribute would be shared
+        # by the ingests of all the requests
+
+        # this map is to the ObId in ucolick Sybase
+        # Keck will want to create a map to their KeckId
+        self.obid = {}
+        self.desid = {}
+        self.bluid = {}
+        self.dslitid = {}
+        self.bslitid = {}
+        self.objectid = {}
+
 
 ########################################################################
 
@@ -58,6 +65,8 @@ class mdf2dbmaps:
 class IngestFun:
     def __init__(self, user_info, db, obs_info):
         self.maps = mdf2dbmaps()
+        # the structure issues (mdfIssue) of the last MDF validated
+        self.issues = []
         self.user_info = user_info
         self.obs_info = obs_info
         self.log = log_fun.get_log()
@@ -69,6 +78,9 @@ class IngestFun:
     def get_maps(self):
         return self.maps
 
+    def get_issues(self):
+        return self.issues
+
     def validate_mdf_content(self, hdul):
         """
         hdul,   # HDU list from opening a FITS file
@@ -86,8 +98,6 @@ class IngestFun:
         if not valid:
             return False, err_report
 
-        self.maps = valid_utils.set_design_pid(self.db, hdul, self.maps, self.obs_info)
-
         ####################################################################
         # MASK BLUE
 
@@ -96,7 +106,8 @@ class IngestFun:
         if not valid:
             return False, err_report
 
-        self.maps = valid_utils.set_blue_pid(self.db, hdul, self.maps, self.obs_info)
+        # the design author and blueprint observer ids,  in one lookup
+        self.maps = valid_utils.set_owner_pids(self.db, hdul, self.maps, self.obs_info)
 
         ####################################################################
 
@@ -141,53 +152,23 @@ class IngestFun:
         ascertain whether it is a multi-HDU FITS mask description file (MDF)
         ascertain whether the data in the MDF satisfy all validity rules
         """
-        missing = []
-
-        # does this FITS file contain all known HDUs?
-        for hdu in mdfcontent.keys():
-            if hdu not in hdul:
-                missing.append(f"Did not find HDU {hdu}")
-
-        if missing:
-            missing.append(f"MDF cannot be ingested, it is missing tables:")
-            return False, missing
-
-        hdu_report = []
-
-        # loop over all HDUs in this FITS file
-        for hdu in hdul:
-            msg = None
-            if isinstance(hdu, fits.PrimaryHDU):
-                pass
-            elif hdu.name not in mdfcontent:
-                # not an error, but surprising if extra HDUs exist
-                msg = f"unexpected EXTNAME {hdu.name}"
-            elif type(hdu) not in mdfcontent[hdu.name].hdutypes:
-                msg = f"hdutype {type(hdu)} for EXTNAME {hdu.name} " \
-                      f"mdfcontent[hdu.name].hdutypes {mdfcontent[hdu.name].hdutypes}" \
-                      f"wrong hdutype {type(hdu).__name__} for EXTNAME {hdu.name}"
-
-            if msg:
-                hdu_report.append(msg)
-                self.log.warning(msg)
-
-        if hdu_report:
-            msg = f"There is an issue(s) with the MDF HDUs."
-            msg += "\n".join([f"* {item}" for item in hdu_report])
-            self.log.error(msg)
-            return False, hdu_report
-
-        badtables = None
-        # loop over all FITS HDUs that we expect in a MDF
-        for extname in mdfcontent.keys():
-            # does the table structure of this HDU match our expectations?
-            badtables = valid_utils.valTableExt(hdul, extname)
+        # the structure of all the tables,  from their headers only
+        issues = mdfschema.validate(hdul)
+        self.issues = issues
+
+        errors = []
+        for issue in issues:
+            if issue.level == ERROR:
+                errors.append(str(issue))
+            else:
+                self.log.warning(issue.msg)
 
-        if badtables:
+        if errors:
             msg = f"The MDF file has malformed tables."
-            msg += "\n".join([f"* {item}" for item in badtables])
+            msg += "\n".join([f"* {item}" for item in errors])
             self.log.error(msg)
-            return False, badtables
+            errors.append("MDF cannot be ingested,  the table structure is invalid.")
+            return False, errors
 
         # validate the content
         status, err_report = self.validate_mdf_content(hdul)
@@ -208,6 +189,9 @@ class IngestFun:
         validate the structure and content of the file
         insert data from its FITS tables into the database
         """
+        # the maps of this MDF only
+        self.maps = mdf2dbmaps()
+
         # open the FITS file
         try:
             hdul = fits.open(file)
@@ -360,9 +344,22 @@ class IngestFun:
         ####################
 
         if len(err_report) != 0:
+            # nothing of a failed MDF is kept
+            self.db.get_conn().rollback()
             err_report.append(f"We have errors before ingesting!")
             return False, err_report
 
+        # the ingest event is the last statement of the transaction
+        if not record_mask_event(self.db.cursor, EVENT_INGESTED,
+                                 blue_ids=list(self.maps.bluid.values()),
+                                 detail=insert.guiname):
+            self.db.get_conn().rollback()
+            err_report.append(f"The ingest event could not be recorded,  the "
+                              f"mask was not stored in the database!")
+            self.log.error(f"ingest event not recorded for {insert.guiname}")
+            hdul.close()
+            return False, err_report
+
         committed, message = commitOrRollback(self.db)
 
         if committed:
@@ -380,10 +377,6 @@ class IngestFun:
 
         ####################
 
-        # clear maps before we do next MDF
-        self.maps.obid.clear()
-        self.maps.desid.clear()
-
         hdul.close()
 
         return success, err_report
@@ -437,8 +430,9 @@ class IngestFun:
         lsc2df = "@RELDIR@/bin/maskpgtcl/lsc2df"
 
         # we are going to use subprocess.call even if we are python3
-        status = subprocess.call([lsc2df, f"{file3path} {email} {mdfname} {date_use}"],
-                                 stdout=STDOUT, stderr=STDERR)
+        with timer(TOOL_SECONDS, 'tool', tool='lsc2df'):
+            status = subprocess.call([lsc2df, f"{file3path} {email} {mdfname} {date_use}"],
+                                     stdout=STDOUT, stderr=STDERR)
 
         # make sure output gets flushed
         STDOUT.close()
@@ -1,8 +1,28 @@
+import os
+import copy
+import json
+import fcntl
+import queue
+import atexit
+import time
+import random
 import logging
+import threading
+
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
 SLITMASK_LOGNAME = 'slitmask_api'
 
+# the days of rotated log files kept
+LOG_RETENTION_DAYS = 30
+
+# the request id and sampling decision of the request in this thread
+_context = threading.local()
+
+# the background thread writing the queued records to the file and stream
+_listener = None
+
 
 def get_log():
     log_name = SLITMASK_LOGNAME
@@ -16,7 +36,151 @@ def get_log():
     return log
 
 
-def configure_logger(log_dir):
+def start_request_context(request_id, sample_rate=1.0):
+    """
+    Tag the records of this thread with the request id,  and decide whether
+    the info lines of the request are logged.
+
+    :param request_id: <str> the request id.
+    :param sample_rate: <float> the fraction of requests with info lines.
+    """
+    _context.request_id = request_id
+    _context.sampled = sample_rate >= 1.0 or random.random() < sample_rate
+
+
+def request_id():
+    """
+    :return: <str> the id of the request in this thread,  None outside one.
+    """
+    return getattr(_context, 'request_id', None)
+
+
+def end_request_context():
+    _context.request_id = None
+    _context.sampled = True
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Add the request id to the records and drop the info lines of the
+    requests not sampled,  the warnings and errors are always kept.
+    """
+    def filter(self, record):
+        record.request_id = request_id()
+        if record.levelno <= logging.INFO and not getattr(_context, 'sampled', True):
+            return False
+
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            line = f'{line} [{request_id}]'
+
+        duration = getattr(record, 'duration', None)
+        if duration is not None:
+            line = f'{line} ({duration:.3f}s)'
+
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line,  with the request id and the duration (s)
+    when the record has them.
+    """
+    def format(self, record):
+        entry = {
+            'time': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'func': record.funcName,
+            'message': record.getMessage(),
+        }
+
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+
+        duration = getattr(record, 'duration', None)
+        if duration is not None:
+            entry['duration'] = round(duration, 6)
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+
+        return json.dumps(entry, default=str)
+
+
+# formats the exceptions of the queued records
+_exc_formatter = logging.Formatter()
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Queue the records for the formatters of the listener.  The default
+    prepare formats the record here and drops the exception,  this one only
+    merges the message args and keeps the traceback as exc_text.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            # the text,  the traceback frames are not kept until written
+            record.exc_text = record.exc_text or _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+
+class SharedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """
+    A TimedRotatingFileHandler for several worker processes writing one
+    file.  The first process to roll over renames the file,  the others find
+    the dated file and reopen the new one instead of rotating again.
+    """
+    def doRollover(self):
+        lock_path = f'{self.baseFilename}.lock'
+        with open(lock_path, 'w') as lock_fp:
+            fcntl.flock(lock_fp, fcntl.LOCK_EX)
+
+            rollover_at = self.rolloverAt - self.interval
+            time_tuple = time.gmtime(rollover_at) if self.utc else time.localtime(rollover_at)
+            dated_path = self.rotation_filename(
+                f'{self.baseFilename}.{time.strftime(self.suffix, time_tuple)}'
+            )
+            if not os.path.exists(dated_path):
+                super().doRollover()
+                return
+
+            if self.stream:
+                self.stream.close()
+            self.stream = self._open()
+            self.rolloverAt = self.computeRollover(int(time.time()))
+
+
+def configure_logger(log_dir, retention_days=LOG_RETENTION_DAYS, json_format=False):
+    """
+    The API log.  The records are put on a queue and written to the file and
+    stream by a background thread,  so the requests do not wait on the log
+    I/O.  The file rotates at UTC midnight and the retention_days newest
+    files are kept.
+
+    :param log_dir: <str> the log directory.
+    :param retention_days: <int> the rotated files kept.
+    :param json_format: <bool> True to write JSON records,  text otherwise.
+
+    :return: <Logger> the log.
+    """
+    global _listener
+
     log_name = SLITMASK_LOGNAME
 
     # get the log if already exists
@@ -24,23 +188,60 @@ def configure_logger(log_dir):
     if log.handlers:
         return log
 
-    # append the date for the log
-    utd = datetime.utcnow().strftime('%Y%m%d')
-
     # set-up the logger
-    log_path = f'{log_dir}/{log_name}_{utd}.log'
+    log_path = f'{log_dir}/{log_name}.log'
     log.setLevel(logging.INFO)
 
-    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(funcName)s - %(message)s')
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = TextFormatter('%(asctime)s [%(levelname)s] %(funcName)s - %(message)s')
 
-    file_handler = logging.FileHandler(log_path)
+    file_handler = SharedTimedRotatingFileHandler(log_path, when='midnight', utc=True,
+                                                  backupCount=retention_days)
     file_handler.setFormatter(formatter)
-    log.addHandler(file_handler)
 
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
-    log.addHandler(stream_handler)
+
+    queue_handler = RecordQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RequestContextFilter())
+    log.addHandler(queue_handler)
+
+    _listener = QueueListener(queue_handler.queue, file_handler, stream_handler)
+    _listener.start()
+    atexit.register(stop_logger)
 
     log.info("Starting SlitMask Database Flask Server.")
 
     return log
+
+
+def after_fork():
+    """
+    Restart the writer thread in a forked worker,  with a new queue as the
+    thread and the queue lock of the parent are not usable in the child.
+    """
+    global _listener
+
+    if not _listener:
+        return
+
+    log = logging.getLogger(SLITMASK_LOGNAME)
+    for handler in log.handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue = queue.SimpleQueue()
+            _listener = QueueListener(handler.queue, *_listener.handlers)
+            _listener.start()
+            return
+
+
+def stop_logger():
+    """
+    Write the queued records and stop the writer thread.
+    """
+    global _listener
+
+    if _listener:
+        _listener.stop()
+        _listener = None
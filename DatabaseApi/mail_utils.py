@@ -0,0 +1,300 @@
+"""
+Mail delivery for the API.
+
+SmtpSession sends a rendered message to many recipients over one SMTP
+connection,  reconnecting and retrying with backoff on failures.
+
+MailOutbox is a spool directory of queued messages,  the routes enqueue
+and return,  a background MailSender delivers the spool.
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import smtplib
+import threading
+
+from email.utils import formatdate
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+import logger_utils as log_fun
+
+
+def render_message(mail_from, subject, html_msg):
+    """
+    Render a message once,  without the To header which is added for each
+    recipient by SmtpSession.send.
+
+    :param mail_from: <str> the sender address.
+    :param subject: <str> the email subject.
+    :param html_msg: <str> the html body.
+
+    :return: <str> the rendered message.
+    """
+    msg = MIMEMultipart()
+    msg['From'] = mail_from
+    msg['Date'] = formatdate(localtime=True)
+    msg['Subject'] = subject
+
+    msg.attach(MIMEText(html_msg, 'html'))
+
+    return msg.as_string()
+
+
+class SmtpSession:
+    """
+    One SMTP connection reused for all the recipients,  use as a context
+    manager.  A dropped connection is re-opened and the recipient retried
+    with an exponential backoff.
+
+    The email scripts (Scripts/email_utils.py) send with it too,  with their
+    own log.
+    """
+    def __init__(self, server, retries=3, backoff=2.0, timeout=30, log=None):
+        self.server = server
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.smtp = None
+        self.log = log or log_fun.get_log()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def connect(self):
+        self.close()
+        self.smtp = smtplib.SMTP(self.server, timeout=self.timeout)
+
+    def close(self):
+        if not self.smtp:
+            return
+
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+        self.smtp = None
+
+    def send(self, mail_from, to_list, rendered_msg):
+        """
+        Send a rendered message to each recipient.
+
+        :param mail_from: <str> the sender address.
+        :param to_list: <list> the recipient addresses.
+        :param rendered_msg: <str> the message from render_message.
+
+        :return: <list, list> the recipients which could not be sent to,
+                 and the recipients refused by the server (not retried).
+        """
+        failed = []
+        refused = []
+        for email_address in to_list:
+            msg = f"To: {email_address}\n{rendered_msg}"
+            try:
+                self.sendmail(mail_from, email_address, msg)
+                self.log.info(f"Email sent to: {email_address}")
+            except smtplib.SMTPRecipientsRefused as err:
+                self.log.warning(f"Email to {email_address} refused: {err}")
+                refused.append(email_address)
+            except (smtplib.SMTPException, OSError) as err:
+                self.log.warning(f"Error sending Email to {email_address}: {err}")
+                failed.append(email_address)
+
+        return failed, refused
+
+    def sendmail(self, mail_from, mail_to, msg):
+        """
+        Send a complete message,  retried on a dropped connection.
+
+        :param mail_from: <str> the sender address.
+        :param mail_to: <str> the recipient address.
+        :param msg: <str> the message with its headers.
+
+        :raises: the SMTP error of the last attempt,  a refused recipient is
+                 not retried.
+        """
+        for attempt in range(self.retries):
+            try:
+                if not self.smtp:
+                    self.connect()
+                self.smtp.sendmail(mail_from, mail_to, msg)
+                return
+            except smtplib.SMTPRecipientsRefused:
+                raise
+            except (smtplib.SMTPException, OSError) as err:
+                self.close()
+                if attempt + 1 == self.retries:
+                    raise
+                self.log.warning(f"Error sending Email to {mail_to}, "
+                                 f"attempt {attempt + 1}: {err}")
+                time.sleep(self.backoff * 2 ** attempt)
+
+
+class MailOutbox:
+    """
+    The spool directory of the queued messages,  one JSON file per message.
+    Messages which could not be delivered after max_attempts are moved to
+    the failed/ sub-directory.
+    """
+    def __init__(self, spool_dir, server, max_attempts=8, backoff=60):
+        self.spool_dir = spool_dir
+        self.failed_dir = os.path.join(spool_dir, 'failed')
+        self.lock_path = os.path.join(spool_dir, '.lock')
+        self.server = server
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.wakeup = threading.Event()
+        self.log = log_fun.get_log()
+
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+    def enqueue(self, mail_from, to_list, subject, html_msg):
+        """
+        Queue a message,  it is rendered now and sent by the MailSender.
+
+        :param mail_from: <str> the sender address.
+        :param to_list: <list> the recipient addresses.
+        :param subject: <str> the email subject.
+        :param html_msg: <str> the html body.
+        """
+        entry = {
+            'from': mail_from,
+            'to_list': list(to_list),
+            'subject': subject,
+            'message': render_message(mail_from, subject, html_msg),
+            'attempts': 0,
+            'next_try': 0,
+        }
+
+        name = f"{time.time_ns()}-{uuid.uuid4().hex}.json"
+        tmp_path = os.path.join(self.spool_dir, f".{name}.tmp")
+
+        # write then rename,  the sender never sees a partial file
+        with open(tmp_path, 'w') as fp:
+            json.dump(entry, fp)
+        os.replace(tmp_path, os.path.join(self.spool_dir, name))
+
+        self.log.info(f"Email queued to: {entry['to_list']}, subject: {subject}")
+        self.wakeup.set()
+
+    def deliver(self):
+        """
+        Send the messages which are due,  with one SMTP session.  Only one
+        process delivers the spool at a time.
+
+        :return: <int> the number of messages still queued.
+        """
+        with open(self.lock_path, 'w') as lock_fp:
+            try:
+                fcntl.flock(lock_fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return -1
+
+            names = sorted(name for name in os.listdir(self.spool_dir)
+                           if name.endswith('.json'))
+            if not names:
+                return 0
+
+            remaining = 0
+            with SmtpSession(self.server, retries=1) as session:
+                for name in names:
+                    if not self.deliver_one(session, os.path.join(self.spool_dir, name)):
+                        remaining += 1
+
+        return remaining
+
+    def deliver_one(self, session, entry_path):
+        """
+        :return: <bool> True if the entry is done (sent or failed).
+        """
+        try:
+            with open(entry_path) as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError) as err:
+            self.log.error(f"unreadable queued email {entry_path}: {err}")
+            os.replace(entry_path, os.path.join(self.failed_dir, os.path.basename(entry_path)))
+            return True
+
+        if entry['next_try'] > time.time():
+            return False
+
+        entry['to_list'], refused = session.send(entry['from'], entry['to_list'],
+                                                 entry['message'])
+        if refused:
+            # a refused address will not be accepted on a retry
+            self.log.error(f"Email refused for {refused}: {entry['subject']}")
+
+        if not entry['to_list']:
+            os.remove(entry_path)
+            return True
+
+        entry['attempts'] += 1
+        if entry['attempts'] >= self.max_attempts:
+            self.log.error(f"Email not sent to {entry['to_list']} after "
+                           f"{entry['attempts']} attempts: {entry['subject']}")
+            os.replace(entry_path, os.path.join(self.failed_dir, os.path.basename(entry_path)))
+            return True
+
+        entry['next_try'] = time.time() + self.backoff * 2 ** (entry['attempts'] - 1)
+
+        tmp_path = f"{entry_path}.tmp"
+        with open(tmp_path, 'w') as fp:
+            json.dump(entry, fp)
+        os.replace(tmp_path, entry_path)
+
+        return False
+
+
+class MailSender(threading.Thread):
+    """
+    Background thread delivering the outbox,  woken by enqueue or every
+    poll_interval seconds for the retries.
+    """
+    def __init__(self, mail_outbox, poll_interval=30):
+        super().__init__(name='slitmask-mail-sender', daemon=True)
+        self.outbox = mail_outbox
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.log = log_fun.get_log()
+
+    def stop(self):
+        self.stop_event.set()
+        self.outbox.wakeup.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.outbox.wakeup.wait(self.poll_interval)
+            self.outbox.wakeup.clear()
+
+            try:
+                self.outbox.deliver()
+            except Exception as err:
+                self.log.error(f"mail outbox delivery error: {err}")
+
+
+# the outbox of the API process,  None to send synchronously
+outbox = None
+
+
+def start_outbox(spool_dir, server):
+    """
+    Queue the API emails in the spool directory and start the sender.
+
+    :param spool_dir: <str> the spool directory.
+    :param server: <str> the SMTP server.
+
+    :return: <MailSender> the running thread.
+    """
+    global outbox
+    outbox = MailOutbox(spool_dir, server)
+
+    sender = MailSender(outbox)
+    sender.start()
+
+    return sender
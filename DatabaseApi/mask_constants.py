@@ -1,3 +1,4 @@
+import string
 
 from collections import defaultdict
 
@@ -24,6 +25,19 @@ STATUS_STR = defaultdict(
 # this is a time bomb in the DEIMOS and LRIS code
 PERPETUAL_DATE = '2035-01-01'
 
+# the /slitmask/batch-status targets:  (new status, clear millseq, notify owners)
+BATCH_TARGETS = {
+    'archive': (ARCHIVED, True, False),
+    'remill': (UNMILLED, True, True),
+    'ready': (READY, False, False),
+}
+
+# the maximum number of blueprints changed by one batch-status call
+BATCH_LIMIT = 500
+
+# masks with a use date older than this many months are archived by the purge
+ARCHIVE_AFTER_MONTHS = 6
+
 # define what recent number of days
 RECENT_NDAYS = 14
 
@@ -38,3 +52,71 @@ MILL_OVERDUE = 7
 # in the same fashion as Tcl code CGI/makeMill.sin
 # in the same fashion as Tcl code Tlib/notifyBadSlits
 TOOL_DIAMETER = 15
+
+# requests slower than this many seconds are logged with their phase breakdown
+SLOW_REQUEST_SECONDS = 2.0
+
+# the times a route may repeat a statement shape before it is an N+1 query
+QUERY_REPEAT_LIMIT = 10
+
+# seconds the API caches results,  only while the database change listener runs
+CACHE_TTL = 3600
+
+# the admin request profiler,  the profiles kept and the sampling interval (s)
+MAX_PROFILES = 50
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+# the mask event log (MaskEvents.EventType) read by the /slitmask/changes feed
+EVENT_INGESTED = 'ingested'
+EVENT_STATUS = 'status'
+EVENT_MILLED = 'milled'
+EVENT_ARCHIVED = 'archived'
+EVENT_DELETED = 'deleted'
+EVENT_USE_DATE = 'use_date'
+
+# advisory lock held by the event writers until commit (migrations/002)
+EVENT_LOCK_KEY = 8150
+
+# advisory lock (with the hash of the first GUINAME_PREFIX_LEN characters)
+# held by the GUIname allocation until the ingest commits
+GUINAME_LOCK_KEY = 8151
+
+# a GUIname in use is renamed to its first GUINAME_PREFIX_LEN characters
+# and one of the GUINAME_SUFFIXES
+GUINAME_PREFIX_LEN = 7
+GUINAME_SUFFIXES = string.ascii_letters + string.digits + "_:"
+
+# the maximum number of events returned by one /slitmask/changes call
+CHANGES_LIMIT = 1000
+
+# the height of the sky index dec zones (and width of the RA cells) in degrees
+SKY_ZONE_DEG = 0.5
+
+# the largest cone-search radius in arcmin
+CONE_MAX_RADIUS = 120
+
+# the admin search,  the estimated rows allowed without a limit and the
+# largest page
+SEARCH_MAX_ROWS = 2000
+SEARCH_MAX_LIMIT = 1000
+
+# the seconds an email resolved to an observer id is cached,  and an email
+# not found (a new observer may register meanwhile)
+EMAIL_CACHE_TTL = 600
+EMAIL_NEGATIVE_TTL = 60
+
+# the name suggestions,  the shortest text searched,  the default and the
+# largest number of names returned
+NAME_MIN_CHARS = 2
+NAME_SUGGEST_LIMIT = 10
+NAME_SUGGEST_MAX = 50
+
+# the exports,  the rows fetched from the server-side cursor at a time (one
+# chunk of the response),  and the default fixed format column width
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_COLUMN_WIDTH = 16
+
+# the zip downloads,  the bytes of a file read (and compressed) at a time,
+# and the files stored as they are already compressed
+ZIP_READ_BYTES = 64 * 1024
+ZIP_STORED_SUFFIXES = ('.gz', '.fz', '.zip', '.png', '.jpg')
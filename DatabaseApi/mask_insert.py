@@ -1,5 +1,6 @@
-import string
-from mask_constants import UNMILLED
+from mask_constants import UNMILLED, GUINAME_PREFIX_LEN, GUINAME_SUFFIXES
+from sky_index import sky_pixel
+from slitmask_queries import get_query
 
 ONLYONE = 0
 
@@ -57,7 +58,8 @@ class MaskInsert:
                 row['DATE_PNT'],
                 float(row['LST_PNT']),
                 # time_stamp (default)
-                self.user_email
+                self.user_email,
+                sky_pixel(row['RA_PNT'], row['DEC_PNT'])
             )
         except Exception as e:
             msg = f"Invalid Parameters: {e}"
@@ -183,6 +185,7 @@ class MaskInsert:
                   float(row['RadVel']),
                   float(row['MajAxis']),
                   row['ObjClass'],
+                  sky_pixel(row['RA_OBJ'], row['DEC_OBJ']),
                 )
             )
         except Exception as e:
@@ -307,6 +310,7 @@ class MaskInsert:
         okGUIname = GUIname.strip()
         okGUIwords = okGUIname.split()
         lenokGUI = len(okGUIwords)
+        newGUIname = okGUIname
         if lenokGUI == 0:
             msg = "MaskBlu.GUIname is empty"
             self.log.warning(msg)
@@ -315,8 +319,6 @@ class MaskInsert:
             self.log.warning(msg)
             # collapse whitespace
             newGUIname = ''.join(okGUIwords)
-        else:
-            newGUIname = GUIname
 
         # we require that  MaskBlu.GUIname be just printable ASCII
         # because KTL and the mill code generator only know that
@@ -326,58 +328,53 @@ class MaskInsert:
 
         # we require that MaskBlu.GUIname be unique in the database
         # originally performed by Tcl Tlib proc notifyDupNames
-        # strategy here is different than that code
-        # in order to economize on SQL calls
-        # replace final character of new GUIname with %
-        # select all existing GUIname like that
-        # Hope that not all possible final characters have
-        # already been used, and use one of those unused.
-        gnSelect = "SELECT GUIname FROM MaskBlu WHERE GUIname LIKE %s;"
+        # The candidates are the name itself,  then the first 7 characters
+        # with each possible final character.  allocate_gui_name takes the
+        # advisory locks of the candidates and returns the first one not
+        # in the database,  in one round trip.
+        # The locks are held until the ingest commits,  so a concurrent
+        # ingest waits and then sees the name allocated here.
+        candidates = [newGUIname]
+        candidates += [newGUIname[:GUINAME_PREFIX_LEN] + lastchar
+                       for lastchar in GUINAME_SUFFIXES
+                       if newGUIname[:GUINAME_PREFIX_LEN] + lastchar != newGUIname]
+
+        allocated = self.allocate_gui_name(candidates)
+        if not allocated:
+            return GUIname
+
+        if allocated != GUIname:
+            msg = f"we change MaskBlu.GUIname to {allocated} from {GUIname}"
+            self.log.warning(msg)
+            GUIname = allocated
+        # end if we changed GUIname
+
+        return GUIname
+
+    def allocate_gui_name(self, candidates):
+        """
+        Reserve the first candidate GUIname not in the database.
 
-        shortGUIname = newGUIname[:7]
-        shortGUIlike = newGUIname[:7] + "%"
+        :param candidates: <list> the GUInames in the order of preference.
 
+        :return: <str> the GUIname,  None if all are taken or on error,  the
+                 reason is added to the error report.
+        """
         try:
-            self.db.cursor.execute(gnSelect, (shortGUIlike,))
+            self.db.cursor.execute(get_query('guiname_allocate'),
+                                   (candidates, candidates))
+            result = self.db.cursor.fetchone()
         except Exception as e:
-            msg = f"gnSelect failed: {self.db.cursor.query}: exception {e}"
+            self.log_exception("GUIname Allocate", e)
+            return None
+
+        if not result:
+            msg = f"MaskBlu.GUIname {candidates[0]} and all its variants are " \
+                  f"in use,  choose another name."
             self.log.error(msg)
-        # end try gnSelect
-
-        # fetch one at a time and match using listyness
-        guinamelist = []
-        for resrow in self.db.cursor:
-            rowguiname = resrow['guiname'].strip()
-            if rowguiname not in guinamelist:
-                guinamelist.append(rowguiname)
-            else:
-                # this means that dups already exist in the database
-                self.log.error(f"GUIname '{rowguiname}' has dups in db")
-        # end for resrow
-
-        # skip the rename if no matches where found in the database
-        if guinamelist:
-            for lastchar in string.ascii_letters + string.digits + "_:":
-                tryGUIname = shortGUIname + lastchar
-                if tryGUIname not in guinamelist:
-                    self.log.warning(f"tryGUIname '{tryGUIname}' was not in guinamelist {guinamelist}")
-                    newGUIname = tryGUIname
-                    break  # end if tryGUIname
-            # end for lastchar
-
-        # Note that we have a race here.
-        # If another connection to the database inserts the newGUIname
-        # that we have selected then there will still be duplicates.
-        # We are not going to try to lock the database here so we probably
-        # still need something like MaskKeeper to review the database for
-        # duplicate GUIname and any other problems that might arise.
-
-        if newGUIname != GUIname:
-            msg = f"we change MaskBlu.GUIname to {newGUIname} from {GUIname}"
-            self.log.warning(msg)
-            GUIname = newGUIname
-        # end if we changed GUIname
+            self.err_report.append(msg)
+            return None
 
-        return GUIname
+        return result['guiname']
 
 
@@ -1,4 +1,6 @@
 
+import re
+
 from astropy.io import fits
 
 # DSIMULATOR produces MDFs which writes FITS ASCII tables
@@ -250,3 +252,159 @@ mdfcontent = {
     # end dict entry for RDBmap
 
 } # end dict mdfcontent{}
+
+
+########################################################################
+
+"""
+The schema compiled once at import into a validator per table.
+
+The validators read only the table headers,  TFIELDS and the TTYPEn and
+TFORMn of each column,  the table data are not decoded.  The data type of a
+column is the letter of its TFORMn code,  for ASCII tables (TableHDU) the
+code is like A20,  I10,  F12.6 or E15.7,  for binary tables (BinTableHDU)
+like 20A,  J,  1K or D.
+"""
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# the repeat count (binary tables) and the data type letter of TFORMn
+TFORM_RE = re.compile(r'^\s*\d*([A-Za-z])')
+
+# the TFORMn data type letters of each colAttr.dtpre
+TFORM_TYPES = {
+    'chararray': frozenset('A'),
+    'int':       frozenset('BIJK'),
+    'float':     frozenset('FEDG'),
+}
+
+
+class mdfIssue:
+    """
+    one problem found in the structure of a MDF
+    """
+
+    def __init__(self, level, table, column, msg):
+        # ERROR:  the MDF cannot be ingested,  WARNING:  only logged
+        self.level = level
+        self.table = table
+        self.column = column
+        self.msg = msg
+
+    def as_dict(self):
+        return {'level': self.level, 'table': self.table,
+                'column': self.column, 'msg': self.msg}
+
+    def __str__(self):
+        return self.msg
+
+
+class tableValidator:
+    """
+    the structure checks of one table HDU,  compiled from its hduAttr
+    """
+
+    def __init__(self, extname, attrs):
+        self.extname = extname
+        self.hdutypes = tuple(attrs.hdutypes)
+        self.hdutype_names = ', '.join(hdutype.__name__ for hdutype in self.hdutypes)
+
+        # column name to the TFORMn letters accepted and the dtpre
+        self.columns = {col: (TFORM_TYPES.get(attr.dtpre, frozenset()), attr.dtpre)
+                        for col, attr in attrs.knownCols.items()}
+
+        # the ingest reads the optional columns too,  all must be present
+        self.required = tuple(self.columns)
+
+    def header_columns(self, header):
+        """
+        :return: <dict> TTYPEn to the TFORMn data type letter,  from the header.
+        """
+        columns = {}
+        for num in range(1, header.get('TFIELDS', 0) + 1):
+            name = str(header.get(f'TTYPE{num}', '')).strip()
+            match = TFORM_RE.match(str(header.get(f'TFORM{num}', '')))
+            columns[name] = match.group(1).upper() if match else ''
+
+        return columns
+
+    def validate(self, hdu):
+        """
+        :param hdu: <TableHDU / BinTableHDU> the HDU with this EXTNAME.
+
+        :return: <list> the mdfIssue found.
+        """
+        if type(hdu) not in self.hdutypes:
+            return [mdfIssue(ERROR, self.extname, None,
+                             f"wrong hdutype {type(hdu).__name__} for EXTNAME "
+                             f"{self.extname},  expected {self.hdutype_names}")]
+
+        issues = []
+        columns = self.header_columns(hdu.header)
+
+        for col in self.required:
+            if col in columns:
+                continue
+            issues.append(mdfIssue(ERROR, self.extname, col,
+                                   f"did not find col {col} in extname {self.extname}"))
+
+        for col, code in columns.items():
+            if col not in self.columns:
+                # not an error, but surprising if extra cols exist
+                issues.append(mdfIssue(WARNING, self.extname, col,
+                                       f"unexpected col {col} in extname {self.extname}"))
+                continue
+
+            codes, dtpre = self.columns[col]
+            if code not in codes:
+                issues.append(mdfIssue(WARNING, self.extname, col,
+                                       f"{self.extname} col {col} has TFORM type "
+                                       f"{code or 'unknown'},  we say {dtpre}"))
+
+        return issues
+
+
+class mdfSchema:
+    """
+    the structure checks of a MDF,  compiled from mdfcontent
+    """
+
+    def __init__(self, content):
+        self.tables = {extname: tableValidator(extname, attrs)
+                       for extname, attrs in content.items()}
+
+    def validate(self, hdul):
+        """
+        Check the HDUs and the columns of every table,  the issues of all
+        the tables are reported together.
+
+        :param hdul: <HDUList> the opened MDF.
+
+        :return: <list> the mdfIssue found.
+        """
+        issues = []
+        extnames = set()
+
+        for hdu in hdul:
+            if isinstance(hdu, fits.PrimaryHDU):
+                continue
+
+            extnames.add(hdu.name)
+            validator = self.tables.get(hdu.name)
+            if validator is None:
+                issues.append(mdfIssue(ERROR, hdu.name, None,
+                                       f"unexpected EXTNAME {hdu.name}"))
+            else:
+                issues += validator.validate(hdu)
+
+        # does this FITS file contain all known HDUs?
+        for extname in self.tables:
+            if extname not in extnames:
+                issues.append(mdfIssue(ERROR, extname, None,
+                                       f"Did not find HDU {extname}"))
+
+        return issues
+
+
+mdfschema = mdfSchema(mdfcontent)
@@ -0,0 +1,515 @@
+"""
+Latency instrumentation for the API.
+
+The histograms and counters are kept in the process and exported by the
+/slitmask/metrics route in the Prometheus text format.  Under gunicorn each
+worker also writes its values to a directory shared by the workers
+([metrics] multiproc_dir),  and the route sums the values of all the
+workers,  the live and the exited ones,  so the counters do not depend on
+the worker answering the scrape.
+
+Each request also sums the time spent in each phase (db, http, tool,
+encode) so a slow request can be logged with its breakdown,  and counts its
+SQL statements by shape to check the route query budgets.
+"""
+import os
+import re
+import json
+import time
+import fcntl
+import glob
+import atexit
+import threading
+
+from bisect import bisect_left
+from functools import lru_cache
+from contextlib import contextmanager
+from collections import Counter as StatementCounter, defaultdict
+
+# seconds,  the upper bounds of the histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_str(labelnames, values):
+    if not labelnames:
+        return ''
+
+    pairs = []
+    for name, val in zip(labelnames, values):
+        val = str(val).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{val}"')
+
+    return ','.join(pairs)
+
+
+class Counter:
+    def __init__(self, name, help_str, labelnames=()):
+        self.name = name
+        self.help_str = help_str
+        self.labelnames = tuple(labelnames)
+        self.values = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self.lock:
+            self.values[key] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    @staticmethod
+    def merge(total, values):
+        for key, val in values.items():
+            total[key] = total.get(key, 0.0) + val
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.help_str}', f'# TYPE {self.name} counter']
+        values = self.snapshot() if values is None else values
+        for key, val in sorted(values.items()):
+            labels = _label_str(self.labelnames, key)
+            lines.append(f'{self.name}{{{labels}}} {val}' if labels
+                         else f'{self.name} {val}')
+
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_str = help_str
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels to [bucket counts...,  +Inf count,  sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {key: list(counts) for key, counts in self.values.items()}
+
+    @staticmethod
+    def merge(total, values):
+        for key, counts in values.items():
+            if key in total:
+                total[key] = [a + b for a, b in zip(total[key], counts)]
+            else:
+                total[key] = list(counts)
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.help_str}', f'# TYPE {self.name} histogram']
+        values = self.snapshot() if values is None else values
+        for key, counts in sorted(values.items()):
+            labels = _label_str(self.labelnames, key)
+            prefix = f'{labels},' if labels else ''
+
+            cumulative = 0
+            for upper, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{upper}"}} {cumulative}')
+
+            cumulative += counts[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {counts[-1]}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, name, help_str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_str, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_str, labelnames=()):
+        metric = Counter(name, help_str, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """
+        :return: <dict> the values of each metric by name,  as JSON lists.
+        """
+        return {metric.name: [[list(key), val] for key, val in metric.snapshot().items()]
+                for metric in self.metrics}
+
+    def merge(self, snapshots):
+        """
+        :param snapshots: <list> the snapshots of several processes.
+
+        :return: <dict> the summed values of each metric by name.
+        """
+        by_name = {metric.name: metric for metric in self.metrics}
+        totals = {name: {} for name in by_name}
+        for snapshot in snapshots:
+            for name, entries in snapshot.items():
+                if name in by_name:
+                    by_name[name].merge(totals[name], {tuple(key): val for key, val in entries})
+
+        return totals
+
+    def render(self, totals=None):
+        """
+        :param totals: <dict> optional,  the values to render (merge),  the
+                       values of this process otherwise.
+
+        :return: <str> all the metrics in the Prometheus text format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render(None if totals is None else totals[metric.name])
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.histogram(
+    'slitmask_request_seconds', 'API request latency.', ('route', 'method', 'status')
+)
+QUERY_SECONDS = registry.histogram(
+    'slitmask_query_seconds', 'Database query latency by query name.', ('query', )
+)
+QUERY_ROWS = registry.counter(
+    'slitmask_query_rows_total', 'Rows returned or changed by query name.', ('query', )
+)
+QUERY_ERRORS = registry.counter(
+    'slitmask_query_errors_total', 'Failed database queries by query name.', ('query', )
+)
+HTTP_SECONDS = registry.histogram(
+    'slitmask_http_seconds', 'Latency of the calls to the observer services.', ('call', )
+)
+TOOL_SECONDS = registry.histogram(
+    'slitmask_tool_seconds', 'Run time of the external tools.', ('tool', )
+)
+
+################################################################################
+# the metrics of the gunicorn workers
+################################################################################
+
+# the seconds between the writes of the worker values
+WORKER_WRITE_INTERVAL = 10
+
+# the values of the exited workers,  and the files already added to it
+ARCHIVE_FILE = 'archive.json'
+
+# the shared directory and the values file of this worker,  None when the
+# metrics of this process are not shared
+_multiproc_dir = None
+_worker_file = None
+
+
+def _read_json(file_path):
+    try:
+        with open(file_path) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(file_path, data):
+    # replaced at once,  the readers never see a partial file
+    tmp_path = f'{file_path}.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(data, fp)
+    os.replace(tmp_path, file_path)
+
+
+def start_worker_metrics(multiproc_dir, interval=WORKER_WRITE_INTERVAL):
+    """
+    Write the values of this worker to the shared directory every interval
+    seconds and at exit,  called in each worker after the fork.
+
+    :param multiproc_dir: <str> the directory shared by the workers.
+    :param interval: <int> the seconds between the writes.
+    """
+    global _multiproc_dir, _worker_file
+
+    os.makedirs(multiproc_dir, exist_ok=True)
+    _multiproc_dir = multiproc_dir
+
+    # the start time tells apart the workers given the same pid
+    _worker_file = os.path.join(multiproc_dir, f'metrics-{os.getpid()}-{time.time_ns()}.json')
+    write_worker_metrics()
+    atexit.register(write_worker_metrics)
+
+    def writer():
+        while True:
+            time.sleep(interval)
+            write_worker_metrics()
+
+    threading.Thread(target=writer, name='metrics_writer', daemon=True).start()
+
+
+def write_worker_metrics():
+    if _worker_file:
+        _write_json(_worker_file, registry.snapshot())
+
+
+def render_metrics():
+    """
+    :return: <str> the metrics in the Prometheus text format,  summed over
+             all the workers (live and exited) when they are shared,  the
+             metrics of this process otherwise.
+    """
+    if not _worker_file:
+        return registry.render()
+
+    # the values of this worker are current,  the others at most interval old
+    write_worker_metrics()
+
+    archive = _read_json(os.path.join(_multiproc_dir, ARCHIVE_FILE)) or {}
+    archived = set(archive.get('workers', []))
+
+    snapshots = [archive.get('metrics', {})]
+    for file_path in glob.glob(os.path.join(_multiproc_dir, 'metrics-*.json')):
+        if os.path.basename(file_path) in archived:
+            continue
+        snapshot = _read_json(file_path)
+        if snapshot:
+            snapshots.append(snapshot)
+
+    return registry.render(registry.merge(snapshots))
+
+
+def archive_worker(multiproc_dir, pid):
+    """
+    Add the values of an exited worker to the archive,  so the sums do not
+    drop when the workers are recycled.  Called by the gunicorn master.
+
+    The worker file is listed in the archive (and skipped by the readers)
+    and deleted with the next exit,  so a reader of the previous archive
+    still finds it.
+
+    :param multiproc_dir: <str> the directory shared by the workers.
+    :param pid: <int> the process id of the exited worker.
+    """
+    archive_path = os.path.join(multiproc_dir, ARCHIVE_FILE)
+
+    with open(os.path.join(multiproc_dir, 'archive.lock'), 'w') as lock_fp:
+        fcntl.flock(lock_fp, fcntl.LOCK_EX)
+
+        archive = _read_json(archive_path) or {'workers': [], 'metrics': {}}
+        for name in archive['workers']:
+            try:
+                os.remove(os.path.join(multiproc_dir, name))
+            except OSError:
+                pass
+
+        snapshots = [archive['metrics']]
+        workers = []
+        for file_path in glob.glob(os.path.join(multiproc_dir, f'metrics-{pid}-*.json')):
+            snapshot = _read_json(file_path)
+            if snapshot:
+                snapshots.append(snapshot)
+            workers.append(os.path.basename(file_path))
+
+        totals = registry.merge(snapshots)
+        metrics = {name: [[list(key), val] for key, val in values.items()]
+                   for name, values in totals.items()}
+        _write_json(archive_path, {'workers': workers, 'metrics': metrics})
+
+
+def clear_worker_metrics(multiproc_dir):
+    """
+    Remove the values of the previous server,  called by the gunicorn master
+    at start up.
+    """
+    os.makedirs(multiproc_dir, exist_ok=True)
+    for file_path in glob.glob(os.path.join(multiproc_dir, '*.json')):
+        os.remove(file_path)
+
+
+################################################################################
+# the per-request phase breakdown
+################################################################################
+
+_request = threading.local()
+
+
+def start_request():
+    _request.start = time.perf_counter()
+    _request.phases = defaultdict(float)
+    _request.statements = StatementCounter()
+    _request.query_log = None
+
+
+def add_phase(phase, seconds):
+    phases = getattr(_request, 'phases', None)
+    if phases is not None:
+        phases[phase] += seconds
+
+
+def finish_request():
+    """
+    :return: <float, dict, Counter> the request seconds,  the seconds by
+             phase and the SQL statements executed by shape.
+             None, None, None if start_request was not called.
+    """
+    start = getattr(_request, 'start', None)
+    if start is None:
+        return None, None, None
+
+    elapsed = time.perf_counter() - start
+    phases = dict(_request.phases)
+    statements = _request.statements
+    _request.start = None
+    _request.phases = None
+    _request.statements = None
+    _request.last = (elapsed, phases, statements)
+
+    return elapsed, phases, statements
+
+
+def current_request():
+    """
+    :return: <float, dict, Counter> the seconds so far,  the seconds by phase
+             and the statements of the running request.  None, None, None
+             outside a request.
+    """
+    start = getattr(_request, 'start', None)
+    if start is None:
+        return None, None, None
+
+    return time.perf_counter() - start, dict(_request.phases), _request.statements
+
+
+def start_query_log():
+    """
+    Record each timed query of the running request,  for the profiler.
+    """
+    _request.query_log = []
+
+
+def stop_query_log():
+    """
+    :return: <list> the (query name, seconds) since start_query_log.
+    """
+    query_log = getattr(_request, 'query_log', None) or []
+    _request.query_log = None
+
+    return query_log
+
+
+def last_request():
+    """
+    The finished request of this thread,  read by the benchmarks after each
+    test client call.
+
+    :return: <float, dict, Counter> as finish_request.
+    """
+    return getattr(_request, 'last', (None, None, None))
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(query):
+    """
+    The statement with the literals replaced,  so the statements built with
+    f-strings in a loop have the same shape.
+    """
+    if isinstance(query, bytes):
+        query = query.decode(errors='replace')
+
+    shape = re.sub(r"'(?:[^']|'')*'", '?', str(query))
+    shape = re.sub(r'\b\d+(?:\.\d+)?\b', '?', shape)
+
+    return ' '.join(shape.split())
+
+
+def count_statement(query):
+    """
+    Count a statement for the current request,  called by the PgConn cursors.
+    """
+    statements = getattr(_request, 'statements', None)
+    if statements is not None:
+        if not isinstance(query, (str, bytes)):
+            query = str(query)
+        statements[statement_shape(query)] += 1
+
+################################################################################
+# the route query budgets
+################################################################################
+
+
+def query_budget(max_queries, max_repeats=None):
+    """
+    Declare the query budget of a route,  place directly below @app.route.
+
+    :param max_queries: <int> the most statements the route may execute.
+    :param max_repeats: <int> optional,  the most times the route may repeat
+                        one statement shape,  the default repeat limit
+                        otherwise.
+    """
+    def decorator(fun):
+        fun.query_budget = (max_queries, max_repeats)
+        return fun
+
+    return decorator
+
+
+def budget_violations(view_fun, statements, repeat_limit):
+    """
+    Check the statements of a request against the budget of its route,  all
+    routes are held to the repeat limit (N+1 queries).
+
+    :param view_fun: <function> the route function.
+    :param statements: <Counter> the statements executed by shape.
+    :param repeat_limit: <int> the default repeat limit.
+
+    :return: <list> the violations as messages,  empty if within budget.
+    """
+    max_queries, max_repeats = getattr(view_fun, 'query_budget', (None, None))
+    max_repeats = max_repeats or repeat_limit
+
+    violations = []
+    num_queries = sum(statements.values())
+    if max_queries is not None and num_queries > max_queries:
+        violations.append(f'{num_queries} statements > budget {max_queries}')
+
+    for shape, count in statements.most_common():
+        if count <= max_repeats:
+            break
+        violations.append(f'{count} x {shape[:120]}')
+
+    return violations
+
+
+@contextmanager
+def timer(histogram, phase, **labels):
+    """
+    Time the block into the histogram and the request phase.
+
+    :param histogram: <Histogram> the histogram to observe.
+    :param phase: <str> the request phase,  ie: db, http, tool,  or encode.
+    :param labels: the histogram labels.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if histogram:
+            histogram.observe(elapsed, **labels)
+        add_phase(phase, elapsed)
+
+        query_log = getattr(_request, 'query_log', None)
+        if query_log is not None and 'query' in labels:
+            query_log.append((labels['query'], elapsed))
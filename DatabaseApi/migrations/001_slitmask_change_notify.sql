@@ -0,0 +1,65 @@
+-- Change notification triggers for the slitmask API cache invalidation.
+--
+-- The MillMasks GUI on slitmaskpc (barcode scans) and admins working directly
+-- in psql write to the database without going through the API.  These
+-- triggers publish every row change on the mask tables to the channel
+-- 'slitmask_changes' so that the API listener (cache_utils.ChangeListener)
+-- can invalidate the cached results that depend on the changed rows.
+--
+-- The payload is JSON:  {"table": "maskblu", "op": "UPDATE",
+--                        "bluid": 123, "desid": 456, "maskid": null}
+--
+-- apply with:  psql -d metabase -f 001_slitmask_change_notify.sql
+
+CREATE OR REPLACE FUNCTION slitmask_notify_change() RETURNS trigger AS $$
+DECLARE
+    rec     record;
+    payload json;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := OLD;
+    ELSE
+        rec := NEW;
+    END IF;
+
+    IF TG_TABLE_NAME = 'maskblu' THEN
+        payload := json_build_object('table', TG_TABLE_NAME, 'op', TG_OP,
+                                     'bluid', rec.bluid, 'desid', rec.desid);
+    ELSIF TG_TABLE_NAME = 'mask' THEN
+        payload := json_build_object('table', TG_TABLE_NAME, 'op', TG_OP,
+                                     'bluid', rec.bluid, 'maskid', rec.maskid);
+    ELSIF TG_TABLE_NAME = 'bluslits' THEN
+        payload := json_build_object('table', TG_TABLE_NAME, 'op', TG_OP,
+                                     'bluid', rec.bluid);
+    ELSIF TG_TABLE_NAME = 'maskdesign' THEN
+        payload := json_build_object('table', TG_TABLE_NAME, 'op', TG_OP,
+                                     'desid', rec.desid);
+    ELSE
+        payload := json_build_object('table', TG_TABLE_NAME, 'op', TG_OP);
+    END IF;
+
+    PERFORM pg_notify('slitmask_changes', payload::text);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS maskblu_notify_change ON MaskBlu;
+CREATE TRIGGER maskblu_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON MaskBlu
+    FOR EACH ROW EXECUTE FUNCTION slitmask_notify_change();
+
+DROP TRIGGER IF EXISTS mask_notify_change ON Mask;
+CREATE TRIGGER mask_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON Mask
+    FOR EACH ROW EXECUTE FUNCTION slitmask_notify_change();
+
+DROP TRIGGER IF EXISTS bluslits_notify_change ON BluSlits;
+CREATE TRIGGER bluslits_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON BluSlits
+    FOR EACH ROW EXECUTE FUNCTION slitmask_notify_change();
+
+DROP TRIGGER IF EXISTS maskdesign_notify_change ON MaskDesign;
+CREATE TRIGGER maskdesign_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON MaskDesign
+    FOR EACH ROW EXECUTE FUNCTION slitmask_notify_change();
@@ -0,0 +1,46 @@
+-- Append-only log of mask events used by the /slitmask/changes feed.
+--
+-- Event rows are written by the API mutation paths (ingest, status changes,
+-- archive, delete, use-date changes) and by the trigger below for the masks
+-- scanned as milled by the MillMasks GUI,  which writes the Mask table
+-- directly.
+--
+-- Every writer takes the transaction level advisory lock 8150 before the
+-- insert and holds it until commit,  so EventIds become visible in
+-- increasing order and a consumer can page with "EventId > last cursor"
+-- without missing events committed late.  Writers record the event as the
+-- last statement before the commit to keep the lock window short.
+--
+-- apply with:  psql -d metabase -f 002_mask_events.sql
+
+CREATE TABLE IF NOT EXISTS MaskEvents (
+    EventId     BIGSERIAL       PRIMARY KEY,
+    EventType   VARCHAR(16)     NOT NULL,
+    BluId       INTEGER,
+    DesId       INTEGER,
+    MaskId      INTEGER,
+    Status      INTEGER,
+    Detail      TEXT,
+    stamp       timestamp without time zone DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS maskevents_bluid_idx ON MaskEvents (BluId);
+CREATE INDEX IF NOT EXISTS maskevents_desid_idx ON MaskEvents (DesId);
+
+CREATE OR REPLACE FUNCTION slitmask_mask_milled_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(8150);
+
+    INSERT INTO MaskEvents (EventType, BluId, DesId, MaskId, Status, Detail)
+    SELECT 'milled', NEW.bluid, b.desid, NEW.maskid, b.status, NEW.guiname
+    FROM MaskBlu b WHERE b.bluid = NEW.bluid;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS mask_milled_event ON Mask;
+CREATE TRIGGER mask_milled_event
+    AFTER INSERT ON Mask
+    FOR EACH ROW EXECUTE FUNCTION slitmask_mask_milled_event();
+
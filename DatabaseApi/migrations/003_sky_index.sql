@@ -0,0 +1,13 @@
+-- Sky pixel index for the mask pointings and the catalog objects.
+--
+-- SkyPix is the sky_index.sky_pixel() cell of the position,  computed in
+-- python at ingest.  Backfill the existing rows after applying with:
+--     python sky_index.py slitmask_cfg.live.ini
+--
+-- apply with:  psql -d metabase -f 003_sky_index.sql
+
+ALTER TABLE MaskDesign ADD COLUMN IF NOT EXISTS SkyPix INTEGER;
+ALTER TABLE Objects ADD COLUMN IF NOT EXISTS SkyPix INTEGER;
+
+CREATE INDEX IF NOT EXISTS maskdesign_skypix_idx ON MaskDesign (SkyPix);
+CREATE INDEX IF NOT EXISTS objects_skypix_idx ON Objects (SkyPix);
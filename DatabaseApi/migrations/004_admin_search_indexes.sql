@@ -0,0 +1,23 @@
+-- Indexes for the admin search predicates (admin_search_utils).
+--
+-- The search options are combined into one query,  each predicate should
+-- be answered from an index:  the owner ids,  the mill sequences,  the
+-- dates and the barcode joins.  The results are ordered by the submit stamp.
+--
+-- apply with:  psql -d metabase -f 004_admin_search_indexes.sql
+
+CREATE INDEX IF NOT EXISTS maskdesign_despid_idx ON MaskDesign (DesPId);
+CREATE INDEX IF NOT EXISTS maskdesign_stamp_idx ON MaskDesign (stamp);
+CREATE INDEX IF NOT EXISTS maskdesign_desdate_idx ON MaskDesign (DesDate);
+
+CREATE INDEX IF NOT EXISTS maskblu_blupid_idx ON MaskBlu (BluPId);
+CREATE INDEX IF NOT EXISTS maskblu_millseq_idx ON MaskBlu (MillSeq);
+CREATE INDEX IF NOT EXISTS maskblu_date_use_idx ON MaskBlu (Date_Use);
+
+CREATE INDEX IF NOT EXISTS mask_bluid_idx ON Mask (BluId);
+CREATE INDEX IF NOT EXISTS mask_millseq_idx ON Mask (MillSeq);
+CREATE INDEX IF NOT EXISTS mask_milldate_idx ON Mask (MillDate);
+
+ANALYZE MaskDesign;
+ANALYZE MaskBlu;
+ANALYZE Mask;
@@ -0,0 +1,21 @@
+-- Trigram indexes for the name search (name_search.py) and the name options
+-- of the admin search.
+--
+-- The GIN trigram indexes answer the similarity operators (% and <%) and
+-- the ILIKE '%x%' substring matches,  which otherwise scan MaskBlu and
+-- MaskDesign.  pg_trgm is a trusted extension,  the database owner may
+-- create it.
+--
+-- apply with:  psql -d metabase -f 005_name_trigram.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS maskblu_guiname_trgm_idx
+    ON MaskBlu USING gin (GUIname gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS maskblu_bluname_trgm_idx
+    ON MaskBlu USING gin (BluName gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS maskdesign_desname_trgm_idx
+    ON MaskDesign USING gin (DesName gin_trgm_ops);
+
+ANALYZE MaskDesign;
+ANALYZE MaskBlu;
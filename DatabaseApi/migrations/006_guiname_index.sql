@@ -0,0 +1,12 @@
+-- Index for the GUIname allocation of the ingest (MaskInsert.unique_gui_name).
+--
+-- The candidate names are looked up by equality,  one index probe each,
+-- so the allocation does not slow down as MaskBlu grows.  GUIname is not
+-- made unique as the archive has duplicates from before the allocation
+-- took advisory locks.
+--
+-- apply with:  psql -d metabase -f 006_guiname_index.sql
+
+CREATE INDEX IF NOT EXISTS maskblu_guiname_idx ON MaskBlu (GUIname);
+
+ANALYZE MaskBlu;
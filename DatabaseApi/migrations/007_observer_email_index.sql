@@ -0,0 +1,12 @@
+-- Index for the email lookups of the mask owners (apiutils.resolve_emails).
+--
+-- The design author and blueprint observer emails of an upload,  and the
+-- admin search by email,  are matched case insensitively with
+-- lower(Email) = ANY(...),  answered from this index.
+--
+-- apply with:  psql -d metabase -f 007_observer_email_index.sql
+
+CREATE INDEX IF NOT EXISTS observers_email_lower_idx ON Observers (lower(Email));
+CREATE INDEX IF NOT EXISTS observers_keckid_idx ON Observers (KeckId);
+
+ANALYZE Observers;
@@ -0,0 +1,73 @@
+"""
+Fuzzy search of the mask names:  MaskBlu.GUIname,  MaskBlu.BluName and
+MaskDesign.DesName.
+
+The names are matched with the pg_trgm trigram operators,  a name matches
+when it contains the text or has a word similar to it,  and the matches are
+ranked by the word similarity (0-1).  The GIN trigram indexes of
+migrations/005 answer the matches without scanning the tables.
+"""
+import general_utils as gen_utils
+from general_utils import do_query
+from slitmask_queries import get_query
+from admin_search_utils import like_pattern
+
+from mask_constants import NAME_MIN_CHARS, NAME_SUGGEST_LIMIT, NAME_SUGGEST_MAX
+
+# the name columns searched,  by the field name
+NAME_FIELDS = {
+    'guiname': 'name_suggest_guiname',
+    'bluname': 'name_suggest_bluname',
+    'desname': 'name_suggest_desname',
+}
+
+
+def parse_fields(fields):
+    """
+    :param fields: <str> comma separated field names,  empty for all.
+
+    :return: <list/None> the field names,  None if one is unknown.
+    """
+    if not fields:
+        return list(NAME_FIELDS)
+
+    fields = [field.strip().lower() for field in fields.split(',') if field.strip()]
+    if not fields or any(field not in NAME_FIELDS for field in fields):
+        return None
+
+    return fields
+
+
+def suggest(curse, text, fields, limit=NAME_SUGGEST_LIMIT):
+    """
+    The names most similar to the text.
+
+    :param curse: <obj> the database cursor.
+    :param text: <str> the text typed.
+    :param fields: <list> the name fields searched,  see NAME_FIELDS.
+    :param limit: <int> the number of names returned.
+
+    :return: <list/None> the names,  with the field,  the newest id with the
+             name,  the number of rows with the name and the score,  the
+             best first.  None on error.
+    """
+    text = text.strip()
+    if len(text) < NAME_MIN_CHARS:
+        return []
+
+    limit = max(1, min(limit, NAME_SUGGEST_MAX))
+    pattern = like_pattern(text)
+
+    # each column limited first,  so only the best of each are sorted
+    query = " UNION ALL ".join(get_query(NAME_FIELDS[field]) for field in fields)
+    query += get_query('name_suggest_order')
+
+    params = [text, pattern, text, limit] * len(fields) + [limit]
+    if not do_query('name_suggest', curse, params, query=query):
+        return None
+
+    results = gen_utils.get_dict_result(curse)
+    for row in results:
+        row['score'] = round(float(row['score']), 3)
+
+    return results
@@ -4,11 +4,105 @@ import psycopg2
 # we want the dictionary cursor
 import psycopg2.extras
 
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, RealDictCursor
 
 # get the logger object
 from logger_utils import get_log
 
+# count the statements of each request for the query budgets
+from metrics_utils import count_statement
+
+from mask_constants import EXPORT_CHUNK_ROWS
+
+# the PREPARE and EXECUTE statements of the hot queries
+from slitmask_queries import PREPARED_SQL
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.errors import DuplicatePreparedStatement, InvalidSqlStatementName
+
+
+# prepare the hot queries in each session,  False to always send the text
+PREPARE_QUERIES = True
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        count_statement(query)
+        return super().execute(query, vars)
+
+
+class CountingDictCursor(DictCursor):
+    def execute(self, query, vars=None):
+        count_statement(query)
+        return super().execute(query, vars)
+
+
+class CountingRealDictCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        count_statement(query)
+        return super().execute(query, vars)
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """
+    A connection which keeps the names of the queries prepared in its
+    session,  see execute_query.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def execute_query(curse, query_name, query, query_params):
+    """
+    Execute a query of slitmask_queries.  The PREPARED_QUERIES are prepared
+    in the session with their first use (PREPARE and EXECUTE are sent
+    together) and executed by name after,  so they are parsed and planned
+    once per connection instead of on every call.
+
+    The statements dropped from the session (DISCARD ALL by a pooler) or
+    prepared by a failed call are found by their errors,  and the query is
+    run again when no transaction was open.  The other queries,  the
+    server-side cursors and the connections not made by PgConn run the
+    query text.
+
+    :param curse: <obj> the database cursor.
+    :param query_name: <str> the query name.
+    :param query: <str> the query text.
+    :param query_params: <tuple> the query parameters.
+    """
+    conn = curse.connection
+    if query_name not in PREPARED_SQL or curse.name or not PREPARE_QUERIES \
+            or not isinstance(conn, PreparingConnection):
+        curse.execute(query, query_params)
+        return
+
+    prepare, execute = PREPARED_SQL[query_name]
+    idle = conn.info.transaction_status == TRANSACTION_STATUS_IDLE
+
+    try:
+        if query_name in conn.prepared:
+            curse.execute(execute, query_params)
+        else:
+            curse.execute(f'{prepare}; {execute}', query_params)
+            conn.prepared.add(query_name)
+        return
+    except DuplicatePreparedStatement:
+        conn.prepared.add(query_name)
+        if not idle:
+            raise
+        retry = execute
+    except InvalidSqlStatementName:
+        conn.prepared.discard(query_name)
+        if not idle:
+            raise
+        retry = f'{prepare}; {execute}'
+
+    # no transaction was open,  the rollback only ends the failed statement
+    conn.rollback()
+    curse.execute(retry, query_params)
+    conn.prepared.add(query_name)
+
 
 class PgConn:
 
@@ -22,7 +116,24 @@ class PgConn:
         return self.conn
 
     def get_dict_curse(self):
-        return self.conn.cursor(cursor_factory=DictCursor)
+        return self.conn.cursor(cursor_factory=CountingDictCursor)
+
+    def get_stream_curse(self, name='stream', itersize=EXPORT_CHUNK_ROWS):
+        """
+        A server-side (named) cursor returning the rows as dicts,  the rows
+        are fetched from the server as they are read instead of all at once
+        by execute.  It is only valid in the transaction,  until the commit
+        or the connection is closed.
+
+        :param name: <str> the cursor name,  unique in the connection.
+        :param itersize: <int> the rows fetched at a time when iterated.
+
+        :return: <obj> the cursor.
+        """
+        curse = self.conn.cursor(name, cursor_factory=CountingRealDictCursor)
+        curse.itersize = itersize
+
+        return curse
 
     def disconnect(self):
 
@@ -61,9 +172,11 @@ class PgConn:
         else:
             # get a connection
             try:
-                self.conn = psycopg2.connect(conn_string % (host, port, dbname, user, password))
+                self.conn = psycopg2.connect(conn_string % (host, port, dbname, user, password),
+                                             connection_factory=PreparingConnection,
+                                             cursor_factory=CountingCursor)
             except Exception as e:
-                self.log.info(f'connection params: {host}, {port}, {dbname}, {user}, {password}')
+                self.log.info(f'connection params: {host}, {port}, {dbname}, {user}')
                 self.log.error(f"failed connect: exception class"
                           f"{e.__class__.__name__}: {e}" )
                 self.msg += "db connect failed\n"
@@ -79,7 +192,7 @@ class PgConn:
             # get a cursor
             try:
                 # get a cursor that returns columns by name
-                self.cursor = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+                self.cursor = self.conn.cursor(cursor_factory=CountingRealDictCursor)
             except Exception as e:
                 self.log.error(
                 "failed cursor create: exception class %s: %s"
@@ -0,0 +1,276 @@
+"""
+Profile a single API request on demand.
+
+An admin adds the X-Slitmask-Profile header or the profile query parameter
+to a request and the route runs under a profiler:
+
+    cprofile - (default) the deterministic cProfile,  saved as pstats (.prof)
+               to read with pstats,  snakeviz or gprof2dot.
+    sample   - the stack of the request thread sampled every
+               PROFILE_SAMPLE_INTERVAL seconds,  saved as collapsed stacks
+               (.folded) for flamegraph.pl or speedscope.
+
+Each profile is saved with a .json description of the request:  the route,
+parameters,  user,  status,  the seconds by phase,  and the time and calls of
+each query.  The store keeps only the newest profiles.
+
+The streamed responses (exports,  zips,  the large JSON lists) are written
+after the route returns,  their profile only covers the route up to the
+first row and the description is marked 'streamed'.
+
+The requests without the flag only pay for the header check.
+"""
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+
+from datetime import datetime
+from collections import Counter
+
+import metrics_utils
+from mask_constants import MAX_PROFILES, PROFILE_SAMPLE_INTERVAL
+
+PROFILE_HEADER = 'X-Slitmask-Profile'
+PROFILE_ARG = 'profile'
+PROFILE_MODES = ('cprofile', 'sample')
+
+# the statement shapes written to the description
+TOP_STATEMENTS = 20
+
+
+def profile_requested(request):
+    """
+    The profiler mode asked for by the request.
+
+    :param request: <flask.Request> the request.
+
+    :return: <str> cprofile or sample,  None when the request does not ask.
+    """
+    flag = request.headers.get(PROFILE_HEADER)
+    if flag is None:
+        flag = request.args.get(PROFILE_ARG)
+        if flag is None:
+            return None
+
+    flag = flag.strip().lower()
+    if flag in ('', '0', 'false', 'no', 'off'):
+        return None
+
+    return flag if flag in PROFILE_MODES else 'cprofile'
+
+
+class SamplingProfiler:
+    """
+    Sample the stack of one thread from a second thread,  counting the
+    collapsed stacks.
+    """
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.num_samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='slitmask-profiler',
+                                       daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}'
+                             f':{code.co_firstlineno})')
+                frame = frame.f_back
+
+            self.stacks[';'.join(reversed(names))] += 1
+            self.num_samples += 1
+
+    def folded(self):
+        """
+        :return: <str> the stacks in the collapsed format,  one
+                 'root;...;leaf count' per line.
+        """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def run_profiled(mode, fun, *args, **kwargs):
+    """
+    Call the function under the profiler.
+
+    :param mode: <str> cprofile or sample.
+    :param fun: <function> the route function.
+
+    :return: <obj, obj> the function result and the profiler.
+    """
+    if mode == 'sample':
+        profiler = SamplingProfiler(threading.get_ident())
+        profiler.start()
+        try:
+            return fun(*args, **kwargs), profiler
+        finally:
+            profiler.stop()
+
+    profiler = cProfile.Profile()
+
+    return profiler.runcall(fun, *args, **kwargs), profiler
+
+
+def query_summary(query_log):
+    """
+    :param query_log: <list> the (query name, seconds) of the request.
+
+    :return: <dict> the calls and seconds of each query,  slowest first.
+    """
+    summary = {}
+    for name, seconds in query_log:
+        entry = summary.setdefault(name, {'calls': 0, 'seconds': 0.0})
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+
+    ordered = sorted(summary.items(), key=lambda item: item[1]['seconds'], reverse=True)
+
+    return {name: {'calls': entry['calls'], 'seconds': round(entry['seconds'], 6)}
+            for name, entry in ordered}
+
+
+class ProfileStore:
+    """
+    The saved profiles in one directory,  the oldest are removed past
+    max_profiles.
+    """
+    def __init__(self, profile_dir, max_profiles=MAX_PROFILES):
+        self.profile_dir = profile_dir
+        self.max_profiles = max_profiles
+        self.lock = threading.Lock()
+        os.makedirs(profile_dir, exist_ok=True)
+
+    def save(self, profiler, description):
+        """
+        Write the profile and its description.
+
+        :param profiler: <cProfile.Profile / SamplingProfiler> the profiler.
+        :param description: <dict> the request description.
+
+        :return: <str> the profile name.
+        """
+        route = description.get('route', 'unmatched').strip('/').replace('/', '-')
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        name = f'{stamp}-{route}'
+
+        if isinstance(profiler, SamplingProfiler):
+            profile_file = f'{name}.folded'
+            description['samples'] = profiler.num_samples
+            with open(os.path.join(self.profile_dir, profile_file), 'w') as fp:
+                fp.write(profiler.folded())
+        else:
+            profile_file = f'{name}.prof'
+            pstats.Stats(profiler).dump_stats(os.path.join(self.profile_dir, profile_file))
+
+        description['name'] = name
+        description['profile_file'] = profile_file
+        with open(os.path.join(self.profile_dir, f'{name}.json'), 'w') as fp:
+            json.dump(description, fp, indent=2, default=str)
+
+        self.prune()
+
+        return name
+
+    def prune(self):
+        with self.lock:
+            profiles = self.list()
+            for entry in profiles[self.max_profiles:]:
+                for file_name in (f"{entry['name']}.json", entry['profile_file']):
+                    try:
+                        os.remove(os.path.join(self.profile_dir, file_name))
+                    except FileNotFoundError:
+                        pass
+
+    def list(self):
+        """
+        :return: <list> the profile descriptions,  newest first.
+        """
+        profiles = []
+        for file_name in os.listdir(self.profile_dir):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.profile_dir, file_name)) as fp:
+                    profiles.append(json.load(fp))
+            except (OSError, ValueError):
+                continue
+
+        return sorted(profiles, key=lambda entry: entry.get('name', ''), reverse=True)
+
+    def path(self, name):
+        """
+        :param name: <str> the profile name.
+
+        :return: <str> the profile file path,  None if not a saved profile.
+        """
+        for entry in self.list():
+            if entry.get('name') == name:
+                return os.path.join(self.profile_dir, entry['profile_file'])
+
+        return None
+
+
+def profile_call(store, mode, request, user_info, fun, *args, **kwargs):
+    """
+    Run a route function under the profiler and save the profile with the
+    request description.
+
+    :param store: <ProfileStore> the profile store.
+    :param mode: <str> cprofile or sample.
+    :param request: <flask.Request> the request.
+    :param user_info: <UserInfo> the admin asking for the profile.
+    :param fun: <function> the route function.
+
+    :return: <obj> the route function result.
+    """
+    metrics_utils.start_query_log()
+    start = time.perf_counter()
+    try:
+        result, profiler = run_profiled(mode, fun, *args, **kwargs)
+    finally:
+        query_log = metrics_utils.stop_query_log()
+
+    elapsed = time.perf_counter() - start
+    _, phases, statements = metrics_utils.current_request()
+    statements = statements or Counter()
+
+    description = {
+        'route': request.url_rule.rule if request.url_rule else request.path,
+        'path': request.path,
+        'method': request.method,
+        'params': request.args.to_dict(),
+        'keck_id': user_info.keck_id,
+        'mode': mode,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'status': getattr(result, 'status_code', None),
+        # the body is generated after the profile,  not included
+        'streamed': bool(getattr(result, 'is_streamed', False)),
+        'seconds': round(elapsed, 6),
+        'phases': {phase: round(seconds, 6) for phase, seconds in (phases or {}).items()},
+        'num_statements': sum(statements.values()),
+        'statements': dict(statements.most_common(TOP_STATEMENTS)),
+        'queries': query_summary(query_log),
+    }
+
+    store.save(profiler, description)
+
+    return result
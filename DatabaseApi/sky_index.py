@@ -0,0 +1,226 @@
+"""
+Sky pixel index over the mask pointings (MaskDesign.RA_PNT/DEC_PNT) and the
+catalog objects (Objects.RA_OBJ/DEC_OBJ).
+
+The sky is cut into declination zones of SKY_ZONE_DEG and each zone into RA
+cells of the same width.  The cell id (SkyPix) is stored and indexed with the
+rows,  a cone search selects the candidate rows by the cells overlapping the
+cone and refines them with the great-circle distance.
+
+Backfill the rows ingested before migrations/003:
+    python sky_index.py slitmask_cfg.live.ini
+"""
+import math
+import argparse
+from os import path
+
+import general_utils as gen_utils
+from general_utils import do_query
+from mask_constants import SKY_ZONE_DEG, MASK_ADMIN
+
+APP_PATH = path.abspath(path.dirname(__file__))
+
+NUM_ZONES = int(math.ceil(180.0 / SKY_ZONE_DEG))
+NUM_CELLS = int(math.ceil(360.0 / SKY_ZONE_DEG))
+
+# the tables with a SkyPix column,  their id and coordinate columns
+SKY_TABLES = {
+    'designs': 'sky_backfill_designs',
+    'objects': 'sky_backfill_objects',
+}
+
+
+def _zone(dec):
+    return min(max(int((dec + 90.0) // SKY_ZONE_DEG), 0), NUM_ZONES - 1)
+
+
+def _cell(ra):
+    return min(int((ra % 360.0) // SKY_ZONE_DEG), NUM_CELLS - 1)
+
+
+def sky_pixel(ra, dec):
+    """
+    The sky pixel id of a position.
+
+    :param ra: <float> right ascension in degrees.
+    :param dec: <float> declination in degrees.
+
+    :return: <int> the pixel id,  None if the position is undefined.
+    """
+    try:
+        ra = float(ra)
+        dec = float(dec)
+    except (TypeError, ValueError):
+        return None
+
+    if math.isnan(ra) or math.isnan(dec):
+        return None
+
+    return _zone(dec) * NUM_CELLS + _cell(ra)
+
+
+def cone_pixels(ra, dec, radius):
+    """
+    The sky pixels which overlap a cone.
+
+    :param ra: <float> right ascension of the center in degrees.
+    :param dec: <float> declination of the center in degrees.
+    :param radius: <float> radius of the cone in degrees.
+
+    :return: <list> the pixel ids.
+    """
+    dec_min = dec - radius
+    dec_max = dec + radius
+
+    # a cone including a pole covers every RA
+    if dec_min <= -90.0 or dec_max >= 90.0:
+        ra_cells = range(NUM_CELLS)
+    else:
+        max_cos = min(math.cos(math.radians(dec_min)), math.cos(math.radians(dec_max)))
+        ratio = math.sin(math.radians(radius)) / max_cos
+        if ratio >= 1.0:
+            ra_cells = range(NUM_CELLS)
+        else:
+            half_width = math.degrees(math.asin(ratio))
+            first = int((ra - half_width) // SKY_ZONE_DEG)
+            last = int((ra + half_width) // SKY_ZONE_DEG)
+            ra_cells = sorted({cell % NUM_CELLS for cell in range(first, last + 1)})
+
+    pixels = []
+    for zone in range(_zone(dec_min), _zone(dec_max) + 1):
+        pixels += [zone * NUM_CELLS + cell for cell in ra_cells]
+
+    return pixels
+
+
+def angular_distance(ra, dec, ra_list, dec_list):
+    """
+    Vectorized great-circle (haversine) distance from one position.
+
+    :param ra: <float> right ascension of the center in degrees.
+    :param dec: <float> declination of the center in degrees.
+    :param ra_list: <list> right ascensions in degrees.
+    :param dec_list: <list> declinations in degrees.
+
+    :return: <numpy.ndarray> the distances in degrees.
+    """
+    # numpy is only needed by the cone search
+    import numpy
+
+    ra0, dec0 = numpy.radians(ra), numpy.radians(dec)
+    ra1 = numpy.radians(numpy.asarray(ra_list, dtype=float))
+    dec1 = numpy.radians(numpy.asarray(dec_list, dtype=float))
+
+    hav = (numpy.sin((dec1 - dec0) / 2.0) ** 2 +
+           numpy.cos(dec0) * numpy.cos(dec1) * numpy.sin((ra1 - ra0) / 2.0) ** 2)
+
+    return numpy.degrees(2.0 * numpy.arcsin(numpy.sqrt(numpy.clip(hav, 0.0, 1.0))))
+
+
+def cone_search(curse, target, ra, dec, radius_arcmin):
+    """
+    Find the mask pointings or the catalog objects within a cone.
+
+    :param curse: <obj> the database cursor.
+    :param target: <str> 'masks' or 'objects'.
+    :param ra: <float> right ascension of the center in degrees.
+    :param dec: <float> declination of the center in degrees.
+    :param radius_arcmin: <float> the cone radius in arcmin.
+
+    :return: <list/None> the rows inside the cone ordered by distance,  the
+             distance is added to the rows in arcmin.  None on error.
+    """
+    radius = radius_arcmin / 60.0
+
+    if target == 'objects':
+        query_name, ra_key, dec_key = 'cone_objects', 'ra_obj', 'dec_obj'
+    else:
+        query_name, ra_key, dec_key = 'cone_masks', 'ra_pnt', 'dec_pnt'
+
+    params = (cone_pixels(ra, dec, radius), dec - radius, dec + radius)
+    if not do_query(query_name, curse, params):
+        return None
+
+    candidates = gen_utils.get_dict_result(curse)
+    if not candidates:
+        return []
+
+    distances = angular_distance(ra, dec, [row[ra_key] for row in candidates],
+                                 [row[dec_key] for row in candidates])
+
+    results = []
+    for row, distance in zip(candidates, distances):
+        if distance <= radius:
+            row['distance'] = round(float(distance) * 60.0, 4)
+            results.append(row)
+
+    return sorted(results, key=lambda row: row['distance'])
+
+
+def backfill(db_obj, table, batch_size, log):
+    """
+    Set the SkyPix of the rows ingested before the sky index existed.
+
+    :param db_obj: <obj> the database object.
+    :param table: <str> 'designs' or 'objects'.
+    :param batch_size: <int> the number of rows per update and commit.
+    :param log: <obj> the log.
+
+    :return: <int> the number of rows updated.
+    """
+    select_name = SKY_TABLES[table]
+    update_name = select_name.replace('backfill', 'update')
+
+    curse = db_obj.get_dict_curse()
+    last_id = 0
+    total = 0
+
+    while True:
+        if not do_query(select_name, curse, (last_id, batch_size)):
+            break
+
+        rows = gen_utils.get_dict_result(curse)
+        if not rows:
+            break
+
+        last_id = rows[-1]['id']
+        ids, pixels = [], []
+        for row in rows:
+            pixel = sky_pixel(row['ra'], row['dec'])
+            if pixel is not None:
+                ids.append(row['id'])
+                pixels.append(pixel)
+
+        if ids and not do_query(update_name, curse, (ids, pixels)):
+            break
+
+        committed, msg = gen_utils.commitOrRollback(db_obj)
+        if not committed:
+            log.error(f'sky index backfill of {table} failed: {msg}')
+            break
+
+        total += len(ids)
+        log.info(f'sky index backfill of {table}: {total} rows, last id {last_id}')
+
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill the sky pixel index.')
+    parser.add_argument('config_file', help='Configuration File')
+    parser.add_argument('--batch', type=int, default=5000,
+                        help='rows per update and commit')
+    args = parser.parse_args()
+
+    config, log = gen_utils.start_up(APP_PATH, config_name=args.config_file)
+
+    from wspgconn import WsPgConn
+
+    db_obj = WsPgConn(MASK_ADMIN)
+    db_obj.db_connect()
+
+    for table_name in SKY_TABLES:
+        num_rows = backfill(db_obj, table_name, args.batch, log)
+        log.info(f'sky index backfill of {table_name} complete: {num_rows} rows')
+
+    db_obj.disconnect()
@@ -1,25 +1,33 @@
+import os
 import json
+import logging
+import uuid
 import zipfile
 import argparse
 from os import path
 from datetime import datetime, timedelta, date
 
-from io import BytesIO
 from functools import wraps
-from flask import Flask, request, make_response, redirect, send_file
-
-import re
-from astropy import units as u
-from astropy.coordinates import SkyCoord
+from flask import Blueprint, Flask, current_app, g, request, make_response, \
+    redirect, send_file
+from flask import Response, stream_with_context
 
 import bad_slits
+import sky_index
+import name_search
+import export_utils
+import mail_utils
+import metrics_utils
+import cache_utils
+import pgconn
+import profile_utils
 import apiutils as utils
+import logger_utils as log_fun
 import general_utils as gen_utils
 from slitmask_queries import get_query
 import admin_search_utils as search_utils
 
 from wspgconn import WsPgConn
-from ingest_fun import IngestFun
 from general_utils import do_query, is_admin
 
 import mask_constants as consts
@@ -27,27 +35,121 @@ import mask_constants as consts
 # set the path of the files
 APP_PATH = path.abspath(path.dirname(__file__))
 TEMPLATE_PATH = path.join(APP_PATH, "Templates/")
-app = Flask(__name__, template_folder=TEMPLATE_PATH)
-
 
-@app.after_request
+# the routes,  registered on each app by create_app
+bp = Blueprint('slitmask', __name__)
+
+# the API log,  configured by create_app
+log = logging.getLogger(log_fun.SLITMASK_LOGNAME)
+
+# the app settings (app.config) not read from the config file
+DEFAULT_SETTINGS = {
+    # requests slower than this (seconds) are logged with their phase breakdown
+    'SLOW_REQUEST': consts.SLOW_REQUEST_SECONDS,
+    # the route query budgets:  off,  warn (log),  or enforce (error response)
+    'QUERY_BUDGET_MODE': os.environ.get('SLITMASK_QUERY_BUDGET', 'warn'),
+    # the fraction of requests with their info lines logged
+    'LOG_SAMPLE_RATE': 1.0,
+    # the admin request profiles,  set when the profiling directory is configured
+    'PROFILE_STORE': None,
+    # restrict file uploads to 100 MB otherwise a 413 Too Large will be returned.
+    'MAX_CONTENT_LENGTH': 100 * 1024 * 1024,
+}
+
+# cached results,  invalidated by the database change notifications
+MILL_QUEUE_CACHE = cache_utils.registry.register(
+    'mill_queue', {'maskblu': None, 'mask': None, 'maskdesign': None}
+)
+CALIBRATION_CACHE = cache_utils.registry.register(
+    'calibration_masks', {'maskblu': None, 'mask': None, 'maskdesign': None}
+)
+
+# the lists of /slitmask/export,  their columns and whether admin only
+EXPORT_LISTS = {
+    'active-masks': (gen_utils.ACTIVE_MASKS_FORMAT, True),
+    'mill-queue': (gen_utils.MILL_QUEUE_FORMAT, False),
+    'admin-search': (gen_utils.SEARCH_RESULTS_FORMAT, True),
+    'user-inventory': (gen_utils.INVENTORY_FORMAT, False),
+    'timeline': (gen_utils.TIMELINE_FORMAT, True),
+}
+
+
+@bp.after_app_request
 def log_response_code(response):
     """
-    log the reponse after each request.
+    log the reponse after each request,  record the request latency and log
+    the slow requests with the time spent in each phase.
+
+    The statements of the request are checked against the route query
+    budget,  in the enforce mode (tests and benchmarks) a request over budget
+    is returned as an error.
 
     :param response: <JSON object> the http response
 
     :return: <JSON object> the response to return from route.
     """
-    log.info(f'Response code: {response.status_code}')
+    config = current_app.config
+    elapsed, phases, statements = metrics_utils.finish_request()
+    try:
+        if elapsed is None:
+            log.info(f'Response code: {response.status_code}')
+            return response
+
+        log.info(f'Response code: {response.status_code}, '
+                 f'queries: {sum(statements.values())}', extra={'duration': elapsed})
+
+        budget_mode = config['QUERY_BUDGET_MODE']
+        if budget_mode != 'off' and request.endpoint in current_app.view_functions:
+            violations = metrics_utils.budget_violations(
+                current_app.view_functions[request.endpoint], statements, consts.QUERY_REPEAT_LIMIT
+            )
+            if violations:
+                log.warning(f'Query budget exceeded {request.path}: {violations}')
+                if budget_mode == 'enforce':
+                    response = create_response(
+                        success=0, stat=500,
+                        err=f'Query budget exceeded: {"; ".join(violations)}'
+                    )
+
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics_utils.REQUEST_SECONDS.observe(elapsed, route=route, method=request.method,
+                                              status=response.status_code)
+
+        if elapsed >= config['SLOW_REQUEST']:
+            phases['other'] = max(elapsed - sum(phases.values()), 0)
+            breakdown = ', '.join(f'{phase}={seconds:.3f}s' for phase, seconds in phases.items())
+            log.warning(f'Slow request {request.path}: {elapsed:.3f}s ({breakdown})',
+                        extra={'duration': elapsed})
+    finally:
+        # every path,  the early return and an error too
+        request_id = log_fun.request_id()
+        if request_id:
+            response.headers['X-Request-Id'] = request_id
+        log_fun.end_request_context()
+
     return response
 
 
-@app.before_request
+@bp.teardown_app_request
+def close_db_connections(exc):
+    """
+    Close the database connections opened by the request,  an uncommitted
+    transaction is rolled back.
+    """
+    for db_obj in g.pop('db_objs', []):
+        db_obj.disconnect()
+
+
+@bp.before_app_request
 def log_request_info():
     """
     Log the request and parameters.
     """
+    metrics_utils.start_request()
+
+    request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex[:16]
+    log_fun.start_request_context(request_id[:64], current_app.config['LOG_SAMPLE_RATE'])
+
     request_args = request.args.to_dict()
     log.info(f"{request.path}: {request_args} : {request.remote_addr}")
 
@@ -63,6 +165,15 @@ def init_required(fun):
         if not user_info:
             return create_response(success=0, err='The user is not logged in.', stat=401)
 
+        profile_store = current_app.config['PROFILE_STORE']
+        if profile_store:
+            mode = profile_utils.profile_requested(request)
+            if mode and is_admin(user_info, log):
+                return profile_utils.profile_call(
+                    profile_store, mode, request, user_info,
+                    fun, db_obj=db_obj, user_info=user_info, *args, **kwargs
+                )
+
         return fun(db_obj=db_obj, user_info=user_info, *args, **kwargs)
     return decorated_function
 
@@ -93,15 +204,55 @@ def create_response(success=1, data={}, err='', stat=200):
     data = data if data is not None else []
 
     result_dict = {'success': success, 'data': data, 'error': err}
-    response = make_response(
-        json.dumps(result_dict, indent=2, default=serialize_datetime)
-    )
+    with metrics_utils.timer(None, 'encode'):
+        response = make_response(
+            json.dumps(result_dict, indent=2, default=serialize_datetime)
+        )
     response.status_code = stat
     response.headers['Content-Type'] = 'application/json'
 
     return response
 
 
+def create_stream_response(rows, data=None, rows_key=None, count_key=None):
+    """
+    The create_response JSON with the rows encoded and sent as they are read,
+    for the results too large to hold.  The request context (and its database
+    connection) is kept until the last row is sent,  an error after that
+    ends the response early,  with incomplete JSON.
+
+    :param rows: <iterable> the rows,  ie: gen_utils.iter_dict_result.
+    :param data: <dict> optional,  the other entries of the data.
+    :param rows_key: <str> optional,  the data key of the rows,  without it
+                     the rows are the data.
+    :param count_key: <str> optional,  the data key of the number of rows,
+                      written after the rows.
+
+    :return: <Response> the streamed response.
+    """
+    def chunks():
+        counter = {}
+        array = export_utils.json_array(rows, default=serialize_datetime, counter=counter)
+
+        if not rows_key:
+            yield b'{"success": 1, "data": '
+            yield from array
+            yield b', "error": ""}'
+            return
+
+        yield b'{"success": 1, "data": {'
+        for key, val in (data or {}).items():
+            yield f'{json.dumps(key)}: {json.dumps(val, default=serialize_datetime)}, '.encode()
+
+        yield f'{json.dumps(rows_key)}: '.encode()
+        yield from array
+        if count_key:
+            yield f', {json.dumps(count_key)}: {counter["rows"]}'.encode()
+        yield b'}, "error": ""}'
+
+    return Response(stream_with_context(chunks()), mimetype='application/json')
+
+
 class UserInfo:
     """
     The User Information Object to store user data.
@@ -147,6 +298,24 @@ class UserInfo:
         return results[0][0]
 
 
+def request_db(keck_id):
+    """
+    A database connection closed at the end of the request.
+
+    :param keck_id: <int> the keck id of the user,  or MASK_ADMIN.
+
+    :return: <WsPgConn> the connected database object,  None on error.
+    """
+    db_obj = WsPgConn(keck_id)
+    if not db_obj.db_connect():
+        log.error(f'could not connect to database with id: {keck_id}')
+        return None
+
+    g.setdefault('db_objs', []).append(db_obj)
+
+    return db_obj
+
+
 def init_api(keck_id=None):
     """
     Initialize the API,  find user information from the stored cookies.
@@ -158,23 +327,21 @@ def init_api(keck_id=None):
     """
     if keck_id:
         # used to bypass login to allow for internal scripts to query
-        db_obj = WsPgConn(keck_id)
-        if not db_obj.db_connect():
-            log.error(f'could not connect to database with id: {keck_id}')
+        db_obj = request_db(keck_id)
+        if not db_obj:
             return None, None
 
         return db_obj, None
 
-    userinfo = gen_utils.get_userinfo(OBS_INFO)
+    userinfo = gen_utils.get_userinfo(current_app.config['OBS_INFO'])
     if not userinfo:
         return None, None
 
     keck_id = userinfo['Id']
     user_email = userinfo['Email']
 
-    db_obj = WsPgConn(keck_id)
-    if not db_obj.db_connect():
-        log.error(f'could not connect to database with id: {keck_id}')
+    db_obj = request_db(keck_id)
+    if not db_obj:
         return None, None
 
     log.info(f"keck ID {keck_id}, user type: {db_obj.get_user_type()}")
@@ -192,7 +359,7 @@ def init_api(keck_id=None):
 ################################################################################
 
 
-@app.route("/slitmask/upload-mdf", methods=['POST'])
+@bp.route("/slitmask/upload-mdf", methods=['POST'])
 def upload_mdf():
     """
     Upload a mask file.
@@ -211,12 +378,17 @@ def upload_mdf():
     if not db_obj:
         return create_response(success=0, err='The user is not logged in.', stat=401)
 
-    in_fun = IngestFun(user_info, db_obj, OBS_INFO)
-    mask_path = f"{RAW_MDF_DIR}/{mdf_file.filename}"
+    # the ingest loads astropy and numpy,  only in the workers that ingest
+    from ingest_fun import IngestFun
+
+    config = current_app.config
+    in_fun = IngestFun(user_info, db_obj, config['OBS_INFO'])
+    mask_path = f"{config['RAW_MDF_DIR']}/{mdf_file.filename}"
     success, err_report = in_fun.ingestMDF(mdf_file, mask_path)
     if not success:
         errors = "\n".join([f"• {err}" for err in err_report])
-        return create_response(success=0, err=errors, stat=422)
+        issues = [issue.as_dict() for issue in in_fun.get_issues()]
+        return create_response(success=0, data={'issues': issues}, err=errors, stat=422)
 
     # the MDF data map
     maps = in_fun.get_maps()
@@ -228,7 +400,8 @@ def upload_mdf():
 
         # run dbmaskout inorder to get the mask_fits file for the gcode
         try:
-            maskout_files = utils.dbmaskout_runner(blue_id, KROOT, DBMASKOUT_DIR)
+            maskout_files = utils.dbmaskout_runner(blue_id, config['KROOT'],
+                                                   config['DBMASKOUT_DIR'])
         except Exception as err:
             log.error(f"error running dbMaskOut, {blue_id}, {err}")
             maskout_files = None
@@ -240,8 +413,8 @@ def upload_mdf():
         mask_fits_filename = maskout_files[0]
 
         # create the mill / gcode files [gcodepath, f2nlogpath]
-        gcode_files = utils.gcode_runner(blue_id, mask_fits_filename, KROOT,
-                                         NCMILL_DIR, consts.TOOL_DIAMETER)
+        gcode_files = utils.gcode_runner(blue_id, mask_fits_filename, config['KROOT'],
+                                         config['NCMILL_DIR'], consts.TOOL_DIAMETER)
         if not gcode_files or len(gcode_files) < 2:
             return create_response(
                 success=0, stat=401,
@@ -266,7 +439,7 @@ def upload_mdf():
 #    Mask Information / retrieval functions
 ################################################################################
 
-@app.route("/slitmask/mill-queue")
+@bp.route("/slitmask/mill-queue")
 def get_mill_queue():
     """
     Intended as an internal-only route.
@@ -282,7 +455,7 @@ def get_mill_queue():
     return create_response(data=ordered_results)
 
 
-@app.route("/slitmask/mill-overdue")
+@bp.route("/slitmask/mill-overdue")
 def get_overdue():
     """
     Find any masks in the milling queue that are marked to used soon.
@@ -315,10 +488,17 @@ def masks_need_mill():
 
     :return: <str> list of masks which want to be milled
     """
+    ordered_results = MILL_QUEUE_CACHE.get('all')
+    if ordered_results is not None:
+        return ordered_results
+
     db_obj, user_info = init_api()
     if not user_info:
         db_obj, user_info = init_api(keck_id=consts.MASK_ADMIN)
 
+    # read before the query,  a change during it is not cached
+    generation = MILL_QUEUE_CACHE.generation
+
     curse = db_obj.get_dict_curse()
     if not do_query('mill', curse, None):
         return create_response(success=0, err='Database Error!', stat=503)
@@ -326,10 +506,12 @@ def masks_need_mill():
     results = gen_utils.get_dict_result(curse)
 
     ordered_results = gen_utils.order_mill_queue(results)
+    MILL_QUEUE_CACHE.set('all', ordered_results, generation=generation)
+
     return ordered_results
 
 
-@app.route("/slitmask/calibration-masks")
+@bp.route("/slitmask/calibration-masks")
 @init_required
 def get_calibration_masks(db_obj, user_info):
     """
@@ -340,23 +522,31 @@ def get_calibration_masks(db_obj, user_info):
 
     :return: <str> list of calibration masks
     """
+    ordered_results = CALIBRATION_CACHE.get('all')
+    if ordered_results is not None:
+        return create_response(data=ordered_results)
+
+    # read before the query,  a change during it is not cached
+    generation = CALIBRATION_CACHE.generation
+
     curse = db_obj.get_dict_curse()
     if not do_query('standard_mask', curse, None):
         return create_response(success=0, err='Database Error!', stat=503)
 
     results = gen_utils.get_dict_result(curse)
     ordered_results = gen_utils.order_cal_inventory(results)
+    CALIBRATION_CACHE.set('all', ordered_results, generation=generation)
 
     return create_response(data=ordered_results)
 
 
-@app.route("/slitmask/user-type")
+@bp.route("/slitmask/user-type")
 @init_required
 def determine_user_type(db_obj, user_info):
     return create_response(data={'user_type': user_info.user_type_to_str()})
 
 
-@app.route("/slitmask/user-available-inventory")
+@bp.route("/slitmask/user-available-inventory")
 @init_required
 def get_user_available_inventory(db_obj, user_info):
     sucess, results = get_user_inventory_fun(db_obj, user_info)
@@ -368,7 +558,7 @@ def get_user_available_inventory(db_obj, user_info):
     return create_response(data=gen_utils.order_inventory(filtered_results))
 
 
-@app.route("/slitmask/user-mask-inventory")
+@bp.route("/slitmask/user-mask-inventory")
 @init_required
 def get_user_mask_inventory(db_obj, user_info):
     """
@@ -391,7 +581,7 @@ def get_user_inventory_fun(db_obj, user_info):
     filtered Available User Inventory options.
     """
     curse = db_obj.get_dict_curse()
-    obid_col = gen_utils.get_obid_column(curse, OBS_INFO)
+    obid_col = gen_utils.get_obid_column(curse, current_app.config['OBS_INFO'])
     if not obid_col:
         return False, None
 
@@ -405,7 +595,7 @@ def get_user_inventory_fun(db_obj, user_info):
     return True, results
 
 
-@app.route("/slitmask/mask-plot")
+@bp.route("/slitmask/mask-plot")
 @init_required
 def get_mask_plot(db_obj, user_info):
     """
@@ -473,7 +663,7 @@ def get_mask_plot(db_obj, user_info):
     return send_file(fname[0], mimetype='image/svg+xml')
 
 
-@app.route("/slitmask/user-access-level")
+@bp.route("/slitmask/user-access-level")
 @init_required
 def get_user_access_level(db_obj, user_info):
     """
@@ -488,7 +678,7 @@ def get_user_access_level(db_obj, user_info):
     return create_response(data={'access_level': user_info.user_str})
 
 
-@app.route("/slitmask/extend-mask-use-date")
+@bp.route("/slitmask/extend-mask-use-date")
 @init_required
 def extend_mask_use_date(db_obj, user_info):
     """
@@ -527,6 +717,10 @@ def extend_mask_use_date(db_obj, user_info):
     if not do_query('extend_update', curse, (num_days, design_id)):
         return create_response(success=0, err='Database Error!', stat=503)
 
+    if not utils.record_mask_event(curse, consts.EVENT_USE_DATE, design_id=design_id,
+                                   detail=f'extended {num_days} days'):
+        return create_response(success=0, err='Database Error!', stat=503)
+
     committed, msg = gen_utils.commitOrRollback(db_obj)
     if not committed:
         return create_response(success=0, err=msg, stat=503)
@@ -537,7 +731,7 @@ def extend_mask_use_date(db_obj, user_info):
     return create_response(data={'msg': msg})
 
 
-@app.route("/slitmask/archive-mask-script")
+@bp.route("/slitmask/archive-mask-script")
 def archive_mask_script():
     """
     Intended as an internal-only route.
@@ -551,7 +745,7 @@ def archive_mask_script():
     return archive_mask_fun(db_obj, user_info)
 
 
-@app.route("/slitmask/archive-mask")
+@bp.route("/slitmask/archive-mask")
 @init_required
 def archive_mask(db_obj, user_info):
     """
@@ -609,7 +803,45 @@ def archive_mask_fun(db_obj, user_info):
     return create_response(data={'msg': f'Mask with blue id = {blue_id} has been archived'})
 
 
-@app.route("/slitmask/mask-description-file")
+@bp.route("/slitmask/archive-sweep-script")
+@metrics_utils.query_budget(5)
+def archive_sweep_script():
+    """
+    Intended as an internal-only route.
+
+    Archive all the masks matching the HIT LIST purge criteria in one
+    transaction,  use date older than months and not perpetual.
+
+    inputs:
+        months <int> optional,  default consts.ARCHIVE_AFTER_MONTHS
+        dry-run <str> optional,  'true' to only list the masks to archive
+
+    :return: <JSON object> data = {'dry_run': <bool>, 'months': <int>,
+                                   'count': <int>, 'masks': []}
+    """
+    db_obj, user_info = init_api(keck_id=consts.MASK_ADMIN)
+    if not db_obj:
+        return create_response(success=0, err='Database Error!', stat=503)
+
+    try:
+        months = int(request.args.get('months', consts.ARCHIVE_AFTER_MONTHS))
+    except (ValueError, TypeError):
+        return create_response(success=0, stat=422, err='months must be an integer.')
+
+    if months < 1:
+        return create_response(success=0, stat=422, err='months must be positive.')
+
+    dry_run = request.args.get('dry-run', 'false').lower() in ('true', '1', 'yes')
+
+    success, masks = utils.archive_sweep(db_obj, months, dry_run=dry_run)
+    if not success:
+        return create_response(success=0, err='Database Error!', stat=503)
+
+    return create_response(data={'dry_run': dry_run, 'months': months,
+                                 'count': len(masks), 'masks': masks})
+
+
+@bp.route("/slitmask/mask-description-file")
 @init_required
 def get_mask_description_file(db_obj, user_info):
     """
@@ -622,6 +854,7 @@ def get_mask_description_file(db_obj, user_info):
     HDUs in the FITS file are tables which describe a slitmask
 
     blue_id       the BlueprintId of the slitmask
+    compress      optional,  no to zip the files without compression
 
     outputs:
         fitsfile    path to the FITS tables file written by dbMaskOut
@@ -636,10 +869,11 @@ def get_mask_description_file(db_obj, user_info):
         msg = f"Unauthorized: BluId {blue_id} does not belong to {user_info.keck_id}"
         return create_response(success=0, err=f'{msg}', stat=401)
 
-    exec_dir = f"{KROOT}/{DBMASKOUT_DIR}"
-    out_dir = f"{KROOT}/var/dbMaskOut/"
+    kroot = current_app.config['KROOT']
+    exec_dir = f"{kroot}/{current_app.config['DBMASKOUT_DIR']}"
+    out_dir = f"{kroot}/var/dbMaskOut/"
     mask_fits_filename, mask_ali_filename = utils.generate_mask_descript(
-        blue_id, exec_dir, out_dir, KROOT
+        blue_id, exec_dir, out_dir, kroot
     )
 
     if not mask_fits_filename:
@@ -647,20 +881,19 @@ def get_mask_description_file(db_obj, user_info):
         return create_response(success=0, err=f'{msg}', stat=401)
 
     mdf_files = [mask_fits_filename, mask_ali_filename]
+    missing = missing_files(mdf_files)
+    if missing:
+        log.error(f"mask description files not found, {blue_id}, {missing}")
+        return create_response(success=0, stat=503,
+                               err='The mask description files were not found!')
 
-    # Create a zip file in memory to store the files
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        for file_path in mdf_files:
-            zip_file.write(file_path, arcname=file_path.split("/")[-1])
-
-    zip_buffer.seek(0)
+    # the zip is written as the files are read
+    return stream_response(export_utils.zip_stream(mdf_files, zip_compression()),
+                           'application/zip', f'mdf-files-{blue_id}.zip')
 
-    return send_file(zip_buffer, download_name=f'mdf-files-{blue_id}.zip', as_attachment=True)
 
-
-@app.route("/slitmask/mill-file")
-@app.route("/slitmask/mill-files")
+@bp.route("/slitmask/mill-file")
+@bp.route("/slitmask/mill-files")
 @init_required
 def mill_files(db_obj, user_info):
     """
@@ -674,6 +907,7 @@ def mill_files(db_obj, user_info):
 
     inputs:
         bluid       BlueprintId should exist in the database
+        compress    optional,  no to zip the files without compression
 
     outputs:
     path to G-code file which tell CNC mill how to cut the mask
@@ -705,9 +939,11 @@ def mill_files(db_obj, user_info):
         return create_response(success=0, stat=401,
                                err=f'The mask blueprint ID, blue-id is required!')
 
+    config = current_app.config
+
     # run dbmaskout inorder to get the mask_fits file
     try:
-        maskout_files = utils.dbmaskout_runner(blue_id, KROOT, DBMASKOUT_DIR)
+        maskout_files = utils.dbmaskout_runner(blue_id, config['KROOT'], config['DBMASKOUT_DIR'])
     except Exception as err:
         log.error(f"error running dbMaskOut, {blue_id}, {err}")
         maskout_files = None
@@ -719,27 +955,50 @@ def mill_files(db_obj, user_info):
     mask_fits_filename = maskout_files[0]
 
     # create the mill / gcode files
-    gcode_files = utils.gcode_runner(blue_id, mask_fits_filename, KROOT,
-                                     NCMILL_DIR, consts.TOOL_DIAMETER)
+    gcode_files = utils.gcode_runner(blue_id, mask_fits_filename, config['KROOT'],
+                                     config['NCMILL_DIR'], consts.TOOL_DIAMETER)
     if not gcode_files:
         return create_response(
             success=0, stat=401,
             err=f'There was a problem creating the gcode files!'
         )
 
-    # Create an in-memory zip file to store the files
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        for file_path in gcode_files:
-            zip_file.write(file_path, arcname=file_path.split("/")[-1])
+    missing = missing_files(gcode_files)
+    if missing:
+        log.error(f"gcode files not found, {blue_id}, {missing}")
+        return create_response(success=0, stat=503,
+                               err='The gcode files were not found!')
+
+    # the zip is written as the files are read
+    return stream_response(export_utils.zip_stream(gcode_files, zip_compression()),
+                           'application/zip', f'gcode-files-{blue_id}.zip')
 
-    zip_buffer.seek(0)
 
-    return send_file(zip_buffer, download_name=f'gcode-files-{blue_id}.zip',
-                     as_attachment=True)
+def zip_compression():
+    """
+    The files are deflated unless compress=no is given,  to skip the
+    compression of a download only read once.
+    """
+    if request.args.get('compress', 'yes').lower() in ('no', 'false', '0'):
+        return zipfile.ZIP_STORED
+
+    return zipfile.ZIP_DEFLATED
+
+
+def missing_files(file_paths):
+    """
+    The zip is read after the headers are sent,  a missing file could only
+    end the download early,  so the files are checked before.
 
+    :param file_paths: <list> the files to zip.
 
-@app.route("/slitmask/remill-mask")
+    :return: <list> the files which do not exist.
+    """
+    return [file_path for file_path in file_paths
+            if not file_path or not path.isfile(file_path)]
+
+
+@bp.route("/slitmask/remill-mask")
 @init_required
 def remill_mask(db_obj, user_info):
     """
@@ -800,6 +1059,11 @@ def remill_mask(db_obj, user_info):
     if not do_query('remill_set_date', curse, (new_use_date, blue_id)):
         return create_response(success=0, err='Database Error!', stat=503)
 
+    # the new use date event,  committed with the status by maskStatus
+    if not utils.record_mask_event(curse, consts.EVENT_USE_DATE, blue_ids=[blue_id],
+                                   detail=f'remill use date {new_use_date}'):
+        return create_response(success=0, err='Database Error!', stat=503)
+
     # mark blueprint as Millable
     success = utils.maskStatus(db_obj, blue_id, consts.UNMILLED)
     if not success:
@@ -807,11 +1071,13 @@ def remill_mask(db_obj, user_info):
               f'was not able to mark mask to be re-milled'
         return create_response(success=0, stat=503, err=err)
 
+    config = current_app.config
+
     # get the PI emails associated with the mask
-    pi_emails = utils.get_design_owner_emails(db_obj, blue_id, design_id, OBS_INFO)
+    pi_emails = utils.get_design_owner_emails(db_obj, blue_id, design_id, config['OBS_INFO'])
 
     # add the two lists removing any duplicates
-    email_list = list(set([EMAIL_INFO['admin'], user_info.email] + pi_emails))
+    email_list = list(set([config['EMAIL_INFO']['admin'], user_info.email] + pi_emails))
 
     subject = f'Mask set to be remilled, blue-id={blue_id}'
 
@@ -819,28 +1085,145 @@ def remill_mask(db_obj, user_info):
           f'marked to be remilled,  new use date={new_use_date}' \
           f'\n\nThe following email addresses have been notified: {email_list}'
 
-    # Email the PI
-    EMAIL_INFO['to_list'] = email_list
-    utils.send_email(msg, EMAIL_INFO, subject)
+    # Email the PI,  EMAIL_INFO is shared by the requests
+    utils.send_email(msg, {**config['EMAIL_INFO'], 'to_list': email_list}, subject)
 
     return create_response(data={'msg': msg})
 
 
+@bp.route("/slitmask/batch-status")
+@metrics_utils.query_budget(12)
+@init_required
+def batch_status(db_obj, user_info):
+    """
+    Change the status of many blueprints at once,  ie: re-mill a whole run
+    after a mill fault or restore a set of calibration masks.
+
+    inputs:
+        blue-ids <str> comma separated blueprint ids
+        design-ids <str> comma separated design ids,  all of their blueprints
+        target <str> archive, remill or ready (admin only)
+        use-date <str> optional,  the new use date,  ie: for remill,  or
+                       consts.PERPETUAL_DATE with ready to restore standards
+
+    The ownership of all the blueprints is checked with one query and all the
+    updates are made in one transaction.  The owners are sent one e-mail
+    listing all of their blueprints.
+
+    :return: <JSON object> data = {'msg': <str>, 'blue_ids': <list>}
+    """
+    target = request.args.get('target')
+    new_use_date = request.args.get('use-date')
+
+    if target not in consts.BATCH_TARGETS:
+        return create_response(
+            success=0, stat=422,
+            err=f'target must be one of: {", ".join(consts.BATCH_TARGETS)}'
+        )
+
+    try:
+        blue_ids = [int(val) for val in request.args.get('blue-ids', '').split(',') if val]
+        design_ids = [int(val) for val in request.args.get('design-ids', '').split(',') if val]
+    except ValueError:
+        return create_response(success=0, stat=422,
+                               err='blue-ids and design-ids must be integers.')
+
+    if not blue_ids and not design_ids:
+        return create_response(success=0, stat=401,
+                               err=f'One of blue-ids or design-ids are required!')
+
+    if new_use_date:
+        try:
+            datetime.strptime(new_use_date, '%Y-%m-%d')
+        except ValueError:
+            return create_response(success=0, stat=422,
+                                   err='use-date must be a date,  YYYY-MM-DD.')
+
+    new_status, clear_millseq, notify = consts.BATCH_TARGETS[target]
+
+    if new_status == consts.READY and not is_admin(user_info, log):
+        return create_response(success=0, err='Unauthorized', stat=401)
+
+    curse = db_obj.get_dict_curse()
+    success, blueprints = utils.batch_blueprints(curse, user_info, blue_ids, design_ids)
+    if not success:
+        return create_response(success=0, err='Database Error!', stat=503)
+
+    found_ids = {blueprint['bluid'] for blueprint in blueprints}
+    found_designs = {blueprint['desid'] for blueprint in blueprints}
+    missing = [f'blue-id={blue_id}' for blue_id in blue_ids if blue_id not in found_ids]
+    missing += [f'design-id={des_id}' for des_id in design_ids if des_id not in found_designs]
+    if missing:
+        return create_response(success=0, stat=422,
+                               err=f'No mask exists with: {", ".join(missing)}')
+
+    if len(blueprints) > consts.BATCH_LIMIT:
+        return create_response(
+            success=0, stat=422,
+            err=f'{len(blueprints)} blueprints exceeds the limit of {consts.BATCH_LIMIT}.'
+        )
+
+    not_owned = [blueprint['bluid'] for blueprint in blueprints if not blueprint['owned']]
+    if not_owned:
+        return create_response(success=0, stat=401,
+                               err=f'Unauthorized for blue-ids: {not_owned}')
+
+    change_ids = sorted(found_ids)
+    success = utils.blueprints_status(db_obj, change_ids, new_status,
+                                      clear_millseq=clear_millseq,
+                                      use_date=new_use_date)
+    if not success:
+        return create_response(
+            success=0, stat=503,
+            err=f'Database Error! The blueprints were not set to {target}.'
+        )
+
+    msg = f'{len(change_ids)} blueprints set to ' \
+          f'{consts.STATUS_STR[new_status]} ({target})'
+    if new_use_date:
+        msg += f',  new use date={new_use_date}'
+
+    if notify:
+        email_info = current_app.config['EMAIL_INFO']
+        owner_blueprints = utils.blueprint_owner_emails(curse, blueprints,
+                                                        current_app.config['OBS_INFO'])
+        for email in {email_info['admin'], user_info.email}:
+            owner_blueprints[email] = blueprints
+
+        subject = f'{len(change_ids)} masks set to {target}'
+        for email, email_blueprints in owner_blueprints.items():
+            lines = [f"blue-id={blueprint['bluid']},  design-id={blueprint['desid']},"
+                     f"  {blueprint['guiname']}" for blueprint in email_blueprints]
+            email_msg = f'{msg}\n\n' + '\n'.join(lines)
+            utils.send_email(email_msg, {**email_info, 'to_list': [email]}, subject)
+
+        msg += f'\n\nThe following email addresses have been notified: ' \
+               f'{list(owner_blueprints)}'
+
+    return create_response(data={'msg': msg, 'blue_ids': change_ids})
+
+
 ################################################################################
 ################################################################################
 # Admin-only API functions
 ################################################################################
 
 
-@app.route("/slitmask/admin-search")
+@bp.route("/slitmask/admin-search")
+@metrics_utils.query_budget(6)
 @init_required
 def admin_search(db_obj, user_info):
     """
-    Find masks by the search options,  key-value JSON of options.
+    Find masks by the search options,  key-value JSON of options.  All the
+    options given are combined,  see admin_search_utils.admin_search.
 
     def getAdminMaskInventory( db, dict ):
 
-    :return: <JSON object> data = the search results.
+    The searches estimated to match more than SEARCH_MAX_ROWS masks need a
+    limit.  With "explain": true the planner estimate is returned instead.
+
+    :return: <JSON object> data = the search results,  or the estimate
+             {'cost': <float>, 'rows': <int>}.
     """
     search_options = request.args.get('search-options')
 
@@ -857,24 +1240,133 @@ def admin_search(db_obj, user_info):
     if not is_admin(user_info, log):
         return create_response(success=0, err='Unauthorized', stat=401)
 
-    # get the query based on the search options
-    query_dict = search_utils.admin_search(search_options, db_obj, OBS_INFO)
+    # compile the search options into one query
+    query_dict = search_utils.admin_search(search_options, db_obj, current_app.config['OBS_INFO'])
     if query_dict['msg']:
         results = [{'results': query_dict['msg']}]
         return create_response(success=1, data=results)
 
     curse = db_obj.get_dict_curse()
 
-    if not do_query(None, curse, query_dict['query_args'], query=query_dict['query']):
+    # the planner estimate,  the searches over too many masks need a limit
+    if not do_query('admin_search_explain', curse, query_dict['query_args'],
+                    query=f"EXPLAIN (FORMAT JSON) {query_dict['query']}"):
         return create_response(success=0, err='Database Error!', stat=503)
 
-    results = gen_utils.get_dict_result(curse)
-    ordered_results = gen_utils.order_search_results(results)
+    estimate = search_utils.search_estimate(gen_utils.get_dict_result(curse))
+    if search_options.get('explain'):
+        return create_response(success=1, data=estimate)
+
+    msg = search_utils.unbounded_msg(query_dict, estimate)
+    if msg:
+        return create_response(success=1, data=[{'results': msg}])
+
+    curse = db_obj.get_stream_curse()
+    if not do_query('admin_search', curse, query_dict['query_args'],
+                    query=query_dict['query']):
+        return create_response(success=0, err='Database Error!', stat=503)
+
+    # the results are formatted and sent a chunk at a time
+    results = (row for rows in export_utils.iter_chunks(curse)
+               for row in gen_utils.order_search_results(rows))
 
-    return create_response(success=1, data=ordered_results)
+    response = create_stream_response(results)
+    response.headers['X-Search-Cost'] = str(estimate['cost'])
 
+    return response
+
+
+@bp.route("/slitmask/cone-search")
+@metrics_utils.query_budget(4)
+@init_required
+def cone_search(db_obj, user_info):
+    """
+    Find the mask pointings or the catalog objects within a radius of a
+    position,  ie: has this field been observed with a mask before.
+
+    inputs:
+        ra <float> right ascension in degrees
+        dec <float> declination in degrees
+        radius <float> the search radius in arcmin
+        target <str> optional,  'masks' (default) or 'objects'
+
+    :return: <JSON object> data = the results ordered by distance,  with the
+             distance in arcmin.
+    """
+    if not is_admin(user_info, log):
+        return create_response(success=0, err='Unauthorized', stat=401)
+
+    target = request.args.get('target', 'masks')
+    if target not in ('masks', 'objects'):
+        return create_response(success=0, stat=422,
+                               err="target must be 'masks' or 'objects'")
+
+    try:
+        ra = float(request.args.get('ra'))
+        dec = float(request.args.get('dec'))
+        radius = float(request.args.get('radius'))
+    except (ValueError, TypeError):
+        return create_response(success=0, stat=422,
+                               err='ra, dec (degrees) and radius (arcmin) '
+                                   'are required numbers.')
+
+    if not -90 <= dec <= 90 or not 0 < radius <= consts.CONE_MAX_RADIUS:
+        return create_response(
+            success=0, stat=422,
+            err=f'dec must be within +/-90 and radius within '
+                f'0-{consts.CONE_MAX_RADIUS} arcmin.'
+        )
+
+    curse = db_obj.get_dict_curse()
+    results = sky_index.cone_search(curse, target, ra, dec, radius)
+    if results is None:
+        return create_response(success=0, err='Database Error!', stat=503)
 
-@app.route("/slitmask/recently-scanned-barcodes")
+    return create_response(success=1, data=results)
+
+
+@bp.route("/slitmask/name-suggest")
+@metrics_utils.query_budget(3)
+@init_required
+def name_suggest(db_obj, user_info):
+    """
+    The mask names similar to the text typed,  for the admin search
+    typeahead.  The names are matched and ranked with the pg_trgm trigram
+    indexes,  see name_search.
+
+    inputs:
+        q <str> the text typed,  at least NAME_MIN_CHARS characters
+        fields <str> optional,  comma separated guiname,  bluname,  desname,
+                     default all
+        limit <int> optional,  the number of names,  default
+                    NAME_SUGGEST_LIMIT
+
+    :return: <JSON object> data = the names with the field,  the newest id
+             (BluId or DesId),  the number of masks with the name and the
+             score (0-1),  the best first.
+    """
+    if not is_admin(user_info, log):
+        return create_response(success=0, err='Unauthorized', stat=401)
+
+    fields = name_search.parse_fields(request.args.get('fields'))
+    if not fields:
+        return create_response(success=0, stat=422,
+                               err=f'fields must be of {list(name_search.NAME_FIELDS)}')
+
+    try:
+        limit = int(request.args.get('limit', consts.NAME_SUGGEST_LIMIT))
+    except ValueError:
+        return create_response(success=0, err='limit must be an integer.', stat=422)
+
+    curse = db_obj.get_dict_curse()
+    results = name_search.suggest(curse, request.args.get('q', ''), fields, limit)
+    if results is None:
+        return create_response(success=0, err='Database Error!', stat=503)
+
+    return create_response(success=1, data=results)
+
+
+@bp.route("/slitmask/recently-scanned-barcodes")
 def get_recently_scanned_barcodes():
     """
     Intended as an internal-only route.
@@ -916,7 +1408,8 @@ def get_recently_scanned_barcodes():
     return create_response(data=gen_utils.order_scanned_barcodes(results))
 
 
-@app.route("/slitmask/recently-scanned-emails")
+@bp.route("/slitmask/recently-scanned-emails")
+@metrics_utils.query_budget(6)
 def get_users_recently_milled():
     """
     Intended as an internal-only route.
@@ -939,17 +1432,12 @@ def get_users_recently_milled():
     results = gen_utils.get_dict_result(curse)
     if not results:
         return create_response(data=results)
-    for result in results:
-        try:
-            observer_id = result['despid']
-        except Exception as err:
-            log.warning(f'Design PID not found in results, error: {err}')
-            continue
-        result['obs'] = gen_utils.get_obs_by_maskid(curse, observer_id, OBS_INFO)
+    # one read of the observer table for all the results
+    gen_utils.attach_observers(curse, results, current_app.config['OBS_INFO'])
     return create_response(data=gen_utils.group_by_email(results))
 
 
-@app.route("/slitmask/timeline-report")
+@bp.route("/slitmask/timeline-report")
 @init_required
 def get_timeline_report(db_obj, user_info):
     """
@@ -972,18 +1460,14 @@ def get_timeline_report(db_obj, user_info):
     if not do_query('timeline', curse, (recent_date,)):
         return create_response(success=0, err='Database Error!', stat=503)
 
-    results = gen_utils.get_dict_result(curse)
-
-    # add the number of days the mask was submitted before the observation days
-    for result in results:
-        result['ndays'] = (result['date_use'] - result['stamp']).days
+    results = add_ndays(gen_utils.get_dict_result(curse))
 
     clean_results = gen_utils.order_timeline_results(results)
 
     return create_response(data=clean_results)
 
 
-@app.route("/slitmask/all-active-masks")
+@bp.route("/slitmask/all-active-masks")
 @init_required
 def get_all_active_masks(db_obj, user_info):
     """
@@ -1007,50 +1491,201 @@ def get_all_active_masks(db_obj, user_info):
     return create_response(data=gen_utils.order_active_masks(filtered_results))
 
 
-@app.route("/slitmask/all-active-masks-file")
+@bp.route("/slitmask/all-active-masks-file")
+@metrics_utils.query_budget(4)
 @init_required
-def get_all_active_masks_file(db_obj, user_info ):
+def get_all_active_masks_file(db_obj, user_info):
     """
     The route produces a text file output of the results of all active masks.
     This is currently used by the support technicians when cleaning out masks
     that have been marked as archived.
+
+    The file is streamed from a server-side cursor as it is written.
     """
     # initialize db,  get user information,  redirect if not logged in.
     if not is_admin(user_info, log):
         return create_response(success=0, err='Unauthorized', stat=401)
 
-    success, results = get_all_valid_masks_func(db_obj)
-    if not success:
+    curse, prepare = open_active_masks(db_obj)
+    if not curse:
         return create_response(success=0, err='Database Error!', stat=503)
 
-    # remove any masks with status != READY (READY)
-    filtered_results = []
-    for mask in results:
-        if mask['status'] == consts.READY:
-            filtered_results.append(mask)
+    date_str = datetime.utcnow().strftime('%Y%m%d')
+
+    # the columns wanted in the file and their spacing
+    widths = export_utils.ACTIVE_MASKS_WIDTHS
+    chunks = export_utils.stream_export(
+        export_utils.iter_chunks(curse), gen_utils.ACTIVE_MASKS_FORMAT, 'fixed',
+        columns=list(widths), widths=widths, prepare=prepare
+    )
+
+    return export_response(chunks, 'fixed', f'active-masks-{date_str}')
+
+
+@bp.route("/slitmask/export")
+@metrics_utils.query_budget(5)
+@init_required
+def export_list(db_obj, user_info):
+    """
+    Stream a list as a file,  the rows are read from a server-side cursor and
+    written in chunks,  so any number of rows is sent in constant memory.
+
+    inputs:
+        list - one of:
+            active-masks    the READY masks (admin)
+            mill-queue      the masks to mill
+            admin-search    the masks found by search-options (admin)
+            user-inventory  the masks of the logged in user
+            timeline        the masks submitted in the last number-days (admin)
+        format - fixed,  csv (default),  tsv,  parquet or arrow
+
+    :return: <file> the rows with the columns of the JSON route.
+    """
+    list_name = request.args.get('list')
+    fmt = request.args.get('format', 'csv').lower()
+
+    if list_name not in EXPORT_LISTS:
+        return create_response(success=0, stat=400,
+                               err=f'list must be one of: {", ".join(EXPORT_LISTS)}')
+
+    if fmt not in export_utils.EXPORT_FORMATS:
+        return create_response(success=0, stat=400,
+                               err=f'format must be one of: '
+                                   f'{", ".join(export_utils.EXPORT_FORMATS)}')
+
+    if not export_utils.format_available(fmt):
+        return create_response(success=0, stat=501,
+                               err=f'The {fmt} format is not available on this server.')
+
+    formatter, admin_only = EXPORT_LISTS[list_name]
+    if admin_only and not is_admin(user_info, log):
+        return create_response(success=0, err='Unauthorized', stat=401)
+
+    prepare = None
+    if list_name == 'active-masks':
+        curse, prepare = open_active_masks(db_obj)
+
+    elif list_name == 'mill-queue':
+        curse = db_obj.get_stream_curse()
+        if not do_query('mill', curse, None):
+            curse = None
+
+    elif list_name == 'user-inventory':
+        obid_col = gen_utils.get_obid_column(db_obj.get_dict_curse(),
+                                             current_app.config['OBS_INFO'])
+        curse = db_obj.get_stream_curse()
+        if not obid_col or not do_query('user_inventory', curse,
+                                        (obid_col, user_info.ob_id, user_info.ob_id)):
+            curse = None
+
+    elif list_name == 'timeline':
+        recent_date = gen_utils.get_recent_day(request)
+        prepare = add_ndays
+        curse = db_obj.get_stream_curse()
+        if not do_query('timeline', curse, (recent_date,)):
+            curse = None
+
+    else:
+        try:
+            search_options = json.loads(request.args.get('search-options') or '{}')
+        except ValueError:
+            search_options = None
+
+        # the export is not held in memory,  a search without limit may run
+        query_dict = search_utils.admin_search(search_options, db_obj,
+                                               current_app.config['OBS_INFO'])
+        if query_dict['msg']:
+            return create_response(success=0, err=query_dict['msg'], stat=400)
+
+        curse = db_obj.get_stream_curse()
+        if not do_query('admin_search', curse, query_dict['query_args'],
+                        query=query_dict['query']):
+            curse = None
+
+    if not curse:
+        return create_response(success=0, err='Database Error!', stat=503)
+
+    chunks = export_utils.stream_export(export_utils.iter_chunks(curse), formatter, fmt,
+                                        prepare=prepare)
 
-    # order masks,  and also clean the date into a more user-friendly format
-    filtered_results = gen_utils.order_active_masks(filtered_results)
     date_str = datetime.utcnow().strftime('%Y%m%d')
-    out_file = f"/tmp/active-masks-{date_str}.txt"
 
-    # set the columns wanted in the file and specify the spacing.
-    col_widths = {"Barcode": 8, "GUI-Name": 20, "Seq": 4, "Date-Use": 12,
-                  "First-Name": 12, "Last-Name": 12, "Inst": 8}
+    return export_response(chunks, fmt, f'{list_name}-{date_str}')
+
+
+def export_response(chunks, fmt, file_name):
+    """
+    :param chunks: <generator> the bytes of the file.
+    :param fmt: <str> the export format.
+    :param file_name: <str> the download name,  without the extension.
+    """
+    mimetype, extension = export_utils.EXPORT_FORMATS[fmt]
+
+    return stream_response(chunks, mimetype, f'{file_name}.{extension}')
+
+
+def stream_response(chunks, mimetype, download_name):
+    """
+    The streamed download,  the request context (and its database
+    connection) is kept until the last chunk is sent.
+
+    :param chunks: <generator> the bytes of the file.
+    :param mimetype: <str> the content type.
+    :param download_name: <str> the file name.
+    """
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={download_name}'
+    })
+
+
+def open_active_masks(db_obj, ready_only=True):
+    """
+    Run the valid masks query on a server-side cursor,  see
+    get_all_valid_masks_func.
+
+    :param ready_only: <bool> False to keep the masks not READY.
+
+    :return: <obj, function> the cursor (None on error) and the preparation
+             of the rows,  the (READY) masks with their observer names.
+    """
+    observers = gen_utils.get_observer_dict(db_obj.get_dict_curse(),
+                                            current_app.config['OBS_INFO'])
+    if not observers:
+        return None, None
+
+    match_dict = {observer['obid']: observer for observer in observers}
+
+    curse = db_obj.get_stream_curse()
+    if not do_query('mask_valid', curse, (list(match_dict), )):
+        return None, None
+
+    def prepare(rows):
+        masks = []
+        for mask in rows:
+            if ready_only and mask['status'] != consts.READY:
+                continue
+            observer = match_dict.get(mask['obid'])
+            if observer:
+                for key in ('keckid', 'FirstName', 'LastName', 'Email'):
+                    mask[key] = observer.get(key)
+            masks.append(mask)
+
+        return masks
 
-    with open(out_file, mode='w') as file:
-        headers = "".join(col.ljust(col_widths[col]) for col in col_widths.keys())
-        file.write(headers + "\n")
+    return curse, prepare
 
-        for row in filtered_results:
-            line = "".join(str(row[col]).ljust(col_widths[col]) for col in col_widths.keys())
-            file.write(line + "\n")
 
-    return send_file(out_file, download_name=f'active-masks-{date_str}.txt',
-                     as_attachment=True)
+def add_ndays(rows):
+    """
+    The number of days the mask was submitted before the observation days.
+    """
+    for row in rows:
+        row['ndays'] = (row['date_use'] - row['stamp']).days
+
+    return rows
 
 
-@app.route("/slitmask/all-active-masks-script")
+@bp.route("/slitmask/all-active-masks-script")
 def get_all_valid_masks_script():
     """
     Intended as an internal-only route.
@@ -1061,11 +1696,14 @@ def get_all_valid_masks_script():
     """
     db_obj, user_info = init_api(keck_id=consts.MASK_ADMIN)
 
-    success, results = get_all_valid_masks_func(db_obj)
-    if not success:
+    curse, prepare = open_active_masks(db_obj, ready_only=False)
+    if not curse:
         return create_response(success=0, err='Database Error!', stat=503)
 
-    return create_response(data=results)
+    # all the masks,  streamed from the server-side cursor
+    masks = (mask for rows in export_utils.iter_chunks(curse) for mask in prepare(rows))
+
+    return create_stream_response(masks)
 
 
 def get_all_valid_masks_func(db_obj):
@@ -1079,9 +1717,9 @@ def get_all_valid_masks_func(db_obj):
     :return: info about masks which should be stored at summit
     """
     curse = db_obj.get_dict_curse()
-    obid_col = gen_utils.get_obid_column(curse, OBS_INFO)
+    obid_col = gen_utils.get_obid_column(curse, current_app.config['OBS_INFO'])
 
-    full_obs_info = gen_utils.get_observer_dict(curse, OBS_INFO)
+    full_obs_info = gen_utils.get_observer_dict(curse, current_app.config['OBS_INFO'])
     if not full_obs_info or not obid_col:
         return False, None
 
@@ -1105,7 +1743,7 @@ def get_all_valid_masks_func(db_obj):
     return True, results
 
 
-@app.route("/slitmask/delete-mask")
+@bp.route("/slitmask/delete-mask")
 @init_required
 def delete_mask(db_obj, user_info):
     """
@@ -1160,6 +1798,10 @@ def delete_mask(db_obj, user_info):
     if not do_query('mask_table_delete', curse, (mask_id,)):
         return create_response(success=0, err='Database Error!', stat=503)
 
+    if not utils.record_mask_event(curse, consts.EVENT_DELETED, blue_ids=[blue_id],
+                                   mask_id=mask_id):
+        return create_response(success=0, err='Database Error!', stat=503)
+
     # check that it was successful
     committed, msg = gen_utils.commitOrRollback(db_obj)
     if not committed:
@@ -1191,7 +1833,7 @@ def delete_mask(db_obj, user_info):
     return create_response(data={'msg': f'mask: {mask_id} deleted.'})
 
 
-@app.route("/slitmask/set-perpetual-mask-use-date")
+@bp.route("/slitmask/set-perpetual-mask-use-date")
 @init_required
 def set_perpetual_mask_use_date(db_obj, user_info):
     """
@@ -1226,6 +1868,10 @@ def set_perpetual_mask_use_date(db_obj, user_info):
     if not do_query('update_perpetual', curse, (design_id,)):
         return create_response(success=0, err='Database Error!', stat=503)
 
+    if not utils.record_mask_event(curse, consts.EVENT_USE_DATE, design_id=design_id,
+                                   detail=f'perpetual {consts.PERPETUAL_DATE}'):
+        return create_response(success=0, err='Database Error!', stat=503)
+
     committed, msg = gen_utils.commitOrRollback(db_obj)
     if not committed:
         return create_response(success=0, err=msg, stat=503)
@@ -1234,6 +1880,11 @@ def set_perpetual_mask_use_date(db_obj, user_info):
     if not do_query('forgotten_status', curse, (design_id, )):
         return create_response(success=0, err='Database Error!', stat=503)
 
+    ready_blue_ids = [row['bluid'] for row in gen_utils.get_dict_result(curse)]
+    if ready_blue_ids:
+        if not utils.record_mask_event(curse, consts.EVENT_STATUS, blue_ids=ready_blue_ids):
+            return create_response(success=0, err='Database Error!', stat=503)
+
     committed, msg = gen_utils.commitOrRollback(db_obj)
     if not committed:
         return create_response(success=0, err=msg, stat=503)
@@ -1243,7 +1894,7 @@ def set_perpetual_mask_use_date(db_obj, user_info):
 # -- end Admin only
 # -- long functions
 
-@app.route("/slitmask/mask-detail")
+@bp.route("/slitmask/mask-detail")
 @init_required
 def get_mask_detail(db_obj, user_info):
     """
@@ -1298,7 +1949,7 @@ def get_mask_detail(db_obj, user_info):
 
     ############################
 
-    results = gen_utils.get_obs_by_maskid(curse, design_pid, OBS_INFO)
+    results = gen_utils.get_obs_by_maskid(curse, design_pid, current_app.config['OBS_INFO'])
     if not results:
         return create_response(success=0, err='Database Error!', stat=503)
 
@@ -1362,7 +2013,7 @@ def get_mask_detail(db_obj, user_info):
         ########################
 
         # query the Blueprint Observer from Observers
-        results = gen_utils.get_obs_by_maskid(curse, design_pid, OBS_INFO)
+        results = gen_utils.get_obs_by_maskid(curse, design_pid, current_app.config['OBS_INFO'])
         if not results:
             return create_response(success=0, err='Database Error!', stat=503)
 
@@ -1397,7 +2048,7 @@ def get_mask_detail(db_obj, user_info):
 ################################################################################
 #    Masks in the instruments
 ################################################################################
-@app.route("/slitmask/guiname-starlist", methods=['GET'])
+@bp.route("/slitmask/guiname-starlist", methods=['GET'])
 def guiname_to_starlist():
     """
     Intended as an internal-only route.
@@ -1458,13 +2109,10 @@ def guiname_to_starlist():
         dec_deg = results[0]['dec_pnt']
         ra_deg = results[0]['ra_pnt']
         try:
-            c = SkyCoord(ra=ra_deg * u.degree, dec=dec_deg * u.degree, frame='icrs')
-            c.to_string('hmsdms')
-            ra_dec = re.sub(r'[hmds]', ':', c.to_string('hmsdms')).split(' ')
-            results[0]['ra_pnt'] = ra_dec[0]
-            results[0]['dec_pnt'] = ra_dec[1]
+            results[0]['ra_pnt'] = gen_utils.sexagesimal(ra_deg, hours=True)
+            results[0]['dec_pnt'] = gen_utils.sexagesimal(dec_deg)
             starlist_info.append(results[0])
-        except Exception as err:
+        except (TypeError, ValueError) as err:
             print(f"Error: {err}")
 
     date_str = datetime.utcnow().strftime('%Y%m%d')
@@ -1485,7 +2133,7 @@ def guiname_to_starlist():
     return starlist_fmt
 
 
-@app.route('/slitmask/sias', methods=["GET"])
+@bp.route('/slitmask/sias', methods=["GET"])
 def sias_slitmask_info():
     """
     Intended as an internal-only route.
@@ -1524,65 +2172,293 @@ def sias_slitmask_info():
         )
 
     output = {}
-    curse = db_obj.get_dict_curse()
+    curse = db_obj.get_stream_curse()
     q_name = f'sias_type{q_type}'
 
     if not do_query(q_name, curse, (date1, date2)):
         return create_response(success=0, err='Database Error!', stat=503)
 
-    results = gen_utils.get_dict_result(curse)
-
     output['query'] = get_query(q_name)
-    output['length'] = len(results)
-
-    data = []
-    for row in results:
-        entry = {}
-        for key in row.keys():
-            if 'date' in key:
-                entry[key] = row[key].strftime('%b %d %Y %M:%S')
-            else:
-                entry[key] = row[key]
-        data.append(entry)
-
     output['status'] = 'COMPLETE'
-    output['results'] = data
 
-    return create_response(data=output)
+    def sias_entry(row):
+        for key, val in row.items():
+            if 'date' in key and val is not None:
+                row[key] = val.strftime('%b %d %Y %M:%S')
+        return row
 
+    # long date ranges are streamed,  the length is written after the results
+    results = map(sias_entry, gen_utils.iter_dict_result(curse))
+
+    return create_stream_response(results, data=output, rows_key='results',
+                                  count_key='length')
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument('config_file', help='Configuration File')
-    args = parser.parse_args()
-    config, log = gen_utils.start_up(APP_PATH, config_name=args.config_file)
 
-    # the redirect to login if user not logged in
-    LOGIN_URL = gen_utils.get_cfg(config, 'urls', 'login_url')
+@bp.route('/slitmask/health')
+def get_health():
+    """
+    Intended as an internal-only route.
 
-    # to be used with dbMaskOut to create the Fits chunks
-    KROOT = gen_utils.get_cfg(config, 'tcl_locations', 'kroot')
-    DBMASKOUT_DIR = gen_utils.get_cfg(config, 'tcl_locations', 'dbmaskout_path')
-    NCMILL_DIR = gen_utils.get_cfg(config, 'tcl_locations', 'ncmill_path')
+    The liveness check,  the worker is serving requests.
 
-    OBS_INFO = {
-        'info_url': gen_utils.get_cfg(config, 'keck_observer', 'info_url'),
-        'cookie_url': gen_utils.get_cfg(config, 'keck_observer', 'cookie_url')
-    }
+    :return: <JSON> data = {'status': 'ok', 'pid': <int>}
+    """
+    return create_response(data={'status': 'ok', 'pid': os.getpid()})
+
+
+@bp.route('/slitmask/ready')
+def get_ready():
+    """
+    Intended as an internal-only route.
+
+    The readiness check,  the worker is configured and can query the
+    database.
 
-    EMAIL_INFO = {
-        'from': gen_utils.get_cfg(config, 'email_info', 'from'),
-        'admin': gen_utils.get_cfg(config, 'email_info', 'admin'),
-        'server': gen_utils.get_cfg(config, 'email_info', 'server')
+    :return: <JSON> data = {'status': 'ready'},  503 if not ready.
+    """
+    if 'SLITMASK_CONFIG' not in current_app.config:
+        return create_response(success=0, err='Not configured.', stat=503)
+
+    db_obj, _ = init_api(keck_id=consts.MASK_ADMIN)
+    if not db_obj:
+        return create_response(success=0, err='Database Connection Error!', stat=503)
+
+    curse = db_obj.get_dict_curse()
+    if not do_query('ready', curse, None, query='SELECT 1'):
+        return create_response(success=0, err='Database Error!', stat=503)
+
+    return create_response(data={'status': 'ready'})
+
+
+@bp.route('/slitmask/metrics')
+def get_metrics():
+    """
+    Intended as an internal-only route.
+
+    The request,  query,  observer service and tool latencies in the
+    Prometheus text format,  summed over the gunicorn workers when [metrics]
+    multiproc_dir is set,  of the process answering otherwise.
+
+    :return: <str> the metrics.
+    """
+    response = make_response(metrics_utils.render_metrics())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+
+    return response
+
+
+@bp.route('/slitmask/profiles')
+@init_required
+def get_profiles(db_obj, user_info):
+    """
+    The request profiles saved for the admins,  see profile_utils.
+
+    inputs:
+        name <str> optional,  the profile to download
+
+    :return: <JSON> the profile descriptions,  newest first,  or the
+             profile file of the name.
+    """
+    if not is_admin(user_info, log):
+        return create_response(success=0, err='Unauthorized', stat=401)
+
+    profile_store = current_app.config['PROFILE_STORE']
+    if not profile_store:
+        return create_response(success=0, stat=404,
+                               err='The request profiler is not configured.')
+
+    name = request.args.get('name')
+    if not name:
+        return create_response(data=profile_store.list())
+
+    profile_path = profile_store.path(name)
+    if not profile_path:
+        return create_response(success=0, err=f'No profile: {name}', stat=404)
+
+    return send_file(profile_path, as_attachment=True,
+                     download_name=path.basename(profile_path))
+
+
+@bp.route('/slitmask/changes', methods=["GET"])
+@metrics_utils.query_budget(3)
+def get_changes():
+    """
+    Intended as an internal-only route.
+
+    The incremental change feed of the mask event log,  used by SIAS, the
+    notification scripts and the instrument hosts to sync only what changed
+    since their last call.
+
+    inputs:
+        since <int> the cursor returned by the previous call,  0 for all events
+        limit <int> optional,  maximum number of events to return
+
+    Events are returned in EventId order and become visible in that order,
+    so a consumer that stores the returned cursor after processing the
+    events receives each event exactly once.
+
+    :return: <JSON> data = {'events': [], 'cursor': <int>, 'more': <bool>}
+    """
+    # bypass logging in as observer using MASKADMIN
+    db_obj, user_info = init_api(keck_id=consts.MASK_ADMIN)
+
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', consts.CHANGES_LIMIT))
+    except (ValueError, TypeError):
+        return create_response(
+            success=0, stat=422, err='since and limit must be integers.'
+        )
+
+    limit = max(1, min(limit, consts.CHANGES_LIMIT))
+
+    curse = db_obj.get_dict_curse()
+    if not do_query('changes', curse, (since, limit)):
+        return create_response(success=0, err='Database Error!', stat=503)
+
+    events = gen_utils.get_dict_result(curse)
+
+    cursor = events[-1]['eventid'] if events else since
+
+    return create_response(
+        data={'events': events, 'cursor': cursor, 'more': len(events) == limit}
+    )
+
+
+def create_app(config_file=None, start_threads=True, settings=None):
+    """
+    The app factory,  the routes of the blueprint with the settings read
+    from the config file in app.config.  Under gunicorn the app is created
+    in the master and the background threads are started in each worker,
+    see gunicorn.conf.py.
+
+    :param config_file: <str> the config file name,  in the API directory.
+    :param start_threads: <bool> start the mail sender and change listener.
+    :param settings: <dict> optional,  the settings replacing the ones of
+                     the config file,  ie: the benchmarks without a file.
+
+    :return: <Flask> the app.
+    """
+    app = Flask(__name__, template_folder=TEMPLATE_PATH)
+    app.register_blueprint(bp)
+
+    configure_app(app, config_file, settings)
+
+    if start_threads:
+        start_background(app)
+
+    return app
+
+
+def configure_app(app, config_file=None, settings=None):
+    """
+    Set the app settings from the config file,  called again in each
+    gunicorn worker so a HUP picks up the changes.
+
+    :param app: <Flask> the app.
+    :param config_file: <str> the config file name,  in the API directory.
+    :param settings: <dict> optional,  the settings replacing the file ones.
+    """
+    app.config.update(DEFAULT_SETTINGS)
+
+    if config_file:
+        config, _ = gen_utils.start_up(APP_PATH, config_name=config_file)
+        app.config.update(read_settings(config))
+
+        # the database sessions are shared by the apps of the process
+        pgconn.PREPARE_QUERIES = config.getboolean('database', 'prepare_queries',
+                                                   fallback=True)
+
+    app.config.update(settings or {})
+
+
+def read_settings(config):
+    """
+    :param config: <ConfigParser> the API configuration.
+
+    :return: <dict> the app settings of the routes.
+    """
+    settings = {
+        'SLITMASK_CONFIG': config,
+
+        # the redirect to login if user not logged in
+        'LOGIN_URL': gen_utils.get_cfg(config, 'urls', 'login_url'),
+
+        # to be used with dbMaskOut to create the Fits chunks
+        'KROOT': gen_utils.get_cfg(config, 'tcl_locations', 'kroot'),
+        'DBMASKOUT_DIR': gen_utils.get_cfg(config, 'tcl_locations', 'dbmaskout_path'),
+        'NCMILL_DIR': gen_utils.get_cfg(config, 'tcl_locations', 'ncmill_path'),
+
+        'OBS_INFO': {
+            'info_url': gen_utils.get_cfg(config, 'keck_observer', 'info_url'),
+            'cookie_url': gen_utils.get_cfg(config, 'keck_observer', 'cookie_url')
+        },
+
+        'EMAIL_INFO': {
+            'from': gen_utils.get_cfg(config, 'email_info', 'from'),
+            'admin': gen_utils.get_cfg(config, 'email_info', 'admin'),
+            'server': gen_utils.get_cfg(config, 'email_info', 'server')
+        },
+
+        'GCODE_DIR': gen_utils.get_cfg(config, 'tcl_params', 'gcode_dir'),
+
+        'RAW_MDF_DIR': gen_utils.get_cfg(config, 'file_store', 'raw_mdf'),
+
+        'SLOW_REQUEST': config.getfloat('metrics', 'slow_request',
+                                        fallback=DEFAULT_SETTINGS['SLOW_REQUEST']),
+
+        'QUERY_BUDGET_MODE': config.get('metrics', 'query_budget',
+                                        fallback=DEFAULT_SETTINGS['QUERY_BUDGET_MODE']),
+
+        'LOG_SAMPLE_RATE': config.getfloat('logging', 'sample_rate',
+                                           fallback=DEFAULT_SETTINGS['LOG_SAMPLE_RATE']),
     }
 
-    GCODE_DIR = gen_utils.get_cfg(config, 'tcl_params', 'gcode_dir')
+    # allow the admins to profile a request
+    profile_dir = config.get('profiling', 'profile_dir', fallback='')
+    if profile_dir:
+        settings['PROFILE_STORE'] = profile_utils.ProfileStore(
+            profile_dir, config.getint('profiling', 'max_profiles',
+                                       fallback=consts.MAX_PROFILES)
+        )
 
-    RAW_MDF_DIR = gen_utils.get_cfg(config, 'file_store', 'raw_mdf')
+    return settings
 
-    api_port = gen_utils.get_cfg(config, 'api_parameters', 'port')
 
-    # restrict file uploads to 100 MB otherwise a 413 Too Large will be returned.
-    app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
-    app.run(host='0.0.0.0', port=api_port)
+def start_background(app):
+    """
+    Start the background threads of this process,  they do not survive a
+    fork so each gunicorn worker starts its own.
+
+    :param app: <Flask> the app,  configured from the config file.
+    """
+    config = app.config.get('SLITMASK_CONFIG')
+    if config is None:
+        return
 
+    # queue the emails instead of sending them within the request
+    mail_spool_dir = config.get('email_info', 'spool_dir', fallback='')
+    if mail_spool_dir:
+        mail_utils.start_outbox(mail_spool_dir, app.config['EMAIL_INFO']['server'])
+
+    # cache results while listening for the database change notifications
+    if config.getboolean('cache', 'listen', fallback=False):
+        cache_ttl = config.getint('cache', 'ttl', fallback=consts.CACHE_TTL)
+        cache_utils.start_listener(cache_utils.registry, cache_ttl)
+
+    # share the metrics with the other workers
+    metrics_dir = config.get('metrics', 'multiproc_dir', fallback='')
+    if metrics_dir:
+        metrics_utils.start_worker_metrics(metrics_dir)
+
+
+if __name__ == '__main__':
+    # the development server,  production runs with gunicorn,  see wsgi.py
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config_file', help='Configuration File')
+    args = parser.parse_args()
+
+    app = create_app(args.config_file)
+
+    api_port = gen_utils.get_cfg(app.config['SLITMASK_CONFIG'], 'api_parameters', 'port')
+    app.run(host='0.0.0.0', port=api_port)
@@ -1,4 +1,5 @@
-from mask_constants import READY, ARCHIVED, PERPETUAL_DATE
+from mask_constants import READY, ARCHIVED, PERPETUAL_DATE, EVENT_LOCK_KEY, \
+    GUINAME_LOCK_KEY, GUINAME_PREFIX_LEN
 
 ownership_queries = {
     "blue_person": """
@@ -29,6 +30,19 @@ ownership_queries = {
     "blue_pi": "SELECT blupid FROM maskblu WHERE bluid = %s",
     "design_pi": "SELECT despid FROM maskdesign WHERE desid = %s",
     "pi_keck_id": "SELECT keckid FROM observers WHERE obid = %s",
+
+    # the blueprints of the blue ids and design ids,  with the ownership by
+    # the observer:  params are obid, obid, blue ids, design ids
+    "batch_blue_person": """
+        SELECT b.BluId, b.DesId, b.GUIname, b.status, b.BluPId, d.DesPId,
+            (d.DesPId = %s OR EXISTS (
+                SELECT 1 FROM MaskBlu o
+                WHERE o.DesId = b.DesId AND o.BluPId = %s)) AS owned
+        FROM MaskBlu b
+        JOIN MaskDesign d ON d.DesId = b.DesId
+        WHERE b.BluId = ANY(%s) OR b.DesId = ANY(%s)
+        ORDER BY b.BluId
+        """,
 }
 
 
@@ -195,12 +209,52 @@ admin_queries = {
         WHERE bluid IN (
             SELECT BluId FROM MaskBlu 
             WHERE DesId = %s AND status = {ARCHIVED}
-            )        
+            )
+        RETURNING bluid
+        """,
+
+    # batch status transitions,  params are the value and the blue ids
+    "batch_status": "UPDATE MaskBlu SET status = %s WHERE BluId = ANY(%s)",
+    "batch_status_millseq": """
+        UPDATE MaskBlu SET status = %s, millseq = NULL WHERE BluId = ANY(%s)
+        """,
+    "batch_use_date": """
+        UPDATE MaskBlu SET Date_Use = TIMESTAMP %s WHERE BluId = ANY(%s)
+        """,
+
+    # the purge criteria:  use date older than %s months and not perpetual
+    "archive_sweep_select": f"""
+        SELECT BluId, DesId, GUIname, status, Date_Use FROM MaskBlu
+        WHERE status <> {ARCHIVED}
+            AND Date_Use < now() - (%s * INTERVAL '1 month')
+            AND Date_Use < TIMESTAMP '{PERPETUAL_DATE}'
+        ORDER BY Date_Use
+        """,
+
+    "archive_sweep": f"""
+        UPDATE MaskBlu SET status = {ARCHIVED}, millseq = NULL
+        WHERE status <> {ARCHIVED}
+            AND Date_Use < now() - (%s * INTERVAL '1 month')
+            AND Date_Use < TIMESTAMP '{PERPETUAL_DATE}'
+        RETURNING BluId, DesId, GUIname, status, Date_Use
         """,
 
 }
 
 ingest_queries = {
+    # lock the prefixes of the candidate GUInames in order,  then the first
+    # candidate not in MaskBlu.  Two statements so the SELECT snapshot is
+    # taken after the locks,  and sees the names committed by the ingest
+    # which held them.  params: the candidates twice
+    "guiname_allocate": f"""
+        SELECT pg_advisory_xact_lock({GUINAME_LOCK_KEY}, hashtext(prefix))
+        FROM (SELECT DISTINCT left(name, {GUINAME_PREFIX_LEN}) AS prefix
+              FROM unnest(%s::text[]) AS name ORDER BY prefix) AS prefixes;
+        SELECT c.GUIname FROM unnest(%s::text[]) WITH ORDINALITY AS c(GUIname, n)
+        WHERE NOT EXISTS (SELECT 1 FROM MaskBlu b WHERE b.GUIname = c.GUIname)
+        ORDER BY c.n LIMIT 1
+        """,
+
     "mask_design_insert": """
     INSERT INTO MaskDesign (
         DesId,
@@ -221,10 +275,11 @@ ingest_queries = {
         DATE_PNT,
         LST_PNT,
         stamp,
-        maskumail
+        maskumail,
+        SkyPix
     ) VALUES (
         DEFAULT, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 
-        DEFAULT, %s) 
+        DEFAULT, %s, %s) 
     RETURNING desid
     """,
 
@@ -303,9 +358,10 @@ ingest_queries = {
             pBand,
             RadVel,
             MajAxis,
-            ObjClass
+            ObjClass,
+            SkyPix
         ) VALUES (
-            DEFAULT, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+            DEFAULT, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
         ) RETURNING objectid
         """, 
     "extended_target_insert": """
@@ -350,7 +406,18 @@ validate_queries = {
         WHERE d.slitTyp = 'A' 
             AND d.DesId = (select DesId from MaskBlu where BluId = %s) 
             AND b.dSlitId = d.dSlitId and b.BluId = %s
-        """
+        """,
+
+    # the observer ids of the emails,  params: the lower case emails
+    "observers_by_email": """
+        SELECT lower(Email) AS email, ObId FROM Observers
+        WHERE lower(Email) = ANY(%s)
+        """,
+
+    # the legacy observer ids of the keck ids,  params: the keck ids
+    "observers_by_keckid": """
+        SELECT KeckId, ObId FROM Observers WHERE KeckId = ANY(%s)
+        """,
 }
 
 auxiliary_queries = {
@@ -393,187 +460,238 @@ auxiliary_queries = {
     """
 }
 
+event_queries = {
+    # serialize the event writers so EventIds become visible in order
+    "event_lock": f"SELECT pg_advisory_xact_lock({EVENT_LOCK_KEY})",
+
+    "event_insert": """
+        INSERT INTO MaskEvents (EventType, BluId, DesId, MaskId, Status, Detail)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        """,
+
+    # one event per blueprint,  with the blueprint status after the change
+    "event_insert_blue": """
+        INSERT INTO MaskEvents (EventType, BluId, DesId, MaskId, Status, Detail)
+        SELECT %s, b.BluId, b.DesId, %s, b.status, %s
+        FROM MaskBlu b WHERE b.BluId = ANY(%s)
+        """,
+
+    "event_insert_design": """
+        INSERT INTO MaskEvents (EventType, BluId, DesId, MaskId, Status, Detail)
+        SELECT %s, b.BluId, b.DesId, %s, b.status, %s
+        FROM MaskBlu b WHERE b.DesId = %s
+        """,
+
+    "changes": """
+        SELECT EventId, EventType, BluId, DesId, MaskId, Status, Detail, stamp
+        FROM MaskEvents
+        WHERE EventId > %s
+        ORDER BY EventId
+        LIMIT %s
+        """,
+}
+
+sky_queries = {
+    # cone search candidates,  params: the sky pixels and the dec bounds
+    "cone_masks": """
+        SELECT d.DesId, d.DesName, d.INSTRUME, d.ProjName, d.RA_PNT, d.DEC_PNT,
+               d.PA_PNT, d.stamp, b.BluId, b.GUIname, b.status, b.Date_Use
+        FROM MaskDesign d
+        LEFT JOIN MaskBlu b ON b.DesId = d.DesId
+        WHERE d.SkyPix = ANY(%s) AND d.DEC_PNT BETWEEN %s AND %s
+        """,
+
+    "cone_objects": """
+        SELECT o.ObjectId, o.OBJECT, o.RA_OBJ, o.DEC_OBJ, o.ObjClass, o.mag,
+               o.pBand, d.DesId, d.DesName, d.INSTRUME
+        FROM Objects o
+        LEFT JOIN (SELECT DISTINCT DesId, ObjectId FROM SlitObjMap) s
+            ON s.ObjectId = o.ObjectId
+        LEFT JOIN MaskDesign d ON d.DesId = s.DesId
+        WHERE o.SkyPix = ANY(%s) AND o.DEC_OBJ BETWEEN %s AND %s
+        """,
+
+    # backfill,  params: the last id and the batch size
+    "sky_backfill_designs": """
+        SELECT DesId AS id, RA_PNT AS ra, DEC_PNT AS dec FROM MaskDesign
+        WHERE SkyPix IS NULL AND DesId > %s ORDER BY DesId LIMIT %s
+        """,
+
+    "sky_backfill_objects": """
+        SELECT ObjectId AS id, RA_OBJ AS ra, DEC_OBJ AS dec FROM Objects
+        WHERE SkyPix IS NULL AND ObjectId > %s ORDER BY ObjectId LIMIT %s
+        """,
+
+    # params: the ids and the sky pixels as matching arrays
+    "sky_update_designs": """
+        UPDATE MaskDesign d SET SkyPix = v.pix
+        FROM unnest(%s::int[], %s::int[]) AS v(id, pix)
+        WHERE d.DesId = v.id
+        """,
+
+    "sky_update_objects": """
+        UPDATE Objects o SET SkyPix = v.pix
+        FROM unnest(%s::int[], %s::int[]) AS v(id, pix)
+        WHERE o.ObjectId = v.id
+        """,
+}
+
 # the results to return for the admin search table
 results_str = "d.stamp, d.desid, d.desname, d.desdate, d.instrume, projname, " \
               "ra_pnt, dec_pnt, radepnt, o.keckid, o.firstnm, o.lastnm, " \
               "o.email, o.institution, b.status, b.guiname, " \
               "COALESCE(b.millseq, m.MillSeq) AS millseq"
 
-# the admin search table queries,  one query per search option
+# the admin search table query,  admin_search_utils adds the WHERE clause
+# from the search predicates below,  ANDed together
 admin_search_queries = {
-    "search_email": f"SELECT {results_str} FROM MaskDesign d "
-                    "JOIN Observers o ON o.ObId = d.DesPId "
-                    "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                    "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                    "WHERE (d.DesPId = %s OR d.DesId IN "
-                    "(SELECT DesId FROM MaskBlu WHERE BluPId = %s))",
-
-    "search_guiname": f"SELECT {results_str} FROM MaskDesign d "
-                      "JOIN Observers o ON o.ObId = d.DesPId "
-                      "JOIN MaskBlu b ON b.DesId = d.DesId "
-                      "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                      "WHERE b.GUIname ILIKE %s ",
-
-    "search_blue_name": f"SELECT {results_str} FROM MaskDesign d "
-                        "JOIN Observers o ON o.ObId = d.DesPId "
-                        "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                        "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                        "WHERE (d.DesName ILIKE %s OR b.BluName ILIKE %s) ",
-
-    "search_blue_id_eq2": f"SELECT {results_str} FROM MaskDesign d "
-                          "JOIN Observers o ON o.ObId = d.DesPId "
-                          "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                          "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                          "WHERE EXISTS ("
-                          "    SELECT 1 FROM MaskBlu b2 WHERE b2.DesId = d.DesId "
-                          "AND b2.BluId BETWEEN %s AND %s)",
-
-    "search_blue_id_gt2": f"SELECT {results_str} FROM MaskDesign d "
-                          "JOIN Observers o ON o.ObId = d.DesPId "
-                          "JOIN MaskBlu b ON b.DesId = d.DesId "
-                          "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                          "WHERE EXISTS ("
-                          "    SELECT 1 FROM MaskBlu b2 WHERE b2.DesId = d.DesId ",
-
-    "search_blue_id_eq1": f"SELECT {results_str} FROM MaskDesign d "
-                          "JOIN Observers o ON o.ObId = d.DesPId "
-                          "JOIN MaskBlu b ON b.DesId = d.DesId "
-                          "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                          "WHERE d.DesId IN (SELECT DesId FROM MaskBlu WHERE BluId = %s)",
-
-    "search_design_id_eq2": f"SELECT {results_str} FROM MaskDesign d "
-                            "JOIN Observers o ON o.ObId = d.DesPId "
-                            "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                            "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                            "WHERE d.DesId BETWEEN %s AND %s ",
-
-    "search_design_id_gt2": f"SELECT {results_str} FROM MaskDesign d "
-                            "JOIN Observers o on o.ObId = d.DesPId "
-                            "LEFT join MaskBlu b on b.DesId = d.DesId "
-                            "LEFT JOIN Mask m ON m.BluId = b.BluId ",
-
-    "search_design_id_eq1": f"SELECT {results_str} FROM MaskDesign d "
-                            "JOIN Observers o ON o.ObId = d.DesPId "
-                            "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                            "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                            "WHERE d.DesId = %s",
-    "search_millseq_eq2": f"SELECT {results_str} FROM MaskDesign d "
-                          "JOIN Observers o ON o.Obid = d.DesPid "
-                          "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                          "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                          "WHERE ("
-                          "   exists (SELECT * FROM MaskBlu WHERE DesId = d.DesId "
-                          "           AND MillSeq BETWEEN %s and %s) OR "
-                          "   exists (SELECT * FROM MaskBlu WHERE DesId = d.DesId "
-                          "           AND BluId IN (SELECT BluId FROM Mask "
-                          "              WHERE MillSeq BETWEEN %s AND %s)) )",
-
-    "search_millseq_gt2": f"SELECT {results_str} FROM MaskDesign d "
-                          "JOIN Observers o ON o.Obid = d.DesPid "
-                            "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                            "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                            "WHERE (EXISTS (SELECT * FROM MaskBlu WHERE DesId = d.DesId ",
-
-    "search_millseq_eq1": f"SELECT {results_str} FROM MaskDesign d "
-                        "JOIN Observers o ON o.Obid = d.DesPid "
-                        "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                        "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                        "WHERE (exists ( SELECT * FROM MaskBlu WHERE DesId = d.DesId "
-                        "AND MillSeq = %s ) OR exists ( SELECT * FROM MaskBlu "
-                        "WHERE DesId = d.DesId AND BluId IN ( SELECT BluId "
-                        "FROM Mask WHERE MillSeq = %s ))) ",
-
-    "search_barcode_eq2": f"SELECT {results_str}, b.status FROM MaskDesign d "
-                    "JOIN Observers o ON o.ObId = d.DesPId "
-                    "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                    "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                    "WHERE EXISTS ("
-                    "   SELECT 1 FROM MaskBlu "
-                    "   WHERE DesId = d.DesId AND BluId IN ("
-                    "       SELECT BluId FROM Mask "
-                    "       WHERE MaskId BETWEEN %s AND %s)) ",
-
-    "search_barcode_gt2": f"SELECT {results_str}, b.status FROM MaskDesign d "
-                        "JOIN Observers o ON o.ObId = d.DesPId "
-                        "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                        "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                        "WHERE EXISTS ("
-                        "   SELECT 1 FROM MaskBlu "
-                        "   WHERE DesId = d.DesId AND BluId IN ("
-                        "       SELECT BluId FROM Mask "
-                        "       WHERE MaskId IN (",
-
-    "search_barcode_eq1": f"SELECT {results_str}, b.status FROM MaskDesign d "
-                        "JOIN Observers o on o.ObId = d.DesPID "
-                        "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                        "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                        "WHERE EXISTS ("
-                        "  SELECT 1 FROM MaskBlu WHERE DesId = d.DesId AND BluId IN ("
-                        "    SELECT BluId FROM Mask WHERE MaskId = %s)) "
-                        " AND MaskId = 8840",
-
-    "search_milled_no": f"SELECT {results_str}, b.status FROM MaskDesign d "
-                        "JOIN Observers o on o.ObId = d.DesPID "
-                        "LEFT JOIN MaskBlu b ON b.BluId = d.DesId "
-                        "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                        "WHERE b.status != %s ",
-
-    "search_milled_yes": f"SELECT {results_str}, b.status FROM MaskDesign d "
-                        "JOIN Observers o on o.ObId = d.DesPID "
-                        "LEFT JOIN MaskBlu b ON b.BluId = d.DesId "
-                        "LEFT JOIN Mask m ON m.BluId = b.BluId WHERE b.status = %s ",
-
-    "search_cal_days": f"SELECT {results_str}, b.status FROM MaskDesign d "
-                        "JOIN Observers o ON o.ObId = d.DesPId "
-                        "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                        "LEFT JOIN Mask m ON m.BluId = b.BluId "
-                        "WHERE date_part('day', "
-                        "(SELECT max(Date_Use) FROM MaskBlu WHERE DesId = d.DesId) - now()) "
-                        "BETWEEN 0 AND %s ",
-
-    "search_other": f"SELECT {results_str} FROM MaskDesign d "
-                    "JOIN Observers o ON o.ObId = d.DesPId "
-                    "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "        
-                    "LEFT JOIN Mask m ON m.BluId = b.BluId ",
-
-    "search_inst": f"SELECT {results_str} FROM MaskDesign d "
+    "search_base": f"SELECT {results_str} FROM MaskDesign d "
                    "JOIN Observers o ON o.ObId = d.DesPId "
                    "LEFT JOIN MaskBlu b ON b.DesId = d.DesId "
-                   "LEFT JOIN Mask m ON m.BluId = b.BluId "
+                   "LEFT JOIN Mask m ON m.BluId = b.BluId ",
 
+    "search_order": "ORDER BY d.stamp DESC, d.DesId DESC, b.BluId DESC ",
 }
 
+# the search predicates,  {cmp} is the comparison of the value(s):
+# = %s,  BETWEEN %s AND %s,  or = ANY(%s)
+admin_search_predicates = {
+    "email": "(d.DesPId = %s OR EXISTS (SELECT 1 FROM MaskBlu bp "
+             "WHERE bp.DesId = d.DesId AND bp.BluPId = %s))",
 
-def get_query(query_key):
+    "guiname": "b.GUIname ILIKE %s",
+
+    "name": "(d.DesName ILIKE %s OR b.BluName ILIKE %s)",
+
+    # the fuzzy name options,  a word of the name similar to the value
+    "guiname_fuzzy": "%s <%% b.GUIname",
+
+    "name_fuzzy": "(%s <%% d.DesName OR %s <%% b.BluName)",
+
+    "bluid": "EXISTS (SELECT 1 FROM MaskBlu bb WHERE bb.DesId = d.DesId "
+             "AND bb.BluId {cmp})",
+
+    "desid": "d.DesId {cmp}",
+
+    "millseq": "(EXISTS (SELECT 1 FROM MaskBlu bs WHERE bs.DesId = d.DesId "
+               "AND bs.MillSeq {cmp}) OR EXISTS (SELECT 1 FROM MaskBlu bs "
+               "JOIN Mask ms ON ms.BluId = bs.BluId WHERE bs.DesId = d.DesId "
+               "AND ms.MillSeq {cmp}))",
+
+    "barcode": "EXISTS (SELECT 1 FROM MaskBlu bm JOIN Mask mm ON mm.BluId = bm.BluId "
+               "WHERE bm.DesId = d.DesId AND mm.MaskId {cmp})",
+
+    "milled_no": "b.status < %s",
+
+    "milled_yes": "b.status = %s",
+
+    "caldays": "(b.Date_Use >= now() AND b.Date_Use < now() + %s * INTERVAL '1 day')",
+
+    "inst_deimos": "d.INSTRUME = %s",
+
+    "inst_lris": "d.INSTRUME ILIKE %s",
+
+    "desdate": "d.DesDate {cmp}",
+
+    "submitted": "d.stamp {cmp}",
+
+    "date_use": "b.Date_Use {cmp}",
+
+    "milldate": "EXISTS (SELECT 1 FROM MaskBlu bd JOIN Mask md ON md.BluId = bd.BluId "
+                "WHERE bd.DesId = d.DesId AND md.MillDate {cmp})",
+}
+
+# the name suggestions of each name column,  the distinct names with a word
+# similar to the text or containing it,  the best scores first.
+# params: the text,  the ILIKE pattern,  the text and the limit
+name_queries = {
+    "name_suggest_guiname": """
+        (SELECT 'guiname' AS field, GUIname AS name, max(BluId) AS id,
+                count(*) AS num, word_similarity(%s, GUIname) AS score
+         FROM MaskBlu
+         WHERE GUIname ILIKE %s OR %s <%% GUIname
+         GROUP BY GUIname
+         ORDER BY score DESC, name
+         LIMIT %s)
+        """,
+
+    "name_suggest_bluname": """
+        (SELECT 'bluname' AS field, BluName AS name, max(BluId) AS id,
+                count(*) AS num, word_similarity(%s, BluName) AS score
+         FROM MaskBlu
+         WHERE BluName ILIKE %s OR %s <%% BluName
+         GROUP BY BluName
+         ORDER BY score DESC, name
+         LIMIT %s)
+        """,
+
+    "name_suggest_desname": """
+        (SELECT 'desname' AS field, DesName AS name, max(DesId) AS id,
+                count(*) AS num, word_similarity(%s, DesName) AS score
+         FROM MaskDesign
+         WHERE DesName ILIKE %s OR %s <%% DesName
+         GROUP BY DesName
+         ORDER BY score DESC, name
+         LIMIT %s)
+        """,
+
+    # the suggestions of the columns together,  params: the limit
+    "name_suggest_order": "ORDER BY score DESC, name LIMIT %s",
+}
+
+
+# the queries by name,  indexed once at import
+QUERY_INDEX = {}
+for queries in (ownership_queries, retrieval_queries, ingest_queries, admin_queries,
+                validate_queries, auxiliary_queries, admin_search_queries, event_queries,
+                sky_queries, name_queries):
+    for name, query in queries.items():
+        QUERY_INDEX.setdefault(name, query)
+
+# the hot queries,  run several times a request,  prepared in each database
+# session on their first use and executed by name after (pgconn).  The
+# parameter types must follow from the query,  ie: not unnest(%s).
+PREPARED_QUERIES = (
+    'blue_person', 'design_person', 'design_to_blue', 'blue_to_design',
+    'obid_column', 'keckid_from_obid', 'blue_pi', 'design_pi', 'pi_keck_id',
+    'batch_blue_person', 'observers_by_email', 'observers_by_keckid',
+    'mill', 'blueprint', 'slit', 'design', 'align_box_query',
+)
+
+
+def prepared_sql(query_name):
     """
-    This way the queries cannot be updated,  to avoid using the dict directly.
+    The PREPARE and EXECUTE statements of a query,  the %s parameters are
+    numbered ($1, $2...) in the prepared query and passed to the EXECUTE.
+
+    :param query_name: <str> the query name.
 
-    :param query_key:
-    :type query_key:
-    :return:
-    :rtype:
+    :return: <str, str> the PREPARE and the EXECUTE statements.
     """
-    query_str = ownership_queries.get(query_key)
-    if not query_str:
-        query_str = retrieval_queries.get(query_key)
+    query = QUERY_INDEX[query_name].strip().rstrip(';')
 
-    if not query_str:
-        query_str = ingest_queries.get(query_key)
+    parts = query.split('%s')
+    body = parts[0]
+    for num, part in enumerate(parts[1:], start=1):
+        body += f'${num}{part}'
 
-    if not query_str:
-        query_str = admin_queries.get(query_key)
+    statement = f'sq_{query_name}'
+    execute = f'EXECUTE {statement}'
+    if len(parts) > 1:
+        execute += f' ({", ".join(["%s"] * (len(parts) - 1))})'
 
-    if not query_str:
-        query_str = validate_queries.get(query_key)
+    return f'PREPARE {statement} AS {body}', execute
 
-    if not query_str:
-        query_str = auxiliary_queries.get(query_key)
 
-    if not query_str:
-        query_str = admin_search_queries.get(query_key)
+PREPARED_SQL = {name: prepared_sql(name) for name in PREPARED_QUERIES}
 
-    if not query_str:
-        return None
 
-    return query_str
+def get_query(query_key):
+    """
+    This way the queries cannot be updated,  to avoid using the dict directly.
 
+    :param query_key: <str> the query name.
+
+    :return: <str> the query,  None if not found.
+    """
+    return QUERY_INDEX.get(query_key)
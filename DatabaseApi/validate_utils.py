@@ -1,8 +1,6 @@
 import re
-import numpy
 
-from mdf_content import mdfcontent
-from apiutils import mask_user_id
+from apiutils import resolve_emails, normalize_email
 import logger_utils as log_fun
 
 
@@ -40,7 +38,12 @@ def mask_blue_rows(hdul, err_report, log):
     return True, err_report
 
 
-def set_design_pid(db, hdul, maps, obs_info):
+def set_owner_pids(db, hdul, maps, obs_info):
+    """
+    Map the design author (MaskDesign.DesAuth) and blueprint observer
+    (MaskBlu.BluObsvr) to their observer ids,  both emails are resolved
+    together.  An unknown email is mapped to None (validated later).
+    """
     log = log_fun.get_log()
 
     # parse design author e-mail address
@@ -49,34 +52,22 @@ def set_design_pid(db, hdul, maps, obs_info):
     DesAuthEmail = mbox2email(DesAuth)
     log.info('Parsed mask design author email (DesAuthEmail)')
 
-    # get user
-    design_pid = mask_user_id(db, DesAuthEmail, obs_info)
-
-    # required that the design author is a known email address (validated later)
-    if design_pid is None:
-        log.error("no design pid")
-        maps.obid[DesAuth] = None
-    else:
-        maps.obid[DesAuth] = design_pid
-
-    return maps
-
-
-def set_blue_pid(db, hdul, maps, obs_info):
-    log = log_fun.get_log()
-
     # parse mask blue observer e-mail address
     BluObsvr = hdul['MaskBlu'].data['BluObsvr'][0]
     BluObsvrEmail = mbox2email(BluObsvr)
 
-    # we require that MaskBlu.BluObsvr contain a known user e-mail (validated later)
-    # find the primary key for that user
-    BluPId = mask_user_id(db, BluObsvrEmail, obs_info)
+    # we require that both are known user e-mails,  find their primary keys
+    resolved = resolve_emails(db, [DesAuthEmail, BluObsvrEmail], obs_info)
+
+    design_pid = resolved.get(normalize_email(DesAuthEmail))
+    if design_pid is None:
+        log.error("no design pid")
+    maps.obid[DesAuth] = design_pid
+
+    BluPId = resolved.get(normalize_email(BluObsvrEmail))
     if BluPId is None:
         log.error("no blue pid")
-        maps.obid[BluObsvr] = None
-    else:
-        maps.obid[BluObsvr] = BluPId
+    maps.obid[BluObsvr] = BluPId
 
     return maps
 
@@ -115,67 +106,3 @@ def mbox2email(email_str):
     return None
 
 
-def valTableExt(hdul, extname):
-    """
-    look at FITS table hdu with EXTNAME extname
-    ascertain whether the structure matches our expectations
-
-    Inputs:
-        hdul - HDU list from opening a FITS file
-        extname - value of EXTNAME in one of those HDUs
-    """
-    log = log_fun.get_log()
-    err_report = []
-
-    # does this FITS table contain all known cols?
-    for col in mdfcontent[extname].knownCols.keys():
-        if col not in hdul[extname].columns.names:
-            msg = f"did not find col {col} in extname {extname}"
-            err_report.append(msg)
-
-    if err_report:
-        # we cannot ingest table extname because it is missing a column
-        return err_report
-
-    # do we recognize every col in this FITS table extname?
-    for col in hdul[extname].columns.names:
-
-        # Lots of code variations in how we analyze table structure
-        # because astropy FITS table reading does not provide
-        # clearly documented means of introspection.
-
-        # This is at least partly because of the way astropy uses
-        # numpy.recarray objects for FITS table data where everything
-        # in from ASCII table is stored as strings until the data
-        # array is parsed into numpy.ndarray objects.
-
-        # In fact, it looks like astropy FITS table reading
-        # pretty much expects that the FITS table will always
-        # conform to what the code expects ... no surprises.
-
-        # That is not a strategy that dare be adopted when
-        # accepting input data from the web.
-        # We have to validate both the structure and the content.
-
-        # this next fails with tables of zero length
-        if col not in mdfcontent[extname].knownCols.keys():
-            # not an error, but surprising if extra cols exist
-            log.warning("unexpected col %s in extname %s" % (col, extname))
-        elif mdfcontent[extname].knownCols[col].dtpre in type(hdul[extname].data[col]).__name__:
-            # we expect this is true for data columns
-            # where the datatype is numpy.chararray
-            pass
-        elif len(hdul[extname].data[col]) == 0 and (type(hdul[extname].data[col]) == numpy.ndarray):
-            # this is probably a BinTable for LRIS
-            pass
-        elif mdfcontent[extname].knownCols[col].dtpre in type(hdul[extname].data[col][0]).__name__:
-            # we expect this is true for numeric data columns
-            # where the datatype is numpy.intNN or numpy.floatNN
-            pass
-        else:
-            # data[col] is a numpy.ndarray
-            log.warning(f"BADWRONG {extname} col {col} we say "
-                        f"{mdfcontent[extname].knownCols[col].dtpre}")
-
-    return err_report
-
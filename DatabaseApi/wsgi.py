@@ -0,0 +1,18 @@
+"""
+The WSGI entry point of the API,  the app is created from the config file
+in SLITMASK_CONFIG (default slitmask_cfg.live.ini) in the API directory:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The background threads are started by the gunicorn post_fork hook in each
+worker,  or here when the server does not fork (SLITMASK_START_THREADS=1).
+"""
+import os
+
+import slitmask_api
+
+CONFIG_FILE = os.environ.get('SLITMASK_CONFIG', 'slitmask_cfg.live.ini')
+
+app = slitmask_api.create_app(
+    CONFIG_FILE, start_threads=os.environ.get('SLITMASK_START_THREADS') == '1'
+)
@@ -2,13 +2,17 @@ import configparser
 import requests
 import logging
 import urllib3
-import smtplib
 import sys
 
+from os import path
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formatdate
 
+# the SMTP session of the API,  the scripts run from the repository
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), '..', 'DatabaseApi'))
+from mail_utils import SmtpSession
+
 SLITMASK_LOGNAME = 'slitmask_emails'
 
 # mute insecure warnings
@@ -64,12 +68,17 @@ def get_cfg(config, section, param_name):
     return param_val
 
 
-def send_email(mail_to, mail_from, mail_msg, mail_subject, mail_server, log=None):
+def send_email(mail_to, mail_from, mail_msg, mail_subject, mail_server, log=None,
+               session=None):
     """
     send an email if there are any warnings or errors logged.
 
     :param mail_msg: <str> message to mail.
     :param config: <class 'configparser.ConfigParser'> the config file parser.
+    :param session: <SmtpSession> optional,  the connection to send with,
+                    otherwise a connection is opened for this email.
+
+    :return: <bool> True if the email was sent.
     """
     if not mail_msg:
         return
@@ -84,14 +93,20 @@ def send_email(mail_to, mail_from, mail_msg, mail_subject, mail_server, log=None
     msg.attach(MIMEText(mail_msg, 'html'))
 
     try:
-        server = smtplib.SMTP(mail_server)
-        server.sendmail(mail_from, mail_to, msg.as_string())
-        server.quit()
+        if session:
+            session.sendmail(mail_from, mail_to, msg.as_string())
+        else:
+            with SmtpSession(mail_server, retries=1,
+                             log=log or logging.getLogger(SLITMASK_LOGNAME)) as session:
+                session.sendmail(mail_from, mail_to, msg.as_string())
     except Exception as err:
         if log:
             log.warning(f"Error sending Email. Error: {err}.")
         else:
             print(f"Error sending Email. Error: {err}.")
+        return False
+
+    return True
 
 
 def query_db_api(url):
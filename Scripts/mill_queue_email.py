@@ -66,6 +66,17 @@ def create_work_table(json_data):
     return html_output
 
 
+def mill_queue_message(json_output):
+    """
+    The summary of the work by use date followed by the mill queue table.
+
+    :param json_output: <dict> the mill-queue API results.
+
+    :return: <str> the email message.
+    """
+    return create_work_table(json_output) + utils.json_to_html_table(json_output)
+
+
 if __name__ == '__main__':
 
     cfg, log = utils.start_up(APP_PATH)
@@ -92,10 +103,7 @@ if __name__ == '__main__':
         log.error(f'No JSON returned API might be down. ERROR: {e}')
         sys.exit()
 
-    html_table = utils.json_to_html_table(json_output)
-
-    mail_msg = create_work_table(json_output)
-    mail_msg += html_table
+    mail_msg = mill_queue_message(json_output)
 
     log.info(f'Sending Mill Queue Mask Notification Email to: {mail_to}.')
 
@@ -0,0 +1,303 @@
+"""
+Run all the slitmask notification emails in one process,  replaces the
+separate cron jobs:
+
+    mill_queue      - mill_queue_email.py,  the current mill queue
+    overdue         - slitmask_overdue.py,  the queued masks used soon
+    recently_milled - recently_milled.py,  the masks milled yesterday
+    pi_milled       - pi_notify_milled.py,  each PI's newly milled masks
+
+The reports are read with one HTTP session to the API (source = api) or
+with one database connection on the API host (source = db),  and all the
+emails are sent with one SMTP session.
+
+The state file keeps the high-water mark of each report (the day sent or
+the masks notified),  so a rerun does not send a daily report twice or
+notify a PI of the same mask twice.
+
+    python notify_runner.py [--config slitmask_emails.live.ini]
+                            [--reports mill_queue,pi_milled] [--force]
+"""
+import sys
+import json
+import argparse
+from os import path, replace
+
+from datetime import datetime, date, timedelta
+
+import requests
+
+import email_utils as utils
+from mill_queue_email import mill_queue_message
+from slitmask_overdue import overdue_message
+from recently_milled import recently_milled_message
+from pi_notify_milled import pi_milled_message
+
+# the API constants,  email_utils puts DatabaseApi on the path
+from mask_constants import MILL_OVERDUE
+
+APP_PATH = path.abspath(path.dirname(__file__))
+
+REPORTS = ['mill_queue', 'overdue', 'recently_milled', 'pi_milled']
+
+
+class ApiSource:
+    """
+    The report data from the slitmask API,  with one pooled HTTP session.
+    """
+    def __init__(self, cfg):
+        self.api_url = utils.get_cfg(cfg, 'slitmask_api', 'api_url')
+        self.routes = cfg['slitmask_api']
+        self.session = requests.Session()
+        self.session.verify = False
+
+    def get(self, route_key, params=None):
+        url = f"{self.api_url}/{self.routes[route_key]}"
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+
+        return response.json()['data']
+
+    def mill_queue(self):
+        return self.get('mill_queue')
+
+    def recently_milled(self):
+        return self.get('recent_scans', {'number-days': 1})
+
+    def pi_milled(self):
+        return self.get('recent_scans_emails')
+
+    def close(self):
+        self.session.close()
+
+
+class DbSource:
+    """
+    The report data directly from the database,  with the API queries and
+    formatting,  for running on the API host.  The observer table is read
+    once for all the PI emails.
+    """
+    def __init__(self, cfg):
+        sys.path.append(path.join(APP_PATH, '..', 'DatabaseApi'))
+
+        import logger_utils
+        import general_utils
+        from wspgconn import WsPgConn
+        from mask_constants import MASK_ADMIN
+
+        logger_utils.configure_logger(utils.get_cfg(cfg, 'general', 'log_dir'))
+
+        self.gen_utils = general_utils
+        self.obs_info = {'info_url': utils.get_cfg(cfg, 'keck_observer', 'info_url')}
+
+        self.db_obj = WsPgConn(MASK_ADMIN)
+        if not self.db_obj.db_connect():
+            raise ConnectionError('could not connect to the database')
+
+        self.curse = self.db_obj.get_dict_curse()
+
+    def query(self, query_name, params=None):
+        if not self.gen_utils.do_query(query_name, self.curse, params):
+            raise RuntimeError(f'{query_name} query failed')
+
+        return self.gen_utils.get_dict_result(self.curse)
+
+    @staticmethod
+    def api_dates(results):
+        """
+        Dates as the API returns them in JSON.
+        """
+        for result in results:
+            for key, val in result.items():
+                if isinstance(val, datetime):
+                    result[key] = val.isoformat()
+
+        return results
+
+    def mill_queue(self):
+        results = self.query('mill')
+        return self.gen_utils.order_mill_queue(results)
+
+    def recently_milled(self):
+        results = self.query('recent', (date.today() - timedelta(days=1), ))
+        return self.gen_utils.order_scanned_barcodes(results)
+
+    def pi_milled(self):
+        results = self.query('recent_barcode_owner', (date.today() - timedelta(days=1), ))
+        self.gen_utils.attach_observers(self.curse, results, self.obs_info)
+
+        grouped = self.gen_utils.group_by_email(results)
+        for entries in grouped.values():
+            self.api_dates(entries)
+
+        return grouped
+
+    def close(self):
+        self.db_obj.disconnect()
+
+
+class NotifyRunner:
+    """
+    Build and send the configured reports,  with the high-water marks kept
+    in the state file.
+    """
+    def __init__(self, cfg, log, source, session, force=False):
+        self.cfg = cfg
+        self.log = log
+        self.source = source
+        self.session = session
+        self.force = force
+
+        self.mail_from = utils.get_cfg(cfg, 'email', 'from')
+        self.mail_server = utils.get_cfg(cfg, 'email', 'server')
+        self.state_file = cfg.get('notify_runner', 'state_file', fallback='') or \
+            path.join(APP_PATH, 'notify_state.json')
+        self.state = self.read_state()
+        self.today = date.today().isoformat()
+        self.mill_queue_data = None
+
+    def read_state(self):
+        try:
+            with open(self.state_file) as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return {}
+        except ValueError as err:
+            self.log.warning(f'unreadable state file {self.state_file}: {err}')
+            return {}
+
+    def save_state(self, report, mark):
+        self.state[report] = mark
+
+        tmp_file = f'{self.state_file}.tmp'
+        with open(tmp_file, 'w') as fp:
+            json.dump(self.state, fp, indent=2)
+        replace(tmp_file, self.state_file)
+
+    def send(self, mail_to, subject, mail_msg):
+        """
+        :return: <bool> True if sent,  the high-water mark is only moved then.
+        """
+        self.log.info(f'Sending "{subject}" to: {mail_to}.')
+        return utils.send_email(mail_to, self.mail_from, mail_msg, subject,
+                                self.mail_server, log=self.log, session=self.session)
+
+    def sent_today(self, report):
+        if self.force:
+            return False
+
+        return self.state.get(report, {}).get('last_sent') == self.today
+
+    def mill_queue(self):
+        """
+        The mill queue is read once,  for the mill_queue and overdue reports.
+        """
+        if self.mill_queue_data is None:
+            self.mill_queue_data = self.source.mill_queue()
+
+        return self.mill_queue_data
+
+    def run(self, reports):
+        for report in reports:
+            if report != 'pi_milled' and self.sent_today(report):
+                self.log.info(f'{report} already sent today,  skipping.')
+                continue
+
+            try:
+                getattr(self, f'run_{report}')()
+            except Exception as err:
+                self.log.error(f'{report} report failed. ERROR: {err}')
+
+    def run_mill_queue(self):
+        data = self.mill_queue()
+        if not data:
+            self.log.info('the mill queue is empty,  not sending an email')
+            return
+
+        subject = f"Current Slitmask Queue {self.today}"
+        if self.send(utils.get_cfg(self.cfg, 'email', 'info'), subject,
+                     mill_queue_message({'data': data})):
+            self.save_state('mill_queue', {'last_sent': self.today})
+
+    def run_overdue(self):
+        # the same days as the API mill-overdue route
+        overdue_date = (date.today() + timedelta(days=MILL_OVERDUE)).isoformat()
+        data = [mask for mask in self.mill_queue()
+                if mask.get('Use-Date') and mask['Use-Date'] <= overdue_date]
+        if not data:
+            self.log.info('no masks are overdue,  not sending an email')
+            return
+
+        subject = f"Overdue Masks {self.today}"
+        if self.send(utils.get_cfg(self.cfg, 'email', 'alarm'), subject,
+                     overdue_message({'data': data})):
+            self.save_state('overdue', {'last_sent': self.today})
+
+    def run_recently_milled(self):
+        mail_msg = recently_milled_message({'data': self.source.recently_milled()})
+        if not mail_msg:
+            self.log.info('no masks have been recently milled,  not sending an email')
+            return
+
+        subject = f"Recently Milled Masks {self.today}"
+        if self.send(utils.get_cfg(self.cfg, 'email', 'info'), subject, mail_msg):
+            self.save_state('recently_milled', {'last_sent': self.today})
+
+    def run_pi_milled(self):
+        """
+        Only the masks not already sent to their PI are sent,  the mask
+        barcodes sent are kept while the masks are in the results.
+        """
+        notified = set() if self.force else \
+            set(self.state.get('pi_milled', {}).get('notified', []))
+
+        subject = f"Keck Slitmasks have been milled {self.today}"
+        current = set()
+        num_sent = 0
+        for mail_to, entries in self.source.pi_milled().items():
+            current.update(entry['Mask Barcode'] for entry in entries)
+
+            entries = [entry for entry in entries if entry['Mask Barcode'] not in notified]
+            if not entries:
+                continue
+
+            if self.send(mail_to, subject, pi_milled_message(entries)):
+                notified.update(entry['Mask Barcode'] for entry in entries)
+                num_sent += 1
+
+        if not num_sent:
+            self.log.info('no masks have been newly milled,  not sending PI emails.')
+
+        self.save_state('pi_milled', {'notified': sorted(notified & current)})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send the slitmask notification emails.')
+    parser.add_argument('--config', default='slitmask_emails.live.ini',
+                        help='Configuration File')
+    parser.add_argument('--reports', help=f'comma separated, from: {", ".join(REPORTS)}')
+    parser.add_argument('--force', action='store_true',
+                        help='ignore the high-water marks of the previous runs')
+    args = parser.parse_args()
+
+    cfg, log = utils.start_up(APP_PATH, config_name=args.config)
+    log.info('-- Slitmask Notification Runner --')
+
+    reports = args.reports or cfg.get('notify_runner', 'reports',
+                                      fallback=','.join(REPORTS))
+    reports = [report.strip() for report in reports.split(',') if report.strip()]
+
+    unknown = set(reports) - set(REPORTS)
+    if unknown:
+        sys.exit(f'unknown reports: {unknown}')
+
+    if cfg.get('notify_runner', 'source', fallback='api') == 'db':
+        source = DbSource(cfg)
+    else:
+        source = ApiSource(cfg)
+
+    try:
+        with utils.SmtpSession(utils.get_cfg(cfg, 'email', 'server'), log=log) as session:
+            NotifyRunner(cfg, log, source, session, force=args.force).run(reports)
+    finally:
+        source.close()
@@ -6,6 +6,57 @@ import email_utils as utils
 
 APP_PATH = path.abspath(path.dirname(__file__))
 
+MAIL_HEADER = """
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<style>
+    table {
+        border-collapse: collapse;
+        width: 100%;
+        max-width: 600px;
+    }
+    th, td {
+        border: 1px solid white;
+        padding: 8px;
+        text-align: left;
+    }
+    .content {
+        margin-bottom: 40px; 
+    }
+</style>
+
+</head>
+<body>
+<div class="content">
+    <p>Automated notification from the W.M. Keck Observatory Slitmask 
+    milling facility.</p>
+    <p>Within the past 2 days the following masks have been milled:</p>
+"""
+
+MAIL_FOOTER = """
+   </div>
+
+    <div style="margin-bottom: 40px;">&nbsp;</div>
+    </body>
+    </html>
+    """
+
+
+def pi_milled_message(entries):
+    """
+    The email to a PI listing their newly milled masks.
+
+    :param entries: <list> the recently-scanned-emails API results for the PI.
+
+    :return: <str> the email message.
+    """
+    html_table = utils.json_to_html_table({'data': entries})
+
+    return MAIL_HEADER + html_table + MAIL_FOOTER
+
+
 if __name__ == '__main__':
 
     cfg, log = utils.start_up(APP_PATH)
@@ -32,51 +83,15 @@ if __name__ == '__main__':
         log.error(f'No JSON returned API might be down. ERROR: {e}')
         sys.exit()
 
-    mail_header = """
-    <html lang="en">
-    <head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        table {
-            border-collapse: collapse;
-            width: 100%;
-            max-width: 600px;
-        }
-        th, td {
-            border: 1px solid white;
-            padding: 8px;
-            text-align: left;
-        }
-        .content {
-            margin-bottom: 40px; 
-        }
-    </style>
-    
-    </head>
-    <body>
-    <div class="content">
-        <p>Automated notification from the W.M. Keck Observatory Slitmask 
-        milling facility.</p>
-        <p>Within the past 2 days the following masks have been milled:</p>
-    """
-
-    mail_footer = """
-       </div>
-
-        <div style="margin-bottom: 40px;">&nbsp;</div>
-        </body>
-        </html>
-        """
-
-    # loop through the results sending an email to each PI
-    for mail_to, entries in json_output["data"].items():
-        html_table = utils.json_to_html_table({'data': entries})
-        mail_msg = mail_header + html_table + mail_footer
+    # loop through the results sending an email to each PI,  on one connection
+    with utils.SmtpSession(mail_server, log=log) as session:
+        for mail_to, entries in json_output["data"].items():
+            mail_msg = pi_milled_message(entries)
 
-        log.info(f"Sending PI Newly Milled Mask Email to: {mail_to}")
+            log.info(f"Sending PI Newly Milled Mask Email to: {mail_to}")
 
-        utils.send_email(mail_to, mail_from, mail_msg, mail_subject, mail_server)
+            utils.send_email(mail_to, mail_from, mail_msg, mail_subject,
+                             mail_server, log=log, session=session)
 
 
 
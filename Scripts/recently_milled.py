@@ -7,6 +7,34 @@ import email_utils as utils
 CONFIG_FILE = "slitmask_emails.live.ini"
 APP_PATH = path.abspath(path.dirname(__file__))
 
+
+def recently_milled_message(json_output):
+    """
+    The html table of the recently milled masks which are still to be used.
+
+    :param json_output: <dict> the recently-scanned-barcodes API results.
+
+    :return: <str> the email message,  None if there are no masks to report.
+    """
+    today_str = datetime.today().strftime('%Y-%m-%d')
+
+    cln_data = []
+    # remove the time stamp field, only show results for Use date later than today
+    for mask_info in json_output['data']:
+        mask_info = dict(mask_info)
+        if 'millid' in mask_info:
+            del mask_info['millid']
+        if 'Use_Date' in mask_info and mask_info['Use_Date'] < today_str:
+            continue
+
+        cln_data.append(mask_info)
+
+    if not cln_data:
+        return None
+
+    return utils.json_to_html_table({'data': cln_data})
+
+
 if __name__ == '__main__':
 
     cfg, log = utils.start_up(APP_PATH)
@@ -34,22 +62,7 @@ if __name__ == '__main__':
         log.error(f'No JSON returned API might be down. ERROR: {e}')
         sys.exit()
 
-    today_str = datetime.today().strftime('%Y-%m-%d')
-
-    cln_data = []
-    # remove the time stamp field, only show results for Use date later than today
-    for mask_info in json_output['data']:
-        if 'millid' in mask_info:
-            del mask_info['millid']
-        if 'Use_Date' in mask_info and mask_info['Use_Date'] < today_str:
-            continue
-
-        cln_data.append(mask_info)
-
-    json_output['data'] = cln_data
-    html_table = utils.json_to_html_table(json_output)
-
-    mail_msg = html_table
+    mail_msg = recently_milled_message(json_output)
 
     log.info(f'Sending Recently Milled Mask Notification Email to: {mail_to}.')
 
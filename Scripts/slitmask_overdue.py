@@ -7,6 +7,34 @@ import email_utils as utils
 CONFIG_FILE = "slitmask_emails.live.ini"
 APP_PATH = path.abspath(path.dirname(__file__))
 
+
+def overdue_message(json_output):
+    """
+    The html table of the overdue masks,  with the number of days until
+    each mask is used.
+
+    :param json_output: <dict> the mill-overdue API results.
+
+    :return: <str> the email message.
+    """
+    # Use-Date is in HST
+    today = date.today()
+
+    # remove the time stamp field,  add the number of days until mask is used
+    masks = []
+    for mask_info in json_output['data']:
+        mask_info = dict(mask_info)
+        use_date = datetime.strptime(mask_info['Use-Date'], '%Y-%m-%d').date()
+
+        if 'Time-Stamp' in mask_info:
+            del mask_info['Time-Stamp']
+
+        mask_info['TMinus (days)'] = (use_date - today).days
+        masks.append(mask_info)
+
+    return utils.json_to_html_table({'data': masks})
+
+
 if __name__ == '__main__':
 
     cfg, log = utils.start_up(APP_PATH)
@@ -33,21 +61,7 @@ if __name__ == '__main__':
         log.error(f'No JSON returned API might be down. ERROR: {e}')
         sys.exit()
 
-    # Use-Date is in HST
-    today = date.today()
-
-    # remove the time stamp field,  add the number of days until mask is used
-    for mask_info in json_output['data']:
-        use_date = datetime.strptime(mask_info['Use-Date'], '%Y-%m-%d').date()
-
-        if 'Time-Stamp' in mask_info:
-            del mask_info['Time-Stamp']
-
-        mask_info['TMinus (days)'] = (use_date - today).days
-
-    html_table = utils.json_to_html_table(json_output)
-
-    mail_msg = html_table
+    mail_msg = overdue_message(json_output)
 
     log.info(f'Sending Mask Overdue Notification Email to: {mail_to}.')
 
@@ -0,0 +1,162 @@
+-- Stand-in slitmask schema for the local benchmark database.
+--
+-- Only the tables and columns the API reads and writes,  with the primary
+-- keys and the foreign key indexes.  The migrations in DatabaseApi/migrations
+-- are applied on top by seed_db.py,  the same as on the metabase database.
+--
+-- The API connects as dbadmin,  create the role and database with:
+--     createuser -s dbadmin
+--     createdb -O dbadmin slitmask_bench
+
+DROP TABLE IF EXISTS MaskEvents, Mask, SlitObjMap, NearObj, ExtendObj, Objects,
+    BluSlits, DesiSlits, MaskBlu, MaskDesign, Observers CASCADE;
+
+CREATE TABLE Observers (
+    ObId        SERIAL                  PRIMARY KEY,
+    KeckId      INTEGER,
+    FirstNm     VARCHAR(32),
+    LastNm      VARCHAR(32),
+    Email       VARCHAR(128),
+    Institution VARCHAR(128),
+    pass        VARCHAR(32),
+    privbits    INTEGER                 DEFAULT 0,
+    stamp       timestamp without time zone DEFAULT now()
+);
+
+CREATE INDEX observers_keckid_idx ON Observers (KeckId);
+
+CREATE TABLE MaskDesign (
+    DesId       SERIAL                  PRIMARY KEY,
+    DesName     VARCHAR(68),
+    DesPId      INTEGER,
+    DesCreat    VARCHAR(68),
+    DesDate     timestamp without time zone,
+    DesNslit    INTEGER,
+    DesNobj     INTEGER,
+    ProjName    VARCHAR(68),
+    INSTRUME    VARCHAR(68),
+    MaskType    VARCHAR(68),
+    RA_PNT      DOUBLE PRECISION,
+    DEC_PNT     DOUBLE PRECISION,
+    RADEPNT     VARCHAR(8),
+    EQUINPNT    DOUBLE PRECISION,
+    PA_PNT      DOUBLE PRECISION,
+    DATE_PNT    timestamp without time zone,
+    LST_PNT     DOUBLE PRECISION,
+    stamp       timestamp without time zone DEFAULT now(),
+    maskumail   VARCHAR(128)
+);
+
+CREATE INDEX maskdesign_despid_idx ON MaskDesign (DesPId);
+
+CREATE TABLE MaskBlu (
+    BluId       SERIAL                  PRIMARY KEY,
+    DesId       INTEGER,
+    BluName     VARCHAR(68),
+    BluPId      INTEGER,
+    BluCreat    VARCHAR(68),
+    BluDate     timestamp without time zone,
+    LST_Use     DOUBLE PRECISION,
+    Date_Use    timestamp without time zone,
+    TeleId      INTEGER,
+    AtmTempC    REAL,
+    AtmPres     REAL,
+    AtmHumid    REAL,
+    AtmTTLap    REAL,
+    RefWave     REAL,
+    GUIname     VARCHAR(12),
+    millseq     VARCHAR(4),
+    status      INTEGER,
+    loc         VARCHAR(32),
+    stamp       timestamp without time zone DEFAULT now(),
+    RefrAlg     VARCHAR(68),
+    DistMeth    VARCHAR(68)
+);
+
+CREATE INDEX maskblu_desid_idx ON MaskBlu (DesId);
+CREATE INDEX maskblu_blupid_idx ON MaskBlu (BluPId);
+CREATE INDEX maskblu_guiname_idx ON MaskBlu (GUIname);
+
+CREATE TABLE DesiSlits (
+    dSlitId     SERIAL                  PRIMARY KEY,
+    DesId       INTEGER,
+    slitRA      DOUBLE PRECISION,
+    slitDec     DOUBLE PRECISION,
+    slitTyp     CHAR(1),
+    slitLen     REAL,
+    slitLPA     REAL,
+    slitWid     REAL,
+    slitWPA     REAL,
+    slitName    VARCHAR(20)
+);
+
+CREATE INDEX desislits_desid_idx ON DesiSlits (DesId);
+
+CREATE TABLE BluSlits (
+    bSlitId     SERIAL                  PRIMARY KEY,
+    BluId       INTEGER,
+    dSlitId     INTEGER,
+    slitX1      REAL,
+    slitY1      REAL,
+    slitX2      REAL,
+    slitY2      REAL,
+    slitX3      REAL,
+    slitY3      REAL,
+    slitX4      REAL,
+    slitY4      REAL,
+    bad         INTEGER                 DEFAULT 0
+);
+
+CREATE INDEX bluslits_bluid_idx ON BluSlits (BluId);
+CREATE INDEX bluslits_dslitid_idx ON BluSlits (dSlitId);
+
+CREATE TABLE Objects (
+    ObjectId    SERIAL                  PRIMARY KEY,
+    OBJECT      VARCHAR(68),
+    RA_OBJ      DOUBLE PRECISION,
+    DEC_OBJ     DOUBLE PRECISION,
+    RADECSYS    VARCHAR(8),
+    EQUINOX     DOUBLE PRECISION,
+    MJD_OBS     DOUBLE PRECISION,
+    mag         REAL,
+    pBand       VARCHAR(8),
+    RadVel      REAL,
+    MajAxis     REAL,
+    ObjClass    VARCHAR(20)
+);
+
+CREATE TABLE ExtendObj (
+    ObjectId    INTEGER,
+    MajAxPA     REAL,
+    MinAxis     REAL
+);
+
+CREATE TABLE NearObj (
+    ObjectId    INTEGER,
+    PM_RA       REAL,
+    PM_Dec      REAL,
+    Parallax    REAL
+);
+
+CREATE TABLE SlitObjMap (
+    DesId       INTEGER,
+    ObjectId    INTEGER,
+    dSlitId     INTEGER,
+    TopDist     REAL,
+    BotDist     REAL
+);
+
+CREATE INDEX slitobjmap_desid_idx ON SlitObjMap (DesId);
+CREATE INDEX slitobjmap_objectid_idx ON SlitObjMap (ObjectId);
+
+-- MaskId is the barcode on the milled mask
+CREATE TABLE Mask (
+    MaskId      INTEGER                 PRIMARY KEY,
+    BluId       INTEGER,
+    GUIname     VARCHAR(12),
+    MillDate    timestamp without time zone,
+    MillId      INTEGER,
+    MillSeq     VARCHAR(4)
+);
+
+CREATE INDEX mask_bluid_idx ON Mask (BluId);
@@ -0,0 +1,123 @@
+"""
+Shared settings of the benchmark scripts:  the paths,  the local database,
+the synthetic observers and the timing statistics.
+"""
+import sys
+import math
+import subprocess
+from os import path
+
+BENCH_PATH = path.abspath(path.dirname(__file__))
+REPO_PATH = path.abspath(path.join(BENCH_PATH, '..'))
+API_PATH = path.join(REPO_PATH, 'DatabaseApi')
+MIGRATIONS_PATH = path.join(API_PATH, 'migrations')
+SCHEMA_FILE = path.join(BENCH_PATH, 'bench_schema.sql')
+RESULTS_PATH = path.join(BENCH_PATH, 'results')
+
+# the local stand-in database,  the API always connects as dbadmin
+DB_DEFAULTS = {'host': 'localhost', 'port': 5432, 'dbname': 'slitmask_bench',
+               'user': 'dbadmin', 'password': ''}
+
+# the synthetic observers have keck ids above this,  the legacy obids are < 1000
+KECK_ID_BASE = 5000
+
+# the cookie holding the keck id of the benchmark user (stub cookie service)
+BENCH_COOKIE = 'bench_keck_id'
+
+
+def use_api_modules():
+    """
+    Import the DatabaseApi modules by bare name,  as the API does.
+    """
+    if API_PATH not in sys.path:
+        sys.path.insert(0, API_PATH)
+
+
+def add_db_args(parser):
+    """
+    The command line options of the local database.
+    """
+    for key, val in DB_DEFAULTS.items():
+        parser.add_argument(f'--{key}', type=type(val), default=val,
+                            help=f'local database {key} (default: {val!r})')
+
+
+def db_params(args):
+    return {key: getattr(args, key) for key in DB_DEFAULTS}
+
+
+def connect(args):
+    """
+    :param args: <Namespace> the parsed add_db_args options.
+
+    :return: <connection> a psycopg2 connection to the stand-in database.
+    """
+    import psycopg2
+
+    return psycopg2.connect(**db_params(args))
+
+
+def observer(index, num_legacy):
+    """
+    The synthetic observer number index (from 1),  the same record is used by
+    the seeder and the stub observer service.  The first num_legacy observers
+    also have a legacy obid (< 1000) in the slitmask Observers table.  The
+    first observer is the mask admin.
+
+    :param index: <int> the observer number.
+    :param num_legacy: <int> the number of observers with a legacy obid.
+
+    :return: <dict> the Keck observer record,  with the slitmask obid.
+    """
+    keck_id = KECK_ID_BASE + index
+
+    return {
+        'Id': keck_id,
+        'keckid': keck_id,
+        'obid': index if index <= num_legacy else keck_id,
+        'FirstName': f'Bench{index}',
+        'LastName': 'Observer',
+        'Email': f'observer{index}@bench.keck.example',
+        'Affiliation': 'Benchmark University',
+        'AllocInst': 'OTHER',
+        'Phone': '8085550000',
+        'username': f'bench{index}',
+        'privbits': 1 if index == 1 else 0,
+    }
+
+
+def observers(num_observers, num_legacy):
+    return [observer(index, num_legacy) for index in range(1, num_observers + 1)]
+
+
+def percentile(values, pct):
+    """
+    The nearest-rank percentile.
+
+    :param values: <list> the measurements.
+    :param pct: <float> the percentile,  0 - 100.
+
+    :return: <float> the percentile value,  None without values.
+    """
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100.0 * len(ordered)) - 1, 0)
+
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def git_commit():
+    """
+    :return: <str> the short commit of the working tree,  '' if unknown.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_PATH,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               cwd=REPO_PATH, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+    return f'{commit}-dirty' if dirty.strip() else commit
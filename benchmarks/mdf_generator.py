@@ -0,0 +1,258 @@
+"""
+Synthetic mask design files (MDF) for the ingest benchmarks.
+
+The tables and columns are built from mdf_content.mdfcontent,  so the files
+pass the same structure checks as a DSIMULATOR or lsc2df MDF:
+
+    DEIMOS - FITS ASCII tables (DSIMULATOR),  with the object catalog,  one
+             object per slit plus the guide stars.
+    LRIS   - FITS binary tables (lsc2df),  the slits have no celestial
+             coordinates and ObjectCat,  CatFiles and SlitObjMap have no rows.
+
+    python mdf_generator.py bench.fits --instrument DEIMOS --slits 80 --align 4
+"""
+import random
+import argparse
+from io import BytesIO
+from datetime import date, timedelta
+
+import numpy
+from astropy.io import fits
+
+import bench_utils
+
+bench_utils.use_api_modules()
+
+from mdf_content import mdfcontent
+
+# the FITS column formats of the mdfcontent column types
+ASCII_FORMATS = {'int': 'I11', 'float': 'D25.17'}
+BINARY_FORMATS = {'int': 'J', 'float': 'D'}
+NUMPY_TYPES = {'int': numpy.int32, 'float': numpy.float64}
+
+# the mask in mm,  the slits are laid out along x
+MASK_HALF_WIDTH = 350.0
+ARCSEC_DEG = 1.0 / 3600.0
+
+# the instrument,  telescope,  table type and catalog of each MDF style
+STYLES = {
+    'DEIMOS': {'telescope': 'Keck II', 'ascii': True, 'objects': True},
+    'LRIS': {'telescope': 'Keck I', 'ascii': False, 'objects': False},
+}
+
+
+def table_hdu(extname, rows, ascii_table):
+    """
+    One MDF table,  the columns in the mdfcontent order and types.
+
+    :param extname: <str> the EXTNAME,  a key of mdfcontent.
+    :param rows: <list> the row dicts,  keyed by the mdfcontent column names.
+    :param ascii_table: <bool> True for a FITS ASCII table,  False for binary.
+
+    :return: <TableHDU / BinTableHDU> the table HDU.
+    """
+    columns = []
+    for name, attr in mdfcontent[extname].knownCols.items():
+        values = [row[name] for row in rows]
+
+        if attr.dtpre == 'chararray':
+            width = max([len(val) for val in values] + [1])
+            fmt = f'A{width}' if ascii_table else f'{width}A'
+            array = numpy.array(values, dtype=f'U{width}')
+        else:
+            formats = ASCII_FORMATS if ascii_table else BINARY_FORMATS
+            fmt = formats[attr.dtpre]
+            array = numpy.array(values, dtype=NUMPY_TYPES[attr.dtpre])
+
+        columns.append(fits.Column(name=name, format=fmt, array=array))
+
+    hdu_type = fits.TableHDU if ascii_table else fits.BinTableHDU
+
+    return hdu_type.from_columns(columns, nrows=len(rows), name=extname)
+
+
+def mdf_tables(instrument, num_slits, num_objects, num_align, guiname,
+               author_email, observer_email, date_use, rng):
+    """
+    :return: <dict> the rows of each MDF table,  keyed by EXTNAME.
+    """
+    style = STYLES[instrument]
+    today = date.today().isoformat()
+
+    ra_pnt = rng.uniform(0.0, 360.0)
+    dec_pnt = rng.uniform(-30.0, 70.0)
+    pa_pnt = rng.uniform(-90.0, 90.0)
+
+    design = {
+        'DesId': 1, 'DesName': f'{guiname} bench', 'DesAuth': author_email,
+        'DesCreat': 'mdf_generator', 'DesDate': today,
+        'DesNslit': num_slits + num_align,
+        'DesNobj': num_objects if style['objects'] else 0,
+        'ProjName': 'benchmark', 'INSTRUME': instrument, 'MaskType': 'bench',
+        'RA_PNT': ra_pnt, 'DEC_PNT': dec_pnt, 'RADEPNT': 'FK5',
+        'EQUINPNT': 2000.0, 'PA_PNT': pa_pnt, 'DATE_PNT': today,
+        'LST_PNT': rng.uniform(0.0, 360.0),
+    }
+
+    blue = {
+        'BluId': 1, 'DesId': 1, 'BluName': f'{guiname} blue', 'guiname': guiname,
+        'BluObsvr': observer_email, 'BluCreat': 'mdf_generator', 'BluDate': today,
+        'LST_Use': design['LST_PNT'], 'DATE_USE': date_use,
+        'TELESCOP': style['telescope'], 'RefrAlg': 'SLALIB', 'AtmTempC': 0.0,
+        'AtmPres': 615.0, 'AtmHumid': 0.4, 'AtmTTLap': 0.0065, 'RefWave': 0.63,
+        'DistMeth': 'INTERNAL',
+    }
+
+    design_slits = []
+    blue_slits = []
+    pitch = 2 * MASK_HALF_WIDTH / (num_slits + num_align)
+    for index in range(1, num_slits + num_align + 1):
+        align = index > num_slits
+
+        # alignment boxes are 4" square with the corners square to the slit PA
+        slit_len = 4.0 if align else rng.uniform(6.0, 10.0)
+        slit_wid = 4.0 if align else 1.0
+        slit_pa = pa_pnt + (0.0 if align else rng.uniform(-5.0, 5.0))
+
+        design_slits.append({
+            'dSlitId': index, 'DesId': 1, 'SlitName': str(index),
+            'slitRA': ra_pnt + rng.uniform(-0.05, 0.05) if style['objects'] else 0.0,
+            'slitDec': dec_pnt + rng.uniform(-0.05, 0.05) if style['objects'] else 0.0,
+            'slitTyp': 'A' if align else 'P', 'slitLen': slit_len,
+            'slitLPA': slit_pa, 'slitWid': slit_wid, 'slitWPA': slit_pa + 90.0,
+        })
+
+        x_left = -MASK_HALF_WIDTH + (index - 1) * pitch
+        x_right = x_left + 0.8 * pitch
+        y_bottom = rng.uniform(-100.0, 90.0)
+        y_top = y_bottom + slit_len * 0.73
+        blue_slits.append({
+            'bSlitId': index, 'BluId': 1, 'dSlitId': index,
+            'slitX1': x_left, 'slitY1': y_bottom, 'slitX2': x_right, 'slitY2': y_bottom,
+            'slitX3': x_right, 'slitY3': y_top, 'slitX4': x_left, 'slitY4': y_top,
+        })
+
+    objects = []
+    slit_objects = []
+    catalogs = []
+    if style['objects']:
+        catalogs.append({'CatFilePK': 1, 'CatFileName': f'{guiname}.cat'})
+
+        for index in range(1, num_objects + 1):
+            if index <= num_slits:
+                obj_class = 'Program_Target'
+            elif index <= num_slits + num_align:
+                obj_class = 'Alignment_Star'
+            else:
+                obj_class = 'Guide_Star'
+
+            # some extended targets and alignment stars with proper motions
+            extended = obj_class == 'Program_Target' and index % 5 == 0
+            moving = obj_class == 'Alignment_Star'
+
+            slit = design_slits[index - 1] if index <= len(design_slits) else None
+            objects.append({
+                'ObjectId': index, 'OBJECT': f'{obj_class[0]}{index:05d}',
+                'RA_OBJ': slit['slitRA'] if slit else ra_pnt + rng.uniform(-0.1, 0.1),
+                'DEC_OBJ': slit['slitDec'] if slit else dec_pnt + rng.uniform(-0.1, 0.1),
+                'RADESYS': 'FK5', 'EQUINOX': 2000.0, 'MJD-OBS': 0.0,
+                'mag': rng.uniform(16.0, 24.0), 'pBand': 'R', 'RadVel': 0.0,
+                'MajAxis': rng.uniform(0.5, 3.0) if extended else 0.0,
+                'MajAxPA': rng.uniform(0.0, 180.0) if extended else 0.0,
+                'MinAxis': rng.uniform(0.2, 1.0) if extended else 0.0,
+                'PM_RA': rng.uniform(-20.0, 20.0) if moving else 0.0,
+                'PM_Dec': rng.uniform(-20.0, 20.0) if moving else 0.0,
+                'Parallax': 0.0, 'ObjClass': obj_class, 'CatFilePK': 1,
+            })
+
+            if slit:
+                half_len = slit['slitLen'] / 2
+                slit_objects.append({
+                    'DesId': 1, 'ObjectId': index, 'dSlitId': index,
+                    'TopDist': half_len, 'BotDist': half_len,
+                })
+
+    return {
+        'ObjectCat': objects,
+        'CatFiles': catalogs,
+        'MaskDesign': [design],
+        'DesiSlits': design_slits,
+        'SlitObjMap': slit_objects,
+        'MaskBlu': [blue],
+        'BluSlits': blue_slits,
+    }
+
+
+def mdf_hdulist(instrument='DEIMOS', num_slits=80, num_objects=None, num_align=4,
+                guiname='bench', author_email=None, observer_email=None,
+                date_use=None, seed=None):
+    """
+    A synthetic MDF.
+
+    :param instrument: <str> DEIMOS or LRIS.
+    :param num_slits: <int> the number of science slits.
+    :param num_objects: <int> the number of catalog objects (DEIMOS),  at
+                        least one per slit and alignment box,  the rest are
+                        guide stars.  Default two guide stars.
+    :param num_align: <int> the number of alignment boxes.
+    :param guiname: <str> the mask GUI name.
+    :param author_email: <str> the design author,  a known observer email.
+    :param observer_email: <str> the blueprint observer,  default the author.
+    :param date_use: <str> the use date YYYY-MM-DD,  default 30 days ahead.
+    :param seed: <int> the random seed of the positions.
+
+    :return: <HDUList> the MDF.
+    """
+    if instrument not in STYLES:
+        raise ValueError(f'unknown instrument {instrument},  use: {list(STYLES)}')
+
+    if num_objects is None:
+        num_objects = num_slits + num_align + 2
+    elif num_objects < num_slits + num_align:
+        raise ValueError('num_objects must be at least num_slits + num_align')
+
+    author_email = author_email or bench_utils.observer(1, 1)['Email']
+    observer_email = observer_email or author_email
+    date_use = date_use or (date.today() + timedelta(days=30)).isoformat()
+
+    tables = mdf_tables(instrument, num_slits, num_objects, num_align, guiname,
+                        f'Bench Observer <{author_email}>',
+                        f'Bench Observer <{observer_email}>', date_use,
+                        random.Random(seed))
+
+    ascii_table = STYLES[instrument]['ascii']
+    hdus = [fits.PrimaryHDU()]
+    for extname, rows in tables.items():
+        hdus.append(table_hdu(extname, rows, ascii_table))
+
+    return fits.HDUList(hdus)
+
+
+def mdf_bytes(**kwargs):
+    """
+    :return: <bytes> the synthetic MDF file content,  see mdf_hdulist.
+    """
+    buffer = BytesIO()
+    mdf_hdulist(**kwargs).writeto(buffer)
+
+    return buffer.getvalue()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic MDF.')
+    parser.add_argument('output', help='the MDF file to write')
+    parser.add_argument('--instrument', default='DEIMOS', choices=sorted(STYLES))
+    parser.add_argument('--slits', type=int, default=80, help='science slits')
+    parser.add_argument('--objects', type=int, help='catalog objects (DEIMOS)')
+    parser.add_argument('--align', type=int, default=4, help='alignment boxes')
+    parser.add_argument('--guiname', default='bench')
+    parser.add_argument('--email', help='the design author email')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    mdf = mdf_hdulist(instrument=args.instrument, num_slits=args.slits,
+                      num_objects=args.objects, num_align=args.align,
+                      guiname=args.guiname, author_email=args.email, seed=args.seed)
+    mdf.writeto(args.output, overwrite=True)
+
+    print(f'{args.output}: {args.instrument} {args.slits} slits, {args.align} alignment boxes')
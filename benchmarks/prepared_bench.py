@@ -0,0 +1,152 @@
+"""
+The parse and plan time saved by the prepared hot queries:  the ownership
+checks,  run several times a request,  are timed on one connection sending
+the query text and on one running them prepared (pgconn.execute_query),
+against the seeded stand-in database.
+
+    python seed_db.py --designs 2000
+    python prepared_bench.py --calls 2000
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from os import path, makedirs
+from datetime import datetime
+
+import bench_utils
+
+# the ownership checks and their parameters from a sampled blueprint
+OWNERSHIP_CALLS = {
+    'blue_person': lambda row: (row['bluid'], row['blupid']),
+    'design_person': lambda row: (row['desid'], row['despid'], row['desid'], row['despid']),
+    'blue_to_design': lambda row: (row['bluid'], ),
+    'design_to_blue': lambda row: (row['desid'], ),
+    'batch_blue_person': lambda row: (row['despid'], row['despid'], [row['bluid']], []),
+}
+
+
+def sample_rows(conn, num_rows):
+    with conn.cursor() as curse:
+        curse.execute('SELECT b.BluId, b.BluPId, d.DesId, d.DesPId FROM MaskBlu b '
+                      'JOIN MaskDesign d ON d.DesId = b.DesId '
+                      'ORDER BY random() LIMIT %s', (num_rows, ))
+        return [dict(zip(('bluid', 'blupid', 'desid', 'despid'), row))
+                for row in curse.fetchall()]
+
+
+def time_calls(conn, calls, prepared):
+    """
+    :return: <dict> the seconds of each call,  by query name.
+    """
+    import pgconn
+    from slitmask_queries import get_query
+
+    pgconn.PREPARE_QUERIES = prepared
+    times = {name: [] for name in OWNERSHIP_CALLS}
+
+    with conn.cursor() as curse:
+        for name, params in calls:
+            start = time.perf_counter()
+            pgconn.execute_query(curse, name, get_query(name), params)
+            curse.fetchall()
+            times[name].append(time.perf_counter() - start)
+        conn.rollback()
+
+    return times
+
+
+def lookup_ns(num_lookups):
+    """
+    :return: <float> the nanoseconds of one get_query lookup.
+    """
+    from slitmask_queries import get_query, QUERY_INDEX
+
+    names = list(QUERY_INDEX) * (num_lookups // len(QUERY_INDEX) + 1)
+    start = time.perf_counter()
+    for name in names[:num_lookups]:
+        get_query(name)
+
+    return (time.perf_counter() - start) / num_lookups * 1e9
+
+
+def summary(times):
+    return {name: {'p50_us': round(bench_utils.percentile(values, 50) * 1e6, 1),
+                   'p95_us': round(bench_utils.percentile(values, 95) * 1e6, 1)}
+            for name, values in times.items()}
+
+
+def run(args):
+    import psycopg2
+    import pgconn
+
+    params = bench_utils.db_params(args)
+    text_conn = psycopg2.connect(**params, connection_factory=pgconn.PreparingConnection)
+    prepared_conn = psycopg2.connect(**params, connection_factory=pgconn.PreparingConnection)
+
+    try:
+        rows = sample_rows(text_conn, args.blueprints)
+        if not rows:
+            sys.exit('no blueprints,  run seed_db.py first')
+
+        rng = random.Random(0)
+        calls = []
+        for _ in range(args.calls):
+            name, make_params = rng.choice(list(OWNERSHIP_CALLS.items()))
+            calls.append((name, make_params(rng.choice(rows))))
+
+        # the first pass warms the caches of both connections
+        for conn, prepared in ((text_conn, False), (prepared_conn, True)):
+            time_calls(conn, calls[:len(OWNERSHIP_CALLS) * 10], prepared)
+
+        text_times = time_calls(text_conn, calls, False)
+        prepared_times = time_calls(prepared_conn, calls, True)
+    finally:
+        text_conn.close()
+        prepared_conn.close()
+
+    text_total = sum(sum(values) for values in text_times.values())
+    prepared_total = sum(sum(values) for values in prepared_times.values())
+
+    return {
+        'commit': bench_utils.git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'calls': args.calls,
+        'text': summary(text_times),
+        'prepared': summary(prepared_times),
+        'text_total_ms': round(text_total * 1000, 1),
+        'prepared_total_ms': round(prepared_total * 1000, 1),
+        'saved_per_call_us': round((text_total - prepared_total) / args.calls * 1e6, 1),
+        'get_query_ns': round(lookup_ns(100000), 1),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the prepared ownership checks.')
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--blueprints', type=int, default=200,
+                        help='the seeded blueprints sampled')
+    parser.add_argument('--output', help='the results JSON file')
+    bench_utils.add_db_args(parser)
+    args = parser.parse_args()
+
+    bench_utils.use_api_modules()
+    report = run(args)
+
+    for name in OWNERSHIP_CALLS:
+        text, prepared = report['text'][name], report['prepared'][name]
+        print(f"{name:18} text p50 {text['p50_us']} us,  prepared p50 {prepared['p50_us']} us")
+    print(f"total {report['text_total_ms']} ms -> {report['prepared_total_ms']} ms,  "
+          f"saved {report['saved_per_call_us']} us per call,  "
+          f"get_query {report['get_query_ns']} ns")
+
+    output = args.output or path.join(
+        bench_utils.RESULTS_PATH,
+        f"prepared-{report['commit'] or 'unknown'}-{datetime.now():%Y%m%d%H%M%S}.json"
+    )
+    makedirs(path.dirname(path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as fp:
+        json.dump(report, fp, indent=2)
+
+    print(f'results: {output}')
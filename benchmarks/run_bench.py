@@ -0,0 +1,352 @@
+"""
+Timed API scenarios through the Flask test client,  against the seeded
+stand-in database and the stub services.  The p50/p95 latency and the SQL
+statements per call of each scenario are written as JSON to compare commits:
+
+    python seed_db.py --designs 2000
+    python run_bench.py --iterations 30
+    python run_bench.py --compare results/bench-<base>.json results/bench-<new>.json
+
+The query budgets are checked in the --budget mode (default warn),  use
+enforce to fail the calls over a route budget.
+"""
+import sys
+import json
+import random
+import logging
+import argparse
+import tempfile
+from io import BytesIO
+from os import path, makedirs
+from time import perf_counter
+from datetime import datetime
+
+import bench_utils
+import stub_services
+
+# the calls before the timed calls of each scenario
+WARMUP = 2
+
+# the designs and milled masks sampled for the calls
+SAMPLE_SIZE = 200
+STARLIST_SIZE = 20
+
+SEARCH_OPTIONS = {
+    'admin-search-email': lambda ctx, i: {'email': ctx['emails'][i % len(ctx['emails'])]},
+    'admin-search-guiname': lambda ctx, i: {'guiname': f'bn00{i % 10}'},
+    'admin-search-name': lambda ctx, i: {'name': f'design {i + 1}'},
+    'admin-search-desid-range': lambda ctx, i: {
+        'desid': [ctx['design_ids'][i % len(ctx['design_ids'])],
+                  ctx['design_ids'][i % len(ctx['design_ids'])] + 100]},
+    'admin-search-barcodes': lambda ctx, i: {'barcode': ctx['barcodes'][:10]},
+    'admin-search-milled': lambda ctx, i: {'milled': 'no', 'limit': 100},
+    'admin-search-caldays': lambda ctx, i: {'caldays': 30, 'limit': 100},
+    'admin-search-combined': lambda ctx, i: {
+        'email': ctx['emails'][i % len(ctx['emails'])], 'inst': 'DEIMOS',
+        'milled': 'no', 'submitted': {'min': '2020-01-01'}, 'limit': 50},
+}
+
+
+def write_db_config(work_dir, args):
+    """
+    The wspgcfg_live.py the API reads the database settings from.
+    """
+    from mask_constants import USER_TYPE_STR
+
+    pwdict = {user: args.password for user in USER_TYPE_STR + ['dbadmin']}
+    with open(path.join(work_dir, 'wspgcfg_live.py'), 'w') as fp:
+        fp.write(f'host = {args.host!r}\nport = {args.port}\n'
+                 f'dbname = {args.dbname!r}\npwdict = {pwdict!r}\n')
+
+    sys.path.insert(0, work_dir)
+
+
+def setup_api(args, work_dir, obs_service):
+    """
+    Create the API app with the settings its config file would give.
+
+    :return: <Flask> the app.
+    """
+    import logger_utils as log_fun
+
+    write_db_config(work_dir, args)
+
+    log = log_fun.configure_logger(work_dir)
+    log.setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    import slitmask_api as api
+
+    kroot = path.join(work_dir, 'kroot')
+    dbmaskout_dir, ncmill_dir = stub_services.tool_tree(kroot)
+    settings = {
+        'LOGIN_URL': obs_service.url('/login'),
+        'OBS_INFO': obs_service.obs_info(),
+        'EMAIL_INFO': {'from': 'bench@keck.example', 'admin': 'bench@keck.example',
+                       'server': 'localhost'},
+        'KROOT': kroot,
+        'DBMASKOUT_DIR': dbmaskout_dir,
+        'NCMILL_DIR': ncmill_dir,
+        'GCODE_DIR': path.join(kroot, 'var/ncmill'),
+        'RAW_MDF_DIR': path.join(work_dir, 'mdf'),
+        'QUERY_BUDGET_MODE': args.budget,
+    }
+    makedirs(settings['RAW_MDF_DIR'], exist_ok=True)
+
+    return api.create_app(start_threads=False, settings=settings)
+
+
+def sample_context(args):
+    """
+    The seeded ids the scenarios call with.
+    """
+    conn = bench_utils.connect(args)
+    ctx = {'counts': {}}
+    try:
+        with conn.cursor() as curse:
+            for table in ('Observers', 'MaskDesign', 'MaskBlu', 'DesiSlits', 'Objects', 'Mask'):
+                curse.execute(f'SELECT count(*) FROM {table}')
+                ctx['counts'][table] = curse.fetchone()[0]
+
+            curse.execute('SELECT DesId FROM MaskDesign ORDER BY random() LIMIT %s',
+                          (SAMPLE_SIZE, ))
+            ctx['design_ids'] = [row[0] for row in curse.fetchall()]
+
+            curse.execute('SELECT MaskId, GUIname FROM Mask ORDER BY random() LIMIT %s',
+                          (STARLIST_SIZE, ))
+            milled = curse.fetchall()
+            ctx['barcodes'] = [row[0] for row in milled]
+            ctx['guinames'] = [row[1] for row in milled]
+    finally:
+        conn.close()
+
+    if not ctx['design_ids']:
+        sys.exit(f'no designs in {args.dbname},  run seed_db.py first')
+
+    num_legacy = ctx['counts']['Observers']
+    ctx['observers'] = bench_utils.observers(args.observers, num_legacy)
+    ctx['emails'] = [obs['Email'] for obs in ctx['observers']]
+    ctx['num_legacy'] = num_legacy
+
+    return ctx
+
+
+def cookie(keck_id):
+    return {'Cookie': f'{bench_utils.BENCH_COOKIE}={keck_id}'}
+
+
+def admin_headers(ctx):
+    return cookie(ctx['observers'][0]['Id'])
+
+
+def upload_calls(instrument, num_slits, guiname=None):
+    """
+    The MDFs are generated before the timed calls,  one new mask per call.
+    With guiname all the masks ask for the same GUIname.
+    """
+    def calls(ctx, num_calls):
+        from mdf_generator import mdf_bytes
+
+        rng = random.Random(num_calls)
+        result = []
+        for index in range(num_calls):
+            user = ctx['observers'][rng.randrange(1, len(ctx['observers']))]
+            mdf = mdf_bytes(instrument=instrument, num_slits=num_slits,
+                            guiname=guiname or f'u{instrument[0]}{index:05d}',
+                            author_email=user['Email'], seed=index)
+            result.append({
+                'path': '/slitmask/upload-mdf', 'method': 'POST',
+                'headers': cookie(user['Id']),
+                'data': {'mask-file': (BytesIO(mdf), f'bench_{index}.fits')},
+                'content_type': 'multipart/form-data',
+            })
+
+        return result
+
+    return calls
+
+
+def search_calls(name):
+    def calls(ctx, num_calls):
+        return [{'path': '/slitmask/admin-search', 'headers': admin_headers(ctx),
+                 'query_string': {'search-options': json.dumps(SEARCH_OPTIONS[name](ctx, i))}}
+                for i in range(num_calls)]
+
+    return calls
+
+
+def mask_detail_calls(ctx, num_calls):
+    design_ids = ctx['design_ids']
+    return [{'path': '/slitmask/mask-detail', 'headers': admin_headers(ctx),
+             'query_string': {'design-id': design_ids[i % len(design_ids)]}}
+            for i in range(num_calls)]
+
+
+def mill_queue_calls(ctx, num_calls):
+    return [{'path': '/slitmask/mill-queue'} for _ in range(num_calls)]
+
+
+def active_masks_calls(ctx, num_calls):
+    return [{'path': '/slitmask/all-active-masks', 'headers': admin_headers(ctx)}
+            for _ in range(num_calls)]
+
+
+def name_suggest_calls(ctx, num_calls):
+    # the typed prefixes of the seeded guinames,  misspelled every other call
+    names = ctx['guinames']
+    calls = []
+    for i in range(num_calls):
+        name = names[i % len(names)][:3 + i % 4]
+        if i % 2:
+            name = name[:-1] + 'x'
+        calls.append({'path': '/slitmask/name-suggest', 'headers': admin_headers(ctx),
+                      'query_string': {'q': name}})
+
+    return calls
+
+
+def starlist_calls(ctx, num_calls):
+    return [{'path': '/slitmask/guiname-starlist',
+             'query_string': {'guiname-list': json.dumps(ctx['guinames'])}}
+            for _ in range(num_calls)]
+
+
+# the scenarios in run order,  the uploads last as they add masks
+SCENARIOS = {
+    'mill-queue': mill_queue_calls,
+    'mask-detail': mask_detail_calls,
+    **{name: search_calls(name) for name in SEARCH_OPTIONS},
+    'all-active-masks': active_masks_calls,
+    'guiname-starlist': starlist_calls,
+    'name-suggest': name_suggest_calls,
+    'upload-mdf-deimos': upload_calls('DEIMOS', 80),
+    'upload-mdf-lris': upload_calls('LRIS', 25),
+}
+
+
+def run_scenario(client, metrics_utils, calls, warmup):
+    """
+    :return: <dict> the latency and statement summary of the timed calls.
+    """
+    for kwargs in calls[:warmup]:
+        client.open(**kwargs)
+
+    timings = []
+    queries = []
+    repeats = []
+    errors = 0
+    for kwargs in calls[warmup:]:
+        start = perf_counter()
+        response = client.open(**kwargs)
+        timings.append(perf_counter() - start)
+
+        _, _, statements = metrics_utils.last_request()
+        statements = statements or {}
+        queries.append(sum(statements.values()))
+        repeats.append(max(statements.values(), default=0))
+
+        if response.status_code >= 400:
+            errors += 1
+
+    return {
+        'calls': len(timings),
+        'errors': errors,
+        'p50_ms': round(bench_utils.percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(bench_utils.percentile(timings, 95) * 1000, 2),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 2),
+        'max_ms': round(max(timings) * 1000, 2),
+        'queries_per_call': round(sum(queries) / len(queries), 1),
+        'max_queries': max(queries),
+        'max_repeats': max(repeats),
+    }
+
+
+def run(args):
+    names = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f'unknown scenarios: {unknown},  from: {", ".join(SCENARIOS)}')
+
+    ctx = sample_context(args)
+
+    with tempfile.TemporaryDirectory(prefix='slitmask_bench_') as work_dir, \
+            stub_services.ObserverService(args.observers, ctx['num_legacy']) as obs_service:
+        app = setup_api(args, work_dir, obs_service)
+        client = app.test_client()
+
+        import metrics_utils
+
+        results = {}
+        for name in names:
+            calls = SCENARIOS[name](ctx, args.warmup + args.iterations)
+            results[name] = run_scenario(client, metrics_utils, calls, args.warmup)
+            print(f"{name:>26}: p50 {results[name]['p50_ms']:>9.2f} ms  "
+                  f"p95 {results[name]['p95_ms']:>9.2f} ms  "
+                  f"queries {results[name]['queries_per_call']:>7.1f}  "
+                  f"errors {results[name]['errors']}")
+
+    return {
+        'commit': bench_utils.git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'iterations': args.iterations,
+        'budget': args.budget,
+        'database': ctx['counts'],
+        'scenarios': results,
+    }
+
+
+def compare(base_file, new_file):
+    """
+    Print the change of each scenario between two result files.
+    """
+    with open(base_file) as fp:
+        base = json.load(fp)
+    with open(new_file) as fp:
+        new = json.load(fp)
+
+    print(f"{'scenario':>26}  {base['commit']:>12} -> {new['commit']:<12}")
+    for name, result in new['scenarios'].items():
+        old = base['scenarios'].get(name)
+        if not old:
+            print(f'{name:>26}: new')
+            continue
+
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'queries_per_call'):
+            pct = (result[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            changes.append(f'{key} {old[key]} -> {result[key]} ({pct:+.0f}%)')
+
+        print(f'{name:>26}: ' + ',  '.join(changes))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the API benchmarks.')
+    parser.add_argument('--iterations', type=int, default=20, help='timed calls per scenario')
+    parser.add_argument('--warmup', type=int, default=WARMUP, help='untimed calls first')
+    parser.add_argument('--scenarios', help=f'comma separated, from: {", ".join(SCENARIOS)}')
+    parser.add_argument('--observers', type=int, default=200,
+                        help='the observers seeded by seed_db.py')
+    parser.add_argument('--budget', default='warn', choices=['off', 'warn', 'enforce'],
+                        help='the query budget mode')
+    parser.add_argument('--output', help='the results JSON file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help='compare two results files and exit')
+    parser.add_argument('--verbose', action='store_true', help='log the API requests')
+    bench_utils.add_db_args(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    bench_utils.use_api_modules()
+    report = run(args)
+
+    output = args.output or path.join(
+        bench_utils.RESULTS_PATH,
+        f"bench-{report['commit'] or 'unknown'}-{datetime.now():%Y%m%d%H%M%S}.json"
+    )
+    makedirs(path.dirname(path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as fp:
+        json.dump(report, fp, indent=2)
+
+    print(f'results: {output}')
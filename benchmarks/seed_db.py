@@ -0,0 +1,282 @@
+"""
+Fill the local stand-in database with synthetic masks for the benchmarks.
+
+The stand-in schema (bench_schema.sql) and the DatabaseApi migrations are
+applied first,  the existing tables are dropped.  The rows are written with
+multi-row inserts and the change triggers disabled while loading.
+
+The ratios follow the production database:  about two thirds DEIMOS masks,
+some designs with a second blueprint,  most past blueprints milled and the
+old ones archived.
+
+    python seed_db.py --designs 5000 --observers 400 [--dbname slitmask_bench]
+"""
+import glob
+import random
+import string
+import argparse
+from os import path
+from datetime import datetime, timedelta
+
+import bench_utils
+
+bench_utils.use_api_modules()
+
+from psycopg2.extras import execute_values
+
+from sky_index import sky_pixel
+from mask_constants import UNMILLED, READY, ARCHIVED, PERPETUAL_DATE, \
+    ARCHIVE_AFTER_MONTHS
+
+# the mix of masks
+DEIMOS_FRACTION = 0.65
+SECOND_BLUEPRINT_FRACTION = 0.15
+PERPETUAL_FRACTION = 0.02
+MILLED_FRACTION = 0.9
+ARCHIVED_FRACTION = 0.7
+LEGACY_FRACTION = 0.6
+YEARS = 6
+
+# science slits and alignment boxes per design
+DEIMOS_SLITS = (40, 140)
+LRIS_SLITS = (10, 40)
+DEIMOS_ALIGN = 4
+LRIS_ALIGN = 3
+GUIDE_STARS = 2
+
+# the first barcode of the milled masks
+FIRST_BARCODE = 10000
+
+# the tables loaded with the triggers of migrations/001 and 002 disabled
+TRIGGER_TABLES = ['MaskDesign', 'MaskBlu', 'BluSlits', 'Mask']
+
+INSERTS = {
+    'Observers': 'INSERT INTO Observers (ObId, KeckId, FirstNm, LastNm, Email, '
+                 'Institution, privbits) VALUES %s',
+    'MaskDesign': 'INSERT INTO MaskDesign (DesId, DesName, DesPId, DesCreat, DesDate, '
+                  'DesNslit, DesNobj, ProjName, INSTRUME, MaskType, RA_PNT, DEC_PNT, '
+                  'RADEPNT, EQUINPNT, PA_PNT, DATE_PNT, LST_PNT, stamp, maskumail, '
+                  'SkyPix) VALUES %s',
+    'MaskBlu': 'INSERT INTO MaskBlu (BluId, DesId, BluName, BluPId, BluCreat, BluDate, '
+               'LST_Use, Date_Use, TeleId, AtmTempC, AtmPres, AtmHumid, AtmTTLap, '
+               'RefWave, GUIname, millseq, status, stamp, RefrAlg, DistMeth) VALUES %s',
+    'DesiSlits': 'INSERT INTO DesiSlits (dSlitId, DesId, slitRA, slitDec, slitTyp, '
+                 'slitLen, slitLPA, slitWid, slitWPA, slitName) VALUES %s',
+    'BluSlits': 'INSERT INTO BluSlits (bSlitId, BluId, dSlitId, slitX1, slitY1, slitX2, '
+                'slitY2, slitX3, slitY3, slitX4, slitY4) VALUES %s',
+    'Objects': 'INSERT INTO Objects (ObjectId, OBJECT, RA_OBJ, DEC_OBJ, RADECSYS, '
+               'EQUINOX, MJD_OBS, mag, pBand, RadVel, MajAxis, ObjClass, SkyPix) VALUES %s',
+    'SlitObjMap': 'INSERT INTO SlitObjMap (DesId, ObjectId, dSlitId, TopDist, BotDist) '
+                  'VALUES %s',
+    'Mask': 'INSERT INTO Mask (MaskId, BluId, GUIname, MillDate, MillId, MillSeq) '
+            'VALUES %s',
+}
+
+# the serial primary keys moved past the seeded ids
+SEQUENCES = [('Observers', 'ObId'), ('MaskDesign', 'DesId'), ('MaskBlu', 'BluId'),
+             ('DesiSlits', 'dSlitId'), ('BluSlits', 'bSlitId'), ('Objects', 'ObjectId')]
+
+
+class Seeder:
+    """
+    Generate the rows,  the ids are assigned here so the tables can be
+    loaded with multi-row inserts.
+    """
+    def __init__(self, num_designs, num_observers, seed=None):
+        self.num_designs = num_designs
+        self.num_legacy = int(num_observers * LEGACY_FRACTION)
+        self.observers = bench_utils.observers(num_observers, self.num_legacy)
+        self.rng = random.Random(seed)
+        self.now = datetime.now()
+        self.perpetual = datetime.strptime(PERPETUAL_DATE, '%Y-%m-%d')
+        self.archive_before = self.now - timedelta(days=30 * ARCHIVE_AFTER_MONTHS)
+        self.rows = {table: [] for table in INSERTS}
+        self.ids = {'bluid': 0, 'dslitid': 0, 'bslitid': 0, 'objectid': 0,
+                    'maskid': FIRST_BARCODE - 1}
+
+    def next_id(self, key):
+        self.ids[key] += 1
+        return self.ids[key]
+
+    def owner(self):
+        """
+        A few observers own most of the masks.
+        """
+        index = int(len(self.observers) * self.rng.random() ** 2)
+        return self.observers[index]
+
+    def generate(self):
+        for obs in self.observers[:self.num_legacy]:
+            self.rows['Observers'].append((
+                obs['obid'], obs['keckid'], obs['FirstName'], obs['LastName'],
+                obs['Email'], obs['Affiliation'], obs['privbits']
+            ))
+
+        for design_id in range(1, self.num_designs + 1):
+            self.design(design_id)
+
+        return self.rows
+
+    def design(self, design_id):
+        rng = self.rng
+        deimos = rng.random() < DEIMOS_FRACTION
+        owner = self.owner()
+        stamp = self.now - timedelta(days=rng.uniform(0, 365 * YEARS))
+
+        num_slits = rng.randint(*(DEIMOS_SLITS if deimos else LRIS_SLITS))
+        num_align = DEIMOS_ALIGN if deimos else LRIS_ALIGN
+        num_objects = num_slits + num_align + GUIDE_STARS if deimos else 0
+
+        ra_pnt = rng.uniform(0.0, 360.0)
+        dec_pnt = rng.uniform(-30.0, 70.0)
+        pa_pnt = rng.uniform(-90.0, 90.0)
+
+        self.rows['MaskDesign'].append((
+            design_id, f'design {design_id}', owner['obid'], 'seed_db', stamp,
+            num_slits + num_align, num_objects, 'benchmark',
+            'DEIMOS' if deimos else 'LRIS', 'bench', ra_pnt, dec_pnt, 'FK5', 2000.0,
+            pa_pnt, stamp, rng.uniform(0.0, 360.0), stamp, owner['Email'],
+            sky_pixel(ra_pnt, dec_pnt)
+        ))
+
+        slit_ids = []
+        for index in range(1, num_slits + num_align + 1):
+            align = index > num_slits
+            slit_id = self.next_id('dslitid')
+            slit_ids.append(slit_id)
+
+            slit_ra = ra_pnt + rng.uniform(-0.05, 0.05) if deimos else 0.0
+            slit_dec = dec_pnt + rng.uniform(-0.05, 0.05) if deimos else 0.0
+            slit_len = 4.0 if align else rng.uniform(6.0, 10.0)
+            self.rows['DesiSlits'].append((
+                slit_id, design_id, slit_ra, slit_dec, 'A' if align else 'P',
+                slit_len, pa_pnt, 4.0 if align else 1.0, pa_pnt + 90.0, str(index)
+            ))
+
+            # the LRIS designs have no objects
+            if not deimos:
+                continue
+
+            obj_class = 'Alignment_Star' if align else 'Program_Target'
+            self.objects(design_id, slit_id, obj_class, slit_ra, slit_dec)
+
+        for _ in range(num_objects - len(slit_ids)):
+            self.objects(design_id, None, 'Guide_Star', ra_pnt + rng.uniform(-0.1, 0.1),
+                         dec_pnt + rng.uniform(-0.1, 0.1))
+
+        num_blue = 2 if rng.random() < SECOND_BLUEPRINT_FRACTION else 1
+        for _ in range(num_blue):
+            self.blueprint(design_id, owner, stamp, slit_ids, deimos)
+
+    def objects(self, design_id, slit_id, obj_class, ra, dec):
+        object_id = self.next_id('objectid')
+        self.rows['Objects'].append((
+            object_id, f'{obj_class[0]}{object_id:07d}', ra, dec, 'FK5', 2000.0, 0.0,
+            self.rng.uniform(16.0, 24.0), 'R', 0.0, 0.0, obj_class, sky_pixel(ra, dec)
+        ))
+
+        if slit_id:
+            self.rows['SlitObjMap'].append((design_id, object_id, slit_id, 4.0, 4.0))
+
+    def blueprint(self, design_id, owner, stamp, slit_ids, deimos):
+        rng = self.rng
+        blue_id = self.next_id('bluid')
+
+        if rng.random() < PERPETUAL_FRACTION:
+            date_use = self.perpetual
+        else:
+            date_use = stamp + timedelta(days=rng.uniform(5, 60))
+
+        guiname = f'bn{blue_id:06d}'
+        millseq = string.ascii_uppercase[blue_id // 26 % 26] + \
+            string.ascii_uppercase[blue_id % 26]
+
+        milled = date_use < self.now + timedelta(days=3) and rng.random() < MILLED_FRACTION
+        if not milled:
+            status = UNMILLED
+        elif date_use < self.archive_before and rng.random() < ARCHIVED_FRACTION:
+            status = ARCHIVED
+        else:
+            status = READY
+
+        self.rows['MaskBlu'].append((
+            blue_id, design_id, f'blue {blue_id}', owner['obid'], 'seed_db', stamp,
+            0.0, date_use, 1 if deimos else 2, 0.0, 615.0, 0.4, 0.0065, 0.63, guiname,
+            millseq if milled else None, status, stamp, 'SLALIB', 'INTERNAL'
+        ))
+
+        pitch = 700.0 / len(slit_ids)
+        for index, slit_id in enumerate(slit_ids):
+            x_left = -350.0 + index * pitch
+            x_right = x_left + 0.8 * pitch
+            y_bottom = rng.uniform(-100.0, 90.0)
+            y_top = y_bottom + 6.0
+            self.rows['BluSlits'].append((
+                self.next_id('bslitid'), blue_id, slit_id, x_left, y_bottom, x_right,
+                y_bottom, x_right, y_top, x_left, y_top
+            ))
+
+        if milled:
+            mill_date = min(date_use, self.now) - timedelta(days=rng.uniform(1, 7))
+            self.rows['Mask'].append((
+                self.next_id('maskid'), blue_id, guiname, mill_date,
+                self.observers[0]['obid'], millseq
+            ))
+
+
+def apply_sql(curse, sql_file):
+    print(f'applying {path.relpath(sql_file, bench_utils.REPO_PATH)}')
+    with open(sql_file) as fp:
+        curse.execute(fp.read())
+
+
+def seed(conn, rows):
+    """
+    Create the schema and load the rows in one transaction.
+
+    :param conn: <connection> the stand-in database connection.
+    :param rows: <dict> the rows of each table,  from Seeder.generate.
+    """
+    with conn.cursor() as curse:
+        apply_sql(curse, bench_utils.SCHEMA_FILE)
+        for sql_file in sorted(glob.glob(path.join(bench_utils.MIGRATIONS_PATH, '*.sql'))):
+            apply_sql(curse, sql_file)
+
+        for table in TRIGGER_TABLES:
+            curse.execute(f'ALTER TABLE {table} DISABLE TRIGGER USER')
+
+        for table, query in INSERTS.items():
+            execute_values(curse, query, rows[table], page_size=1000)
+            print(f'{table:>12}: {len(rows[table])} rows')
+
+        for table, column in SEQUENCES:
+            # the column name of pg_get_serial_sequence is not folded to lower case
+            curse.execute(f"SELECT setval(pg_get_serial_sequence('{table}', '{column.lower()}'), "
+                          f"(SELECT COALESCE(max({column}), 0) + 1 FROM {table}), false)")
+
+        for table in TRIGGER_TABLES:
+            curse.execute(f'ALTER TABLE {table} ENABLE TRIGGER USER')
+
+    conn.commit()
+
+    # the planner statistics,  outside the transaction
+    conn.autocommit = True
+    with conn.cursor() as curse:
+        curse.execute('ANALYZE')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seed the benchmark database.')
+    parser.add_argument('--designs', type=int, default=2000, help='mask designs')
+    parser.add_argument('--observers', type=int, default=200, help='observers')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    bench_utils.add_db_args(parser)
+    args = parser.parse_args()
+
+    seed_rows = Seeder(args.designs, args.observers, seed=args.seed).generate()
+
+    db_conn = bench_utils.connect(args)
+    try:
+        seed(db_conn, seed_rows)
+    finally:
+        db_conn.close()
@@ -0,0 +1,107 @@
+"""
+The worker start up cost of the API:  the import time,  the resident memory
+and the modules loaded by `import slitmask_api`,  each run in a fresh
+interpreter as a new worker would.  The routes that load the heavy
+dependencies on first use (upload-mdf,  mask-plot) are measured with
+--lazy,  which imports their modules after the API.
+
+    python startup_bench.py --runs 10
+    python startup_bench.py --lazy ingest_fun,gnuplot5
+"""
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from os import path, makedirs
+from datetime import datetime
+
+import bench_utils
+
+# the dependencies the API workers should not load at start up
+HEAVY_MODULES = ('astropy', 'numpy', 'dateutil', 'ingest_fun', 'gnuplot5')
+
+WORKER = """
+import sys, json, time, resource
+sys.path[:0] = [{work_dir!r}, {api_path!r}]
+before = set(sys.modules)
+start = time.perf_counter()
+import slitmask_api
+imported = time.perf_counter() - start
+for name in {lazy!r}:
+    __import__(name)
+total = time.perf_counter() - start
+print(json.dumps({{
+    'import_s': imported,
+    'total_s': total,
+    'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(set(sys.modules) - before),
+    'loaded': sorted(name for name in {heavy!r} if name in sys.modules),
+}}))
+"""
+
+
+def run_worker(work_dir, lazy):
+    """
+    :return: <dict> the start up cost of one fresh interpreter.
+    """
+    code = WORKER.format(work_dir=work_dir, api_path=bench_utils.API_PATH,
+                         lazy=tuple(lazy), heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(f'the API import failed:\n{proc.stderr}')
+
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(args):
+    lazy = args.lazy.split(',') if args.lazy else []
+
+    with tempfile.TemporaryDirectory(prefix='slitmask_startup_') as work_dir:
+        # the API imports the database settings,  no connection is made
+        with open(path.join(work_dir, 'wspgcfg_live.py'), 'w') as fp:
+            fp.write("host = 'localhost'\nport = 5432\ndbname = 'none'\npwdict = {}\n")
+
+        runs = [run_worker(work_dir, lazy) for _ in range(args.runs)]
+
+    import_times = [entry['import_s'] for entry in runs]
+    total_times = [entry['total_s'] for entry in runs]
+    rss = [entry['maxrss_kb'] for entry in runs]
+
+    return {
+        'commit': bench_utils.git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'lazy': lazy,
+        'import_p50_ms': round(bench_utils.percentile(import_times, 50) * 1000, 1),
+        'import_max_ms': round(max(import_times) * 1000, 1),
+        'total_p50_ms': round(bench_utils.percentile(total_times, 50) * 1000, 1),
+        'maxrss_p50_mb': round(bench_utils.percentile(rss, 50) / 1024, 1),
+        'modules': runs[0]['modules'],
+        'heavy_loaded': runs[0]['loaded'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the API worker start up.')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters')
+    parser.add_argument('--lazy', help='comma separated modules to import after the API')
+    parser.add_argument('--output', help='the results JSON file')
+    args = parser.parse_args()
+
+    report = run(args)
+
+    print(f"import p50 {report['import_p50_ms']} ms (max {report['import_max_ms']} ms),  "
+          f"with lazy {report['total_p50_ms']} ms,  rss {report['maxrss_p50_mb']} MB,  "
+          f"{report['modules']} modules,  heavy loaded: {report['heavy_loaded'] or 'none'}")
+
+    output = args.output or path.join(
+        bench_utils.RESULTS_PATH,
+        f"startup-{report['commit'] or 'unknown'}-{datetime.now():%Y%m%d%H%M%S}.json"
+    )
+    makedirs(path.dirname(path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as fp:
+        json.dump(report, fp, indent=2)
+
+    print(f'results: {output}')
@@ -0,0 +1,256 @@
+"""
+Concurrent uploads and remills through the Flask test client,  from a pool
+of threads as a gthread worker serves them,  to check the request state is
+not shared between the requests:
+
+    uploads - each upload runs dbMaskOut for its own blueprint only once.
+    guinames - the uploads asking for the same GUIname (--guiname) are
+               given different names.
+    remills - each remill email goes to the admin,  the requester and the
+              owners of the remilled mask only.
+    connections - the database connections of the requests are closed.
+
+    python seed_db.py --designs 500
+    python stress_concurrency.py --threads 8 --uploads 40 --remills 80
+    python stress_concurrency.py --uploads 40 --remills 0 --guiname stress01
+
+Exits 1 if a check fails.
+"""
+import sys
+import json
+import random
+import argparse
+import tempfile
+import threading
+from os import path, listdir
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import bench_utils
+import stub_services
+import run_bench
+
+REMILL_SUBJECT = 'Mask set to be remilled, blue-id='
+
+
+def remill_calls(ctx, num_calls, blue_ids):
+    """
+    The remills by the admin,  of the seeded blueprints.
+    """
+    use_date = (date.today() + timedelta(days=60)).isoformat()
+    admin = ctx['observers'][0]
+    rng = random.Random(num_calls)
+
+    return [{'path': '/slitmask/remill-mask', 'headers': run_bench.cookie(admin['Id']),
+             'query_string': {'blue-id': rng.choice(blue_ids), 'use-date': use_date},
+             'requester': admin['Email']}
+            for _ in range(num_calls)]
+
+
+def blue_owners(args, ctx, blue_ids):
+    """
+    :return: <dict> the owner emails of each blueprint,  by blue id.
+    """
+    email_by_obid = {obs['obid']: obs['Email'] for obs in ctx['observers']}
+
+    conn = bench_utils.connect(args)
+    try:
+        with conn.cursor() as curse:
+            curse.execute('SELECT b.BluId, b.BluPId, d.DesPId FROM MaskBlu b '
+                          'JOIN MaskDesign d ON d.DesId = b.DesId '
+                          'WHERE b.BluId = ANY(%s)', (list(blue_ids), ))
+            return {row[0]: {email_by_obid.get(row[1]), email_by_obid.get(row[2])}
+                    for row in curse.fetchall()}
+    finally:
+        conn.close()
+
+
+def duplicate_guinames(args, blue_ids):
+    """
+    :return: <list> the GUInames of the blueprints also given to another
+             blueprint.
+    """
+    conn = bench_utils.connect(args)
+    try:
+        with conn.cursor() as curse:
+            curse.execute('SELECT b.GUIname FROM MaskBlu b WHERE b.BluId = ANY(%s) '
+                          'AND EXISTS (SELECT 1 FROM MaskBlu o WHERE o.GUIname = b.GUIname '
+                          'AND o.BluId <> b.BluId)', (list(blue_ids), ))
+            return sorted(row[0] for row in curse.fetchall())
+    finally:
+        conn.close()
+
+
+def connection_count(args):
+    conn = bench_utils.connect(args)
+    try:
+        with conn.cursor() as curse:
+            curse.execute('SELECT count(*) FROM pg_stat_activity WHERE datname = %s',
+                          (args.dbname, ))
+            return curse.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def sample_blue_ids(args, num_blue):
+    conn = bench_utils.connect(args)
+    try:
+        with conn.cursor() as curse:
+            curse.execute('SELECT BluId FROM MaskBlu ORDER BY random() LIMIT %s',
+                          (num_blue, ))
+            return [row[0] for row in curse.fetchall()]
+    finally:
+        conn.close()
+
+
+def run_calls(app, calls, num_threads):
+    """
+    Run the calls from a pool of threads,  a test client per thread.
+
+    :return: <list> the (call, status code, JSON response) in call order.
+    """
+    clients = threading.local()
+
+    def call(kwargs):
+        if not hasattr(clients, 'client'):
+            clients.client = app.test_client()
+
+        request_kwargs = {key: val for key, val in kwargs.items() if key != 'requester'}
+        response = clients.client.open(**request_kwargs)
+
+        return kwargs, response.status_code, response.get_json(silent=True)
+
+    with ThreadPoolExecutor(max_workers=num_threads) as pool:
+        return list(pool.map(call, calls))
+
+
+def logged_blue_ids(kroot):
+    """
+    :return: <list> the blueprint ids dbMaskOut ran for,  in call order.
+    """
+    calls_log = path.join(kroot, 'var/dbMaskOut/calls.log')
+    if not path.exists(calls_log):
+        return []
+
+    with open(calls_log) as fp:
+        return [line.strip() for line in fp if line.strip()]
+
+
+def check_uploads(results, kroot):
+    failures = []
+    num_ok = sum(1 for _, status, _ in results if status == 200)
+
+    blue_calls = logged_blue_ids(kroot)
+    repeated = len(blue_calls) - len(set(blue_calls))
+    if repeated:
+        failures.append(f'dbMaskOut ran {repeated} times for earlier uploads')
+    if len(blue_calls) != num_ok:
+        failures.append(f'{len(blue_calls)} dbMaskOut runs for {num_ok} uploads')
+
+    return num_ok, failures
+
+
+def check_remills(results, spool_dir, admin_email, owners):
+    failures = []
+    num_ok = sum(1 for _, status, _ in results if status == 200)
+    requesters = {call['requester'] for call, _, _ in results}
+
+    entries = []
+    for name in mail_entries(spool_dir):
+        with open(path.join(spool_dir, name)) as fp:
+            entries.append(json.load(fp))
+
+    remill_entries = [entry for entry in entries if entry['subject'].startswith(REMILL_SUBJECT)]
+    if len(remill_entries) != num_ok:
+        failures.append(f'{len(remill_entries)} remill emails for {num_ok} remills')
+
+    for entry in remill_entries:
+        blue_id = int(entry['subject'][len(REMILL_SUBJECT):])
+        allowed = {admin_email} | requesters | owners.get(blue_id, set())
+        extra = set(entry['to_list']) - allowed
+        if extra:
+            failures.append(f'remill blue-id={blue_id} emailed {sorted(extra)}')
+
+    return num_ok, failures
+
+
+def mail_entries(spool_dir):
+    return sorted(name for name in listdir(spool_dir) if name.endswith('.json'))
+
+
+def run(args):
+    ctx = run_bench.sample_context(args)
+    blue_ids = sample_blue_ids(args, args.blueprints)
+    owners = blue_owners(args, ctx, blue_ids)
+    failures = []
+
+    with tempfile.TemporaryDirectory(prefix='slitmask_stress_') as work_dir, \
+            stub_services.ObserverService(args.observers, ctx['num_legacy']) as obs_service:
+        app = run_bench.setup_api(args, work_dir, obs_service)
+
+        import mail_utils
+
+        # queue the emails to read back,  no sender is started
+        spool_dir = path.join(work_dir, 'spool')
+        mail_utils.outbox = mail_utils.MailOutbox(spool_dir, 'localhost')
+
+        baseline = connection_count(args)
+
+        uploads = run_bench.upload_calls(args.instrument, args.slits,
+                                         args.guiname)(ctx, args.uploads)
+        remills = remill_calls(ctx, args.remills, blue_ids)
+
+        # the uploads and remills interleaved in one pool
+        calls = uploads + remills
+        random.Random(0).shuffle(calls)
+        results = run_calls(app, calls, args.threads)
+
+        upload_results = [res for res in results if res[0]['path'] == '/slitmask/upload-mdf']
+        remill_results = [res for res in results if res[0]['path'] == '/slitmask/remill-mask']
+
+        num_uploads, upload_failures = check_uploads(upload_results, app.config['KROOT'])
+        num_remills, remill_failures = check_remills(
+            remill_results, spool_dir, app.config['EMAIL_INFO']['admin'], owners
+        )
+        failures += upload_failures + remill_failures
+
+        uploaded = [int(blue_id) for blue_id in logged_blue_ids(app.config['KROOT'])]
+        duplicates = duplicate_guinames(args, uploaded) if uploaded else []
+        if duplicates:
+            failures.append(f'uploads given GUInames in use: {duplicates}')
+
+        leaked = connection_count(args) - baseline
+        if leaked > 0:
+            failures.append(f'{leaked} database connections left open')
+
+    print(f'uploads {num_uploads}/{len(upload_results)} ok,  '
+          f'remills {num_remills}/{len(remill_results)} ok,  threads {args.threads}')
+
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent uploads and remills.')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--uploads', type=int, default=40)
+    parser.add_argument('--remills', type=int, default=80)
+    parser.add_argument('--blueprints', type=int, default=20,
+                        help='the seeded blueprints remilled')
+    parser.add_argument('--instrument', default='DEIMOS', choices=['DEIMOS', 'LRIS'])
+    parser.add_argument('--slits', type=int, default=40)
+    parser.add_argument('--guiname', help='the GUIname asked for by all the uploads')
+    parser.add_argument('--observers', type=int, default=200,
+                        help='the observers seeded by seed_db.py')
+    parser.add_argument('--budget', default='off', choices=['off', 'warn', 'enforce'],
+                        help='the query budget mode')
+    parser.add_argument('--verbose', action='store_true', help='log the API requests')
+    bench_utils.add_db_args(parser)
+    args = parser.parse_args()
+
+    bench_utils.use_api_modules()
+    failures = run(args)
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+
+    sys.exit(1 if failures else 0)
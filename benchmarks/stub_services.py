@@ -0,0 +1,160 @@
+"""
+Stand-ins for the services the API calls,  for the benchmarks:
+
+    ObserverService - the Keck cookie and observer info HTTP endpoints,
+                      serving the synthetic observers of bench_utils.
+    tool_tree       - the dbMaskOut (Tcl) and fits2ncc (C) programs under a
+                      temporary KROOT,  writing the files the API reads back.
+                      dbMaskOut appends each blueprint id to
+                      var/dbMaskOut/calls.log.
+
+The tool stubs sleep BENCH_TOOL_SECONDS (environment,  default 0) to stand
+in for the tool run time.
+"""
+import os
+import json
+import stat
+import sys
+import threading
+
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import bench_utils
+
+COOKIE_PATH = '/cookie'
+OBSERVER_PATH = '/observers'
+
+DBMASKOUT_DIR = 'rel/bench/xfer2keck'
+NCMILL_DIR = 'rel/bench/ncmill'
+
+DBMASKOUT_STUB = """#!{python}
+import sys, time, os
+time.sleep(float(os.environ.get('BENCH_TOOL_SECONDS', 0)))
+blue_id = sys.argv[1]
+out_dir = '{kroot}/var/dbMaskOut'
+with open(f'{{out_dir}}/calls.log', 'a') as fp:
+    fp.write(blue_id + '\\n')
+with open(f'{{out_dir}}/Mask.{{blue_id}}.fits', 'w') as fp:
+    fp.write('SIMPLE  =                    T / dbMaskOut stub')
+with open(f'{{out_dir}}/Mask.{{blue_id}}.ali', 'w') as fp:
+    fp.write('# alignment boxes of blueprint ' + blue_id)
+print('dbMaskOut stub', blue_id)
+"""
+
+FITS2NCC_STUB = """#!{python}
+import sys, time, os
+time.sleep(float(os.environ.get('BENCH_TOOL_SECONDS', 0)))
+name = os.path.basename(sys.argv[2]).rsplit('.', 1)[0]
+gcode = '{kroot}/var/ncmill/' + name + '.nc'
+f2n = '{kroot}/var/ncmill/' + name + '.f2n'
+with open(gcode, 'w') as fp:
+    fp.write('%\\nG90\\nM30\\n%\\n')
+with open(f2n, 'w') as fp:
+    fp.write('[]\\n')
+print('gcodepath=' + gcode)
+print('f2nlogpath=' + f2n)
+"""
+
+
+class ObserverHandler(BaseHTTPRequestHandler):
+    """
+    GET /cookie     the observer of the bench_keck_id cookie,  {} if none.
+    GET /observers  all the observers,  or by ?obsid= or ?email=.
+    """
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        service = self.server.service
+
+        if url.path == COOKIE_PATH:
+            cookie = SimpleCookie(self.headers.get('Cookie', ''))
+            morsel = cookie.get(bench_utils.BENCH_COOKIE)
+            obs = service.by_keck_id.get(morsel.value) if morsel else None
+            result = obs or {}
+        elif url.path == OBSERVER_PATH:
+            if 'obsid' in params:
+                obs = service.by_keck_id.get(params['obsid'][0])
+                result = [obs] if obs else []
+            elif 'email' in params:
+                obs = service.by_email.get(params['email'][0].lower())
+                result = [obs] if obs else []
+            else:
+                result = service.observers
+        else:
+            self.send_error(404)
+            return
+
+        body = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class ObserverService:
+    """
+    The observer HTTP endpoints on a local port,  in a daemon thread.
+    """
+    def __init__(self, num_observers, num_legacy, port=0):
+        self.observers = []
+        for obs in bench_utils.observers(num_observers, num_legacy):
+            # the keck observer table has no slitmask obid or privileges
+            self.observers.append({key: val for key, val in obs.items()
+                                   if key not in ('obid', 'privbits')})
+
+        self.by_keck_id = {str(obs['Id']): obs for obs in self.observers}
+        self.by_email = {obs['Email'].lower(): obs for obs in self.observers}
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), ObserverHandler)
+        self.server.service = self
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name='bench-observer-service', daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url(self, route):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}{route}'
+
+    def obs_info(self):
+        """
+        :return: <dict> the OBS_INFO of the API.
+        """
+        return {'info_url': self.url(OBSERVER_PATH), 'cookie_url': self.url(COOKIE_PATH)}
+
+
+def write_tool(tool_path, template, kroot):
+    with open(tool_path, 'w') as fp:
+        fp.write(template.format(python=sys.executable, kroot=kroot))
+
+    mode = os.stat(tool_path).st_mode
+    os.chmod(tool_path, mode | stat.S_IXUSR | stat.S_IXGRP)
+
+
+def tool_tree(kroot):
+    """
+    Create the stub tools and their output and log directories under kroot.
+
+    :param kroot: <str> the temporary KROOT.
+
+    :return: <str, str> the DBMASKOUT_DIR and NCMILL_DIR,  relative to kroot.
+    """
+    for sub_dir in (DBMASKOUT_DIR, NCMILL_DIR, 'var/dbMaskOut/log', 'var/ncmill/log'):
+        os.makedirs(os.path.join(kroot, sub_dir), exist_ok=True)
+
+    write_tool(os.path.join(kroot, DBMASKOUT_DIR, 'dbMaskOut'), DBMASKOUT_STUB, kroot)
+    write_tool(os.path.join(kroot, NCMILL_DIR, 'fits2ncc'), FITS2NCC_STUB, kroot)
+
+    return DBMASKOUT_DIR, NCMILL_DIR